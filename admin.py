@@ -1,7 +1,13 @@
 import streamlit as st
 import pandas as pd
-from supabase import create_client, Client
 import time
+import os
+import hmac
+from repository import get_repository
+from export import TABLES, DEFAULT_DIR, HAS_PYARROW, ExportJob, load_state
+from domain import MEMBER_ACTIONS, MEMBER_DATES, LOM_LIST, build_member_grid, checked_from_grid, member_points
+from metrics import metrics_gate, track_run
+from profiling import profile_run
 
 # ==========================================
 #  1. 設定＆デザイン
@@ -19,120 +25,116 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ==========================================
-#  2. データ定義 (ユニバーサルデコ活)
+#  2. データ定義 (ユニバーサルデコ活) → domain.py
 # ==========================================
-ACTION_MASTER = {
-    "てまえどり": {"point": 40, "label": "🏪 てまえどり (40g)", "desc": "商品棚の手前（期限が近いもの）から取る"},
-    "リフューズ": {"point": 30, "label": "🥡 カトラリー辞退 (30g)", "desc": "「お箸・スプーン・袋はいいです」と断る"},
-    "待機電力": {"point": 20, "label": "🔌 待機電力カット (20g)", "desc": "使わない家電のスイッチ・コンセントOFF"},
-    "節水": {"point": 60, "label": "🚿 シャワー短縮 (60g)", "desc": "1分短縮、または出しっぱなしにしない"},
-    "完食": {"point": 50, "label": "🍽️ 完食・ロスゼロ (50g)", "desc": "外食・弁当含め、食品ロスを出さない"},
-    "発信": {"point": 100, "label": "📱 エコの発信 (100g)", "desc": "SNS投稿、職場・LOMでの会話"},
-    "スマートムーブ": {"point": 80, "label": "🚶 スマートムーブ (80g)", "desc": "徒歩・自転車・階段利用、ふんわりアクセル"}
-}
-
-# 岡山ブロック内15LOMリスト
-LOM_LIST = [
-    "岡山", "倉敷", "津山", "玉野", "児島", "笠岡", "美作", 
-    "新見", "備前", "高梁", "総社", "井原", "真庭", "勝央", "瀬戸内"
-]
-
-TARGET_DATES = ["6/1(月)", "6/2(火)", "6/3(水)", "6/4(木)", "6/5(金)"]
+ACTION_MASTER = MEMBER_ACTIONS
+TARGET_DATES = MEMBER_DATES
 
 # ==========================================
-#  3. Supabase接続
-# ==========================================
-@st.cache_resource
-def init_connection():
-    try:
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
-    except:
-        st.error("Supabase接続エラー: secretsを設定してください")
-        return None
-
-supabase = init_connection()
-
-# ==========================================
-#  4. データ操作関数
+#  3. データ操作（repository.py 経由）
 # ==========================================
+repo = get_repository()
 
 def fetch_member_logs(user_name, lom_name):
     """ログインユーザーの過去の記録を取得"""
-    if not supabase: return pd.DataFrame()
-    try:
-        response = supabase.table("logs_member")\
-            .select("*")\
-            .eq("user_name", user_name)\
-            .eq("lom_name", lom_name)\
-            .execute()
-        return pd.DataFrame(response.data)
-    except:
-        return pd.DataFrame()
+    return pd.DataFrame(repo.members.fetch_logs(user_name, lom_name))
 
 def fetch_lom_ranking():
-    """LOMごとの合計ポイントを集計"""
-    if not supabase: return pd.DataFrame()
+    """LOMごとの合計ポイント（1分キャッシュ・保存時に破棄。読めなければ空）"""
     try:
-        # 全データ取得（本来はRPC推奨ですが簡易的に）
-        response = supabase.table("logs_member").select("lom_name, points").execute()
-        df = pd.DataFrame(response.data)
-        if df.empty: return pd.DataFrame()
-        
-        # LOMごとに集計
-        ranking = df.groupby("lom_name")["points"].sum().reset_index()
-        ranking = ranking.sort_values("points", ascending=False).reset_index(drop=True)
-        return ranking
-    except:
-        return pd.DataFrame()
+        rows = repo.members.lom_ranking()
+    except Exception as e:
+        st.error(f"ランキングの取得エラー: {e}")
+        rows = []
+    return pd.DataFrame(rows, columns=["lom_name", "points"])
 
-def save_logs(user_name, lom_name, edited_df):
-    """チェック表の内容を保存"""
-    if not supabase: return
-    
-    insert_list = []
-    
-    # マスタの逆引き辞書（表示ラベル -> キー）
-    label_to_key = {v["label"]: k for k, v in ACTION_MASTER.items()}
-    
-    for idx, row in edited_df.iterrows():
-        display_label = row["アクション項目"]
-        action_key = label_to_key[display_label]
-        point = ACTION_MASTER[action_key]["point"]
-        
-        for date_col in TARGET_DATES:
-            is_checked = row[date_col]
-            if is_checked:
-                insert_list.append({
-                    "user_name": user_name,
-                    "lom_name": lom_name,
-                    "target_date": date_col,
-                    "action_label": action_key,
-                    "is_done": True,
-                    "points": point
-                })
+def fetch_trend(by="date"):
+    """CO2削減量の推移（集計テーブルを読むだけ。読めなければ空）"""
+    try:
+        rows = repo.rollups.trend(by)
+    except Exception as e:
+        st.error(f"集計の取得エラー: {e}")
+        rows = []
+    return pd.DataFrame(rows, columns=["key", "student", "member", "total", "cumulative"])
+
+def save_logs(user_name, lom_name, edited_df, logs_df):
+    """チェック表の内容を保存（変わったセルだけを1回の呼び出しで反映）"""
+    if not repo.connected: return
     
-    # 既存データを削除して入れ直す（簡易的な更新処理）
-    # ※本番ではUpsertやDelete Insertを厳密に行うのがベター
+    # 画面でチェックされている (日付, アクション)
+    checked = checked_from_grid(edited_df.to_dict("records"), ACTION_MASTER, TARGET_DATES)
+    existing_rows = logs_df.to_dict("records") if not logs_df.empty else []
+    points = member_points(ACTION_MASTER)
     try:
-        # まずこのユーザーの期間中のデータを消す（重複防止）
-        supabase.table("logs_member")\
-            .delete()\
-            .eq("user_name", user_name)\
-            .eq("lom_name", lom_name)\
-            .in_("target_date", TARGET_DATES)\
-            .execute()
-            
-        # 新しいデータをInsert
-        if insert_list:
-            supabase.table("logs_member").insert(insert_list).execute()
-            
-        return True
+        return repo.members.sync_checks(user_name, lom_name, existing_rows, checked, points, TARGET_DATES)
     except Exception as e:
         st.error(f"保存エラー: {e}")
         return False
 
+# ==========================================
+#  4. 主催者向け：データの書き出し（export.py）
+# ==========================================
+
+def export_gate():
+    """?export=<secrets の export.token> で書き出しページを開く（未設定なら無効）"""
+    given = st.query_params.get("export")
+    if not given: return
+    try:
+        conf = dict(st.secrets.get("export", {}))
+    except Exception:
+        conf = {}
+    token = str(conf.get("token") or "")
+    if not token or not hmac.compare_digest(str(given), token): return
+    show_export_page(conf.get("dir") or DEFAULT_DIR)
+    st.stop()
+
+@st.cache_resource
+def get_export_job(out_dir):
+    """書き出しのワーカー（1プロセスに1つ。ページを閉じても書き出しは続く）"""
+    return ExportJob(repo.client, out_dir)
+
+def show_export_page(out_dir):
+    st.title("📦 データの書き出し")
+    st.caption(f"書き出し先: {out_dir}（途中で止まっても、もう一度押すと続きから）")
+    st.caption("大きな表はサーバーで `python export.py` を使うほうが速い")
+    job = get_export_job(out_dir)
+    formats = ["csv", "parquet"] if HAS_PYARROW else ["csv"]
+    fmt = st.radio("形式", formats, horizontal=True)
+    tables = st.multiselect("表", TABLES, default=list(TABLES))
+    fresh = st.checkbox("最初から書き出す", value=False,
+                        help="外すと、前回の続きに増えた行だけを足す（書き換わった行は反映されない）")
+
+    status = job.status()
+    if st.button("書き出す", type="primary", disabled=status["running"]) and tables and repo.connected:
+        job.start(tables, fmt=fmt, fresh=fresh)
+        status = job.status()
+
+    for table, (rows, total) in status["progress"].items():
+        ratio = min(rows / total, 1.0) if total else 0.0
+        st.progress(ratio, text=f"{table}: {rows:,}" + (f" / {total:,} 行" if total else " 行"))
+    if status["error"]:
+        st.error(f"書き出しエラー（もう一度押すと続きから）: {status['error']}")
+    elif status["finished"]:
+        st.success("書き出しました")
+    if status["running"]:
+        # 書き出しはワーカースレッドで進むので、画面は少し待って進み具合を読み直すだけ
+        time.sleep(2)
+        st.rerun()
+
+    # ダウンロードは選んだ1ファイルだけ（全部のボタンを出すと再描画のたびに全ファイルを読む）
+    state = load_state(out_dir, fmt)
+    files = []
+    for table, entry in state["tables"].items():
+        mark = "✅" if entry.get("done") else "⏸"
+        st.markdown(f"{mark} **{table}** {entry.get('rows', 0):,} 行")
+        if entry.get("done"):
+            files += [p for p in entry.get("files", []) if os.path.exists(p)]
+    if files:
+        path = st.selectbox("ダウンロードするファイル", files, format_func=os.path.basename)
+        if st.button("ダウンロードを準備"):
+            with open(path, "rb") as f:
+                st.download_button(os.path.basename(path), f, file_name=os.path.basename(path))
+
 # ==========================================
 #  5. メイン画面
 # ==========================================
@@ -174,29 +176,9 @@ def main():
     # --- 入力フォーム (Pattern A: Excel風) ---
     st.subheader("📝 実践チェック")
     
-    # データフレームの準備
-    display_items = [v["label"] for v in ACTION_MASTER.values()]
-    df_data = {"アクション項目": display_items}
-    
-    # 過去のチェック状態を復元
-    for date in TARGET_DATES:
-        checks = []
-        for item in display_items:
-            # ログの中に、この日付・このアクションがあるか探す
-            # ※本来はもっと効率的なPandas操作推奨ですが、わかりやすさ優先
-            label_to_key = {v["label"]: k for k, v in ACTION_MASTER.items()}
-            key = label_to_key[item]
-            
-            is_done = False
-            if not logs_df.empty:
-                match = logs_df[
-                    (logs_df['target_date'] == date) & 
-                    (logs_df['action_label'] == key)
-                ]
-                if not match.empty:
-                    is_done = True
-            checks.append(is_done)
-        df_data[date] = checks
+    # データフレームの準備（過去のチェック状態を復元）
+    logs = logs_df.to_dict("records") if not logs_df.empty else []
+    df_data = build_member_grid(logs, ACTION_MASTER, TARGET_DATES)
 
     df = pd.DataFrame(df_data)
 
@@ -218,7 +200,7 @@ def main():
     # 保存ボタン
     if st.button("記録を保存する", type="primary"):
         with st.spinner("保存中..."):
-            if save_logs(user['name'], user['lom'], edited_df):
+            if save_logs(user['name'], user['lom'], edited_df, logs_df):
                 st.success("保存しました！")
                 st.balloons()
                 time.sleep(1)
@@ -253,9 +235,26 @@ def main():
     else:
         st.caption("まだデータがありません")
 
+    # --- CO2削減の推移 ---
+    st.subheader("📈 CO2削減の推移")
+    df_day = fetch_trend("date")
+    if not df_day.empty:
+        st.line_chart(df_day.set_index("key")[["student", "member"]].rename(columns={"student": "小学生", "member": "JCメンバー"}))
+        df_hour = fetch_trend("hour").tail(48)
+        st.caption("直近48時間（1時間ごと）")
+        st.bar_chart(df_hour.set_index("key")["total"])
+    else:
+        st.caption("まだデータがありません")
+
     if st.button("ログアウト", key="logout_btn"):
         st.session_state.jc_user = None
         st.rerun()
 
 if __name__ == "__main__":
-    main()
+    # ?metrics=<secrets の metrics.token> で計測結果の隠しページ
+    # ?profile=<secrets の profiling.token> でこのセッションをプロファイル（profiling.py）
+    # ?export=<secrets の export.token> で主催者向けの書き出し（export.py）
+    metrics_gate()
+    export_gate()
+    with track_run("admin"), profile_run("admin"):
+        main()
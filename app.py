@@ -2,11 +2,12 @@ import streamlit as st
 import pandas as pd
 import datetime
 import time
-import os
-import base64
-import random
-from supabase import create_client, Client
 import extra_streamlit_components as stx
+from repository import get_repository, build_student_row
+from domain import MEMBER_ACTIONS, MEMBER_DATES, LOM_LIST, build_member_grid, checked_from_grid, member_points, build_student_grid, is_hero_row
+from sorting_game import new_game, sorting_game, score_result
+from metrics import metrics_gate, track_run
+from profiling import profile_run
 
 # ==========================================
 #  0. 全体設定
@@ -18,18 +19,8 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# --- Supabase接続 ---
-@st.cache_resource
-def init_connection():
-    try:
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
-    except Exception as e:
-        st.error(f"Supabase接続エラー: secretsを確認してください。 {e}")
-        return None
-
-supabase = init_connection()
+# --- データ操作（repository.py 経由） ---
+repo = get_repository()
 
 # --- Cookieマネージャー ---
 def get_manager():
@@ -71,51 +62,71 @@ def show_global_stage_visual(total_g):
     """, unsafe_allow_html=True)
     st.progress(progress)
 
-@st.cache_data(ttl=600)
+def fetch_game_ranking(n=10):
+    """分別ゲーム 最速ランキング（メモリから読むだけ）"""
+    return pd.DataFrame(repo.games.rankings("all", n=n))
+
 def fetch_dashboard_stats():
-    if not supabase: return 0, 0, 0, pd.DataFrame()
-
-    # エコヒーロー数
-    res_hero = supabase.table("logs_student").select("user_id, actions_str").execute()
-    df_hero = pd.DataFrame(res_hero.data)
-    hero_count = 0
-    student_count = 0
-    if not df_hero.empty:
-        hero_count = df_hero[df_hero['actions_str'].astype(str).str.contains("環境の日アンケート", na=False)]['user_id'].nunique()
-        student_count = df_hero['user_id'].nunique()
-
-    # 参加者総数
-    res_mem = supabase.table("logs_member").select("user_name").execute()
-    df_mem = pd.DataFrame(res_mem.data)
-    member_count = df_mem['user_name'].nunique() if not df_mem.empty else 0
-    total_participants = student_count + member_count
-
-    # CO2削減総量
-    res_stu_pt = supabase.table("logs_student").select("action_points").execute()
-    df_stu_pt = pd.DataFrame(res_stu_pt.data)
-    stu_total = df_stu_pt['action_points'].sum() if not df_stu_pt.empty else 0
-    
-    res_mem_pt = supabase.table("logs_member").select("points").execute()
-    df_mem_pt = pd.DataFrame(res_mem_pt.data)
-    mem_total = df_mem_pt['points'].sum() if not df_mem_pt.empty else 0
-    
-    total_co2 = stu_total + mem_total
+    """ダッシュボード統計と集計からの経過秒数（集計は裏で定期的に行うので待たない）"""
+    return repo.students.dashboard_stats()
 
-    # ゲームランキング
-    res_game = supabase.table("game_scores").select("*").order("time", desc=False).limit(10).execute()
-    df_ranking = pd.DataFrame(res_game.data)
+def fetch_breakdown(kind, n=None):
+    """アクション別・学校別などの内訳（集計テーブルを読むだけ。読めなければ空）"""
+    try:
+        rows = repo.rollups.breakdown(kind, n=n)
+    except Exception as e:
+        st.error(f"集計の取得エラー: {e}")
+        rows = []
+    return pd.DataFrame(rows, columns=["key", "rows", "points"])
 
-    return hero_count, total_participants, total_co2, df_ranking
+def fetch_trend(by="date"):
+    """CO2削減量の推移（集計テーブルを読むだけ。読めなければ空）"""
+    try:
+        rows = repo.rollups.trend(by)
+    except Exception as e:
+        st.error(f"集計の取得エラー: {e}")
+        rows = []
+    return pd.DataFrame(rows, columns=["key", "student", "member", "total", "cumulative"])
+
+def show_trend_chart():
+    df_day = fetch_trend("date")
+    if df_day.empty: return
+    tab_day, tab_hour = st.tabs(["📈 日ごとの累計", "⏰ 1時間ごと"])
+    with tab_day:
+        st.line_chart(df_day.set_index("key")["cumulative"])
+    with tab_hour:
+        # 直近48時間ぶん
+        df_hour = fetch_trend("hour").tail(48)
+        st.bar_chart(df_hour.set_index("key")[["student", "member"]].rename(columns={"student": "小学生", "member": "JCメンバー"}))
+
+def format_age(age):
+    if age is None: return "集計中"
+    if age < 60: return "たった今の集計"
+    return f"{int(age // 60)}分前の集計"
 
 def show_global_dashboard():
-    hero_cnt, part_cnt, co2_total, df_rank = fetch_dashboard_stats()
+    (hero_cnt, part_cnt, co2_total), stats_age = fetch_dashboard_stats()
+    df_rank = fetch_game_ranking(10)
     show_global_stage_visual(co2_total)
+    show_trend_chart()
 
     st.markdown("### 📊 詳細データ")
     c1, c2, c3 = st.columns(3)
     c1.metric("👑 エコヒーロー", f"{hero_cnt:,} 人")
     c2.metric("🤝 全参加者数", f"{part_cnt:,} 人")
     c3.metric("📉 CO2削減総量", f"{co2_total:,} g")
+    st.caption(f"🕒 {format_age(stats_age)}")
+
+    with st.expander("🏅 どのアクション・どの学校ががんばった？", expanded=False):
+        df_act = pd.concat([fetch_breakdown("action"), fetch_breakdown("member_action")], ignore_index=True)
+        df_school = fetch_breakdown("school", n=10)
+        if df_act.empty and df_school.empty:
+            st.info("データがありません")
+        else:
+            st.markdown("**アクション別 CO2削減量 (g)**")
+            st.bar_chart(df_act.set_index("key")["points"])
+            st.markdown("**学校別 CO2削減量 (g) Top 10**")
+            st.bar_chart(df_school.set_index("key")["points"])
 
     # ★ 修正：ランキングに組・番号を表示
     with st.expander("⏱️ 分別ゲーム 最速ランキング (Top 10)", expanded=True):
@@ -141,6 +152,20 @@ def show_global_dashboard():
 #  2. 小学生用アプリ ロジック (名前なし・PINあり)
 # ==========================================
 
+def fetch_student_data(user_id):
+    """ログイン用のプロフィール（あいことば・合計・ヒーロー）を1行だけ読む。取得に失敗したら None"""
+    return repo.students.profile(user_id)
+
+def fetch_student_history(user):
+    """チェック表の履歴（出すときに1回だけ読んでセッションに置く）。読めなければ None"""
+    if user.get('history') is None:
+        history = repo.students.history(user['id'])
+        if history is None:
+            st.error("データ取得エラー: 時間をおいて もういちど ためしてね")
+            return None
+        user['history'] = history
+    return user['history']
+
 def student_app_main():
     st.markdown("""
     <style>
@@ -176,42 +201,21 @@ def student_app_main():
         """, unsafe_allow_html=True)
         st.progress(progress)
 
-    def fetch_student_data(user_id):
-        if not supabase: return user_id, "", 0, {}
+    # 一括保存: 変更のあった日をまとめて1回で送り、保存後の行を返す（失敗は None）
+    # rows はその日の合計ポイント、diffs は前回からの差分（sql/006 がなければ差分方式。repository.py）
+    # 初めての保存なら新規参加者、アンケートが初めて入ればヒーロー（全体統計に足す）
+    def save_student_logs(rows, diffs, is_new_participant=False, became_hero=False):
         try:
-            res = supabase.table("logs_student").select("*").eq("user_id", user_id).execute()
-            if not res.data: return user_id, "", 0, {}
-            df = pd.DataFrame(res.data)
-            
-            last_row = df.iloc[-1]
-            total = df['action_points'].sum()
-            pin_code = last_row['pin_code'] if 'pin_code' in df.columns else ""
-            
-            history = {}
-            for _, row in df.iterrows():
-                if row['target_date']: history[row['target_date']] = str(row['actions_str']).split(", ")
-            return user_id, pin_code, int(total), history
-        except: return user_id, "", 0, {}
-
-    # Upsert (名前削除版)
-    def save_student_log(user_id, pin_code, target_date, actions, points, memo, q1="", q2="", q3=""):
-        if not supabase: return False
-        try:
-            school_name = user_id.split("_")[0]
-            data = {
-                "user_id": user_id,
-                "nickname": "エコヒーロー", # 名前列には固定値
-                "pin_code": pin_code,
-                "school_name": school_name,
-                "target_date": target_date, "actions_str": ", ".join(actions),
-                "action_points": points,
-                "memo": memo, "q1": q1, "q2": q2, "q3": q3
-            }
-            supabase.table("logs_student").upsert(data, on_conflict="user_id, target_date").execute()
-            return True
+            return repo.students.save_days(rows, diffs, is_new_participant=is_new_participant, became_hero=became_hero)
         except Exception as e:
             st.error(f"保存エラー: {e}")
-            return False
+            return None
+
+    # 1日分の保存 (名前削除版：名前列には固定値)
+    def save_student_log(user_id, pin_code, target_date, actions, points, memo, q1="", q2="", q3="", diff_points=None, is_new_participant=False, became_hero=False):
+        row = build_student_row(user_id, target_date, actions, points, memo, nickname="エコヒーロー", pin_code=pin_code, q1=q1, q2=q2, q3=q3)
+        diff = points if diff_points is None else diff_points
+        return save_student_logs([row], [diff], is_new_participant=is_new_participant, became_hero=became_hero) is not None
 
     def show_game():
         st.markdown("### ⏱️ 激闘！分別マスター")
@@ -222,47 +226,37 @@ def student_app_main():
             {"name": "📰 新聞紙", "type": 1}, {"name": "🍵 割れた茶碗", "type": 2},
             {"name": "🤧 ティッシュ", "type": 0}, {"name": "🥫 空き缶", "type": 1}
         ]
-        cats = {0: "🔥 燃える", 1: "♻️ 資 源", 2: "🧱 埋 立"}
+        cats = {0: {"name": "🔥 燃える"}, 1: {"name": "♻️ 資 源"}, 2: {"name": "🧱 埋 立"}}
+        if 'game' not in st.session_state: st.session_state.game = new_game(garbage_data, 5)
 
+        # 1問ごとの rerun はせず、ゲームはブラウザ内で進めて結果だけ受け取る
         if st.session_state.game_state == 'READY':
-            if st.button("🏁 ゲームスタート！"):
-                st.session_state.game_qs = random.sample(garbage_data, 5)
-                st.session_state.g_idx = 0
-                st.session_state.g_start = time.time()
-                st.session_state.game_state = 'PLAYING'
-                st.rerun()
-        elif st.session_state.game_state == 'PLAYING':
-            q_idx = st.session_state.g_idx
-            if q_idx >= len(st.session_state.game_qs):
-                final_time = round(time.time() - st.session_state.g_start, 2)
-                u = st.session_state.student_user
-                try:
-                    # ★ 修正：ランキング用の名前列に「学年・組・番号」を保存
-                    supabase.table("game_scores").insert({
-                        "name": u['grade_class'], # 例: 1年 A組 10番
-                        "school": u['school'], 
-                        "time": final_time, "date": datetime.date.today().isoformat()
-                    }).execute()
-                except: pass
-                st.session_state.last_time = final_time
-                st.session_state.game_state = 'FINISHED'
-                st.rerun()
-
-            item = st.session_state.game_qs[q_idx]
-            st.info(f"第{q_idx+1}問: {item['name']}")
-            c1, c2, c3 = st.columns(3)
-            def ans(c):
-                st.session_state.g_idx += 1
-            with c1: 
-                if st.button(cats[0], key=f"g{q_idx}0"): ans(0); st.rerun()
-            with c2: 
-                if st.button(cats[1], key=f"g{q_idx}1"): ans(1); st.rerun()
-            with c3: 
-                if st.button(cats[2], key=f"g{q_idx}2"): ans(2); st.rerun()
+            game = st.session_state.game
+            result = sorting_game(game, cats, penalty_sec=0)
+            if result is not None:
+                score = score_result(result, game, cats, penalty_sec=0)
+                st.session_state.game = new_game(garbage_data, 5)
+                if score is None:
+                    st.warning("記録を確認できませんでした。もう一回遊んでね！")
+                    if st.button("もう一回"): st.rerun()
+                else:
+                    final_time = score["time"]
+                    u = st.session_state.student_user
+                    # ★ 修正：ランキング用の名前列に「学年・組・番号」を保存（例: 1年 A組 10番）
+                    try:
+                        repo.games.save_score(u['grade_class'], u['school'], final_time)
+                        st.session_state.game_save_error = None
+                    except Exception as e:
+                        st.session_state.game_save_error = str(e)
+                    st.session_state.last_time = final_time
+                    st.session_state.game_state = 'FINISHED'
+                    st.rerun()
 
         elif st.session_state.game_state == 'FINISHED':
             st.balloons()
             st.success(f"クリア！ タイム: {st.session_state.last_time}秒")
+            if st.session_state.get('game_save_error'):
+                st.error(f"記録の保存エラー: {st.session_state.game_save_error}")
             if st.button("もう一回"):
                 st.session_state.game_state = 'READY'
                 st.rerun()
@@ -285,10 +279,13 @@ def student_app_main():
             if st.form_submit_button("スタート！"):
                 if school and u_class and pin:
                     uid = f"{school}小学校_{grade}_{u_class}_{num}"
-                    _, saved_pin, total, hist = fetch_student_data(uid)
-                    
+                    profile = fetch_student_data(uid)
+                    saved_pin = profile.pin_code if profile else None
+
                     can_login = False
-                    if saved_pin:
+                    if profile is None:
+                        st.error("データ取得エラー: 時間をおいて もういちど ためしてね")
+                    elif saved_pin:
                         if saved_pin == pin: can_login = True
                         else: st.error("🙅‍♂️ あいことば が違います！")
                     else:
@@ -306,7 +303,7 @@ def student_app_main():
                             "id": uid, 
                             "school": f"{school}小学校", 
                             "grade_class": f"{grade} {u_class}組 {num}番", 
-                            "total": total, "history": hist, "pin": saved_pin
+                            "total": profile.total, "history": profile.history, "hero": profile.is_hero, "pin": saved_pin
                         }
                         st.rerun()
                 else:
@@ -319,8 +316,7 @@ def student_app_main():
         user = st.session_state.student_user
         st.markdown(f"### 👋 こんにちは、{user['grade_class']} のお友達！")
         
-        is_hero = any("環境の日アンケート" in acts for acts in user['history'].values())
-        if is_hero:
+        if user['hero']:
             st.markdown(f"""<div class="hero-card"><div class="hero-name">🏆 認定エコヒーロー</div><br>認定エコヒーロー 殿<br><small>2026.6.5 認定</small></div>""", unsafe_allow_html=True)
 
         show_my_tree(user['total'])
@@ -339,19 +335,19 @@ def student_app_main():
             "家族": {"label": "⑤ 👨‍👩‍👧 家族も一緒にできた", "pt": 50}
         }
         
-        df_data = {d: [False]*len(actions) for d in dates}
-        for d in dates:
-            if d in user['history']:
-                for i, k in enumerate(actions.keys()):
-                    if k in user['history'][d]: df_data[d][i] = True
+        history = fetch_student_history(user)
+        # 履歴が読めないまま保存すると、既存の人を新規参加者として数えてしまうので保存させない
+        history_ok = history is not None
+        history = history or {}
+        df_data = build_student_grid(history, list(actions), dates)
         
         df = pd.DataFrame(df_data, index=[v['label'] for v in actions.values()])
         edited = st.data_editor(df, column_config={d: st.column_config.CheckboxColumn(d) for d in dates}, use_container_width=True)
 
-        if st.button("✅ 記録を保存する", type="primary"):
-            saved_cnt = 0
-            curr_hist = user['history'].copy()
-            error_slot = st.empty()
+        if st.button("✅ 記録を保存する", type="primary", disabled=not history_ok):
+            curr_hist = history.copy()
+            rows = []
+            diffs = []
 
             for d in dates:
                 acts_to_save = []
@@ -364,31 +360,39 @@ def student_app_main():
                 
                 prev_acts = curr_hist.get(d, [])
                 if set(acts_to_save) != set(prev_acts):
-                    if save_student_log(user['id'], user['pin'], d, acts_to_save, pt_day, "一括"):
-                        curr_hist[d] = acts_to_save
-                        saved_cnt += 1
-                    else:
-                        error_slot.error(f"保存エラー: {d}")
+                    rows.append(build_student_row(user['id'], d, acts_to_save, pt_day, "一括", nickname="エコヒーロー", pin_code=user['pin']))
+                    diffs.append(pt_day - sum(actions[a]['pt'] for a in prev_acts if a in actions))
+                    curr_hist[d] = acts_to_save
+            diff_total = sum(diffs)
+            is_new = not history
+            became_hero = not user['hero'] and any(is_hero_row(r) for r in rows)
             
-            if saved_cnt > 0:
-                _, _, new_total, _ = fetch_student_data(user['id'])
-                st.session_state.student_user['total'] = new_total
+            if not rows:
+                st.info("変更がありませんでした。")
+            elif save_student_logs(rows, diffs, is_new_participant=is_new, became_hero=became_hero) is not None:
+                # 1日1行の Upsert なので、変更した日の差分だけ合計に足せば再取得は不要
+                st.session_state.student_user['total'] = user['total'] + diff_total
                 st.session_state.student_user['history'] = curr_hist
+                st.session_state.student_user['hero'] = user['hero'] or became_hero
                 st.balloons()
                 st.success("保存しました！")
                 time.sleep(1)
                 st.rerun()
-            else:
-                st.info("変更がありませんでした。")
 
         with st.expander("🌿 6/5 環境の日・6/6 未来宣言"):
             st.info("6/5(金)になったらここに入力してね！")
             q1 = st.radio("チャレンジどうだった？", ["最高！", "普通", "まだまだ"], key="q1")
             memo = st.text_input("感想を一言", key="memo")
-            if st.button("送信して認定証ゲット"):
-                if save_student_log(user['id'], user['pin'], "6/5(金)", ["環境の日アンケート"], 100, memo, q1=q1):
+            if st.button("送信して認定証ゲット", disabled=not history_ok):
+                # 6/5 に前の記録があれば、その分を引いた差分だけ合計が動く
+                prev_pt = 100 if "環境の日アンケート" in history.get("6/5(金)", []) else 0
+                diff = 100 - prev_pt
+                if save_student_log(user['id'], user['pin'], "6/5(金)", ["環境の日アンケート"], 100, memo, q1=q1,
+                                    diff_points=diff, is_new_participant=not history, became_hero=not user['hero']):
                     st.success("送信しました！")
-                    st.session_state.student_user['history']["6/5(金)"] = ["環境の日アンケート"]
+                    history["6/5(金)"] = ["環境の日アンケート"]
+                    st.session_state.student_user['total'] = user['total'] + diff
+                    st.session_state.student_user['hero'] = True
                     st.rerun()
 
         if st.button("⬅️ TOPに戻る"):
@@ -402,6 +406,15 @@ def student_app_main():
 #  3. JCメンバー用アプリ ロジック
 # ==========================================
 
+def fetch_lom_ranking():
+    """LOMごとの合計ポイント（1分キャッシュ・保存時に破棄。読めなければ空）"""
+    try:
+        rows = repo.members.lom_ranking()
+    except Exception as e:
+        st.error(f"ランキングの取得エラー: {e}")
+        rows = []
+    return pd.DataFrame(rows, columns=["lom_name", "points"])
+
 def member_app_main():
     st.markdown("""
     <style>
@@ -412,53 +425,20 @@ def member_app_main():
     </style>
     """, unsafe_allow_html=True)
 
-    ACTION_MASTER = {
-        "てまえどり": {"point": 40, "label": "🏪 てまえどり (40g)"},
-        "リフューズ": {"point": 30, "label": "🥡 カトラリー辞退 (30g)"},
-        "待機電力": {"point": 20, "label": "🔌 待機電力カット (20g)"},
-        "節水": {"point": 60, "label": "🚿 シャワー短縮 (60g)"},
-        "完食": {"point": 50, "label": "🍽️ 完食・ロスゼロ (50g)"},
-        "発信": {"point": 100, "label": "📱 エコの発信 (100g)"},
-        "スマートムーブ": {"point": 80, "label": "🚶 スマートムーブ (80g)"}
-    }
-    LOM_LIST = ["岡山", "倉敷", "津山", "玉野", "児島", "笠岡", "美作", "新見", "備前", "高梁", "総社", "井原", "真庭", "勝央", "瀬戸内"]
-    TARGET_DATES = ["6/1(月)", "6/2(火)", "6/3(水)", "6/4(木)", "6/5(金)"]
+    ACTION_MASTER = MEMBER_ACTIONS
+    TARGET_DATES = MEMBER_DATES
 
     def fetch_member_logs(user_name, lom_name):
-        if not supabase: return pd.DataFrame()
+        return pd.DataFrame(repo.members.fetch_logs(user_name, lom_name))
+
+    # 変わったセルだけを1回の RPC で反映（sql/004_sync_member_logs.sql）
+    def save_member_logs(user_name, lom_name, edited_df, logs):
+        if not repo.connected: return False
+        checked = checked_from_grid(edited_df.to_dict("records"), ACTION_MASTER, TARGET_DATES)
+        existing_rows = logs.to_dict("records") if not logs.empty else []
+        points = member_points(ACTION_MASTER)
         try:
-            res = supabase.table("logs_member").select("*").eq("user_name", user_name).eq("lom_name", lom_name).execute()
-            return pd.DataFrame(res.data)
-        except: return pd.DataFrame()
-
-    def fetch_lom_ranking():
-        if not supabase: return pd.DataFrame()
-        try:
-            res = supabase.table("logs_member").select("lom_name, points").execute()
-            df = pd.DataFrame(res.data)
-            if df.empty: return pd.DataFrame()
-            return df.groupby("lom_name")["points"].sum().sort_values(ascending=False).reset_index()
-        except: return pd.DataFrame()
-
-    def save_member_logs(user_name, lom_name, edited_df):
-        if not supabase: return False
-        insert_list = []
-        label_to_key = {v["label"]: k for k, v in ACTION_MASTER.items()}
-        
-        for idx, row in edited_df.iterrows():
-            key = label_to_key[row["アクション項目"]]
-            pt = ACTION_MASTER[key]["point"]
-            for date in TARGET_DATES:
-                if row[date]:
-                    insert_list.append({
-                        "user_name": user_name, "lom_name": lom_name,
-                        "target_date": date, "action_label": key,
-                        "is_done": True, "points": pt
-                    })
-        try:
-            supabase.table("logs_member").delete().eq("user_name", user_name).eq("lom_name", lom_name).in_("target_date", TARGET_DATES).execute()
-            if insert_list: supabase.table("logs_member").insert(insert_list).execute()
-            return True
+            return repo.members.sync_checks(user_name, lom_name, existing_rows, checked, points, TARGET_DATES)
         except: return False
 
     if "jc_user" not in st.session_state:
@@ -486,25 +466,12 @@ def member_app_main():
         st.markdown(f"""<div class="metric-box"><div style="font-size:14px;">現在の獲得ポイント</div><div style="font-size:32px; font-weight:bold; color:#0277BD;">{total:,} <span style="font-size:16px;">g-CO2</span></div></div>""", unsafe_allow_html=True)
 
         st.subheader("📝 実践チェック")
-        disp_items = [v["label"] for v in ACTION_MASTER.values()]
-        df_data = {"アクション項目": disp_items}
-        
-        for d in TARGET_DATES:
-            checks = []
-            for item in disp_items:
-                label_to_key = {v["label"]: k for k, v in ACTION_MASTER.items()}
-                k = label_to_key[item]
-                is_done = False
-                if not logs.empty:
-                    match = logs[(logs['target_date'] == d) & (logs['action_label'] == k)]
-                    if not match.empty: is_done = True
-                checks.append(is_done)
-            df_data[d] = checks
+        df_data = build_member_grid(logs.to_dict("records") if not logs.empty else [], ACTION_MASTER, TARGET_DATES)
         
         edited = st.data_editor(pd.DataFrame(df_data), column_config={d: st.column_config.CheckboxColumn(d, default=False) for d in TARGET_DATES}, use_container_width=True, hide_index=True)
 
         if st.button("記録を保存する", type="primary"):
-            if save_member_logs(user['name'], user['lom'], edited):
+            if save_member_logs(user['name'], user['lom'], edited, logs):
                 st.success("保存しました！")
                 st.balloons()
                 time.sleep(1)
@@ -542,7 +509,8 @@ def main_selector():
                 try:
                     with st.spinner("自動ログイン中..."):
                         uid = str(cookie_user_id)
-                        _, saved_pin, total, hist = fetch_student_data(uid)
+                        profile = fetch_student_data(uid)
+                        if profile is None: raise RuntimeError("自動ログイン失敗") # 取得エラー時は通常ログインへ
                         
                         parts = uid.split("_") # [学校, 学年, 組, 番号]
                         disp_name = f"{parts[1]} {parts[2]}組 {parts[3]}番"
@@ -551,7 +519,7 @@ def main_selector():
                             "id": uid, 
                             "school": parts[0], 
                             "grade_class": disp_name, 
-                            "total": total, "history": hist, "pin": saved_pin
+                            "total": profile.total, "history": profile.history, "hero": profile.is_hero, "pin": profile.pin_code
                         }
                         st.session_state.app_mode = 'student'
                         st.rerun()
@@ -605,4 +573,6 @@ def main_selector():
         member_app_main()
 
 if __name__ == "__main__":
-    main_selector()
+    metrics_gate()
+    with track_run("app"), profile_run("app"):
+        main_selector()
@@ -0,0 +1 @@
+"""domain.py / scan.py のマイクロベンチマーク（python -m bench）"""
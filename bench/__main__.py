@@ -0,0 +1,120 @@
+"""python -m bench [--sizes 1000,10000,100000,1000000] [--save-baseline]
+
+domain.py / scan.py の計算を合成データで計測し、bench/baseline.json と比べる。
+基準より threshold（既定 25%）以上遅くなったケースを REGRESSION と表示し、終了コード 1 を返す。
+リポジトリの bench/baseline.json は参考の値（meta に測ったマシン）。基準は実行したマシンでの値なので、
+別のマシンで比べるときは、変更前のコードでまず --save-baseline してから変更後を実行すること。
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+from bench.cases import CASES
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def measure(case, n, repeat, budget, min_time=0.05):
+    """入力を1回作り、1回あたりの最短時間（秒）を返す
+
+    小さい入力は1回が短すぎて誤差が大きいので、min_time 秒以上かかるまで
+    まとめて繰り返した平均を1サンプルとする（timeit の autorange と同じ考え方）。
+    budget 秒を超えたら repeat 回より前に打ち切る。
+    """
+    data = case.make(n)
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            case.run(data)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or elapsed * 10 > budget:
+            break
+        number *= 10 if elapsed * 10 < min_time else 2
+
+    best = elapsed / number
+    spent = elapsed
+    for _ in range(repeat - 1):
+        if spent > budget:
+            break
+        gc.collect()
+        started = time.perf_counter()
+        for _ in range(number):
+            case.run(data)
+        elapsed = time.perf_counter() - started
+        best = min(best, elapsed / number)
+        spent += elapsed
+    return best
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="純粋な計算部分のベンチマーク")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="行数（カンマ区切り）")
+    parser.add_argument("--cases", help="実行するケース（カンマ区切り。省略時は全部）")
+    parser.add_argument("--repeat", type=int, default=5, help="各計測の繰り返し回数（最短を採用）")
+    parser.add_argument("--budget", type=float, default=5.0, help="1計測あたりの時間の上限（秒）")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基準の JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果を基準として保存")
+    parser.add_argument("--threshold", type=float, default=0.25, help="基準からこの割合以上遅いと REGRESSION")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    wanted = set(args.cases.split(",")) if args.cases else None
+    cases = [c for c in CASES if wanted is None or c.name in wanted]
+    baseline = None if args.save_baseline else load_baseline(args.baseline)
+    base_results = (baseline or {}).get("results", {})
+
+    results = {}
+    regressions = []
+    print(f"{'case':<18}{'rows':>10}{'time':>12}{'ns/row':>10}{'baseline':>12}{'ratio':>8}")
+    for case in cases:
+        results[case.name] = {}
+        for n in sizes:
+            t = measure(case, n, args.repeat, args.budget)
+            results[case.name][str(n)] = t
+            base = base_results.get(case.name, {}).get(str(n))
+            ratio = t / base if base else None
+            flag = ""
+            if ratio is not None and ratio > 1 + args.threshold:
+                flag = "  REGRESSION"
+                regressions.append((case.name, n, ratio))
+            print(f"{case.name:<18}{n:>10}{t * 1000:>10.2f}ms{t / n * 1e9:>10.0f}"
+                  f"{'' if base is None else format(base * 1000, '.2f') + 'ms':>12}"
+                  f"{'' if ratio is None else format(ratio, '.2f'):>8}{flag}", flush=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "machine": platform.platform(),
+                },
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\nbaseline saved: {args.baseline}")
+    elif baseline is None:
+        print(f"\nno baseline at {args.baseline} (run with --save-baseline first)")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+        for name, n, ratio in regressions:
+            print(f"  {name} @ {n} rows: {ratio:.2f}x")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""ベンチマークの対象（domain.py / scan.py の純粋な計算）と合成データ
+
+各ケースは make(n) で n 行の入力を作り（計測しない）、run(入力) を計測する。
+"""
+import random
+
+from domain import (
+    MEMBER_ACTIONS, MEMBER_DATES, LOM_LIST,
+    parse_student_history, build_member_grid,
+    student_stats_folds, member_stats_folds, lom_ranking_folds,
+    global_stats_result, dashboard_stats_result, lom_ranking_result, encode_actions,
+)
+from rollups import StudentRollupFold
+from scan import fold_pages, fold_columns, DEFAULT_PAGE_SIZE
+from localbase.seed import student_id, APP_DATES, APP_ACTIONS, HERO_ACTION
+
+PAGE_SIZE = DEFAULT_PAGE_SIZE
+
+
+def student_rows(n, rows_per_user=4, seed=0):
+    """logs_student 相当の n 行（4行で1人）"""
+    rng = random.Random(seed)
+    keys = list(APP_ACTIONS)
+    rows = []
+    for k in range(n):
+        acts = [a for a in keys if rng.random() < 0.5]
+        if rng.random() < 0.05:
+            acts.append(HERO_ACTION)
+        user_id = student_id(k // rows_per_user)
+        rows.append({
+            "id": k + 1,
+            "user_id": user_id,
+            "school_name": user_id.split("_")[0],
+            "nickname": "エコヒーロー",
+            "pin_code": "1234",
+            "target_date": APP_DATES[k % len(APP_DATES)],
+            "created_at": f"2026-06-0{k % len(APP_DATES) + 1}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00.000000+00:00",
+            "actions_str": ", ".join(acts),
+            "actions_mask": encode_actions(acts),
+            "action_points": sum(APP_ACTIONS.get(a, 100) for a in acts),
+        })
+    return rows
+
+
+def only(rows, columns):
+    """scan_table が select で読む列だけの行にする"""
+    return [{c: r[c] for c in columns} for r in rows]
+
+
+def member_rows(n, seed=0):
+    """logs_member 相当の n 行（35行で1人）"""
+    rng = random.Random(seed)
+    keys = list(MEMBER_ACTIONS)
+    cells = len(keys) * len(MEMBER_DATES)
+    rows = []
+    for k in range(n):
+        m = k // cells
+        rows.append({
+            "id": k + 1,
+            "user_name": f"メンバー{m}",
+            "lom_name": LOM_LIST[m % len(LOM_LIST)],
+            "target_date": MEMBER_DATES[k % len(MEMBER_DATES)],
+            "action_label": keys[(k // len(MEMBER_DATES)) % len(keys)],
+            "is_done": True,
+            "points": MEMBER_ACTIONS[keys[rng.randrange(len(keys))]]["point"],
+        })
+    return rows
+
+
+def pages(rows, size=PAGE_SIZE):
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def _with_rollup():
+    """repository.load_global_stats と同じ（全体統計と rollups の予備ルートを1回のスキャンで）"""
+    folds = student_stats_folds(use_mask=True)
+    folds["rollup"] = StudentRollupFold()
+    return folds
+
+
+class Case:
+    def __init__(self, name, make, run, doc):
+        self.name = name
+        self.make = make
+        self.run = run
+        self.doc = doc
+
+
+CASES = [
+    Case("history_parse",
+         lambda n: student_rows(n),
+         lambda rows: parse_student_history(rows),
+         "ログイン時の履歴の読み取り（fetch_user_data / fetch_student_data）"),
+    Case("member_grid",
+         lambda n: member_rows(n),
+         lambda rows: build_member_grid(rows),
+         "JCメンバーのチェック表の組み立て（admin.py main / member_app_main）"),
+    Case("global_stats",
+         lambda n: pages(only(student_rows(n), fold_columns(student_stats_folds()))),
+         lambda p: global_stats_result(fold_pages(student_stats_folds(), p)),
+         "小学生の全体統計（fetch_global_stats の答え合わせ。actions_str を読む）"),
+    Case("global_stats_mask",
+         lambda n: pages(only(student_rows(n), fold_columns(student_stats_folds(use_mask=True)))),
+         lambda p: global_stats_result(fold_pages(student_stats_folds(use_mask=True), p)),
+         "同上（sql/009 の actions_mask を読む）"),
+    Case("global_stats_rollups",
+         lambda n: pages(only(student_rows(n), fold_columns(_with_rollup()))),
+         lambda p: fold_pages(_with_rollup(), p)["rollup"].to_rows(),
+         "同上に rollups 表の予備ルート（アクション別・学校別・日付別）を足したもの"),
+    Case("dashboard_stats",
+         lambda n: (pages(student_rows(n)), pages(member_rows(max(n // 10, 1)))),
+         lambda p: dashboard_stats_result(fold_pages(student_stats_folds(), p[0]), fold_pages(member_stats_folds(), p[1])),
+         "ダッシュボード統計の予備ルート（fetch_dashboard_stats）"),
+    Case("lom_ranking",
+         lambda n: pages(member_rows(n)),
+         lambda p: lom_ranking_result(fold_pages(lom_ranking_folds(), p)["lom"]),
+         "LOM対抗ランキングの予備ルート（fetch_lom_ranking）"),
+]
+
@@ -0,0 +1,24 @@
+"""Streamlit の外で動くコマンド（export.py / rebuild.py）の接続先
+
+st.secrets は streamlit run の中でしか読めないので、同じ .streamlit/secrets.toml を直接読む。
+"""
+import os
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+
+def load_secrets(section, path=SECRETS_PATH):
+    """secrets.toml の [section]（ファイルがない・読めないときは空）"""
+    try:
+        import tomllib
+        with open(path, "rb") as f:
+            return dict(tomllib.load(f).get(section, {}))
+    except (ImportError, OSError, ValueError):
+        return {}
+
+
+def supabase_connection(url=None, key=None):
+    """(url, key)：引数 → 環境変数 SUPABASE_URL / SUPABASE_KEY → secrets.toml の [supabase] の順"""
+    conf = load_secrets("supabase")
+    return (url or os.environ.get("SUPABASE_URL") or conf.get("url"),
+            key or os.environ.get("SUPABASE_KEY") or conf.get("key"))
@@ -0,0 +1,218 @@
+"""画面やDBに依存しない計算（Streamlit / supabase / pandas を import しない）
+
+チェック表の組み立て・履歴の読み取り・統計の集計をここにまとめ、
+画面側（app.py / admin.py / visitor.py）と repository.py から呼ぶ。
+Streamlit なしで呼べるので bench/ のベンチマークの対象にもなる。
+"""
+from dataclasses import dataclass, field
+
+from scan import SumFold, DistinctFold, GroupSumFold
+
+HERO_ACTION = "環境の日アンケート"
+
+# ==========================================
+#  JCメンバー（ユニバーサルデコ活）
+# ==========================================
+MEMBER_ACTIONS = {
+    "てまえどり": {"point": 40, "label": "🏪 てまえどり (40g)", "desc": "商品棚の手前（期限が近いもの）から取る"},
+    "リフューズ": {"point": 30, "label": "🥡 カトラリー辞退 (30g)", "desc": "「お箸・スプーン・袋はいいです」と断る"},
+    "待機電力": {"point": 20, "label": "🔌 待機電力カット (20g)", "desc": "使わない家電のスイッチ・コンセントOFF"},
+    "節水": {"point": 60, "label": "🚿 シャワー短縮 (60g)", "desc": "1分短縮、または出しっぱなしにしない"},
+    "完食": {"point": 50, "label": "🍽️ 完食・ロスゼロ (50g)", "desc": "外食・弁当含め、食品ロスを出さない"},
+    "発信": {"point": 100, "label": "📱 エコの発信 (100g)", "desc": "SNS投稿、職場・LOMでの会話"},
+    "スマートムーブ": {"point": 80, "label": "🚶 スマートムーブ (80g)", "desc": "徒歩・自転車・階段利用、ふんわりアクセル"}
+}
+
+# 岡山ブロック内15LOMリスト
+LOM_LIST = [
+    "岡山", "倉敷", "津山", "玉野", "児島", "笠岡", "美作",
+    "新見", "備前", "高梁", "総社", "井原", "真庭", "勝央", "瀬戸内"
+]
+
+MEMBER_DATES = ["6/1(月)", "6/2(火)", "6/3(水)", "6/4(木)", "6/5(金)"]
+
+GRID_LABEL_COLUMN = "アクション項目"
+
+
+def member_checked_cells(rows, target_dates=None):
+    """記録済みの {(日付, アクション)}（target_dates を渡すとその日付だけ）"""
+    cells = {(r.get("target_date"), r.get("action_label")) for r in rows}
+    if target_dates is not None:
+        dates = set(target_dates)
+        cells = {c for c in cells if c[0] in dates}
+    return cells
+
+
+def build_member_grid(rows, actions=MEMBER_ACTIONS, target_dates=MEMBER_DATES):
+    """チェック表の列 {"アクション項目": [ラベル...], 日付: [済み?...]}（DataFrame にそのまま渡せる形）
+
+    セルごとに記録を探さず、記録を1回だけ集合にしてから引く。
+    """
+    done = member_checked_cells(rows)
+    grid = {GRID_LABEL_COLUMN: [v["label"] for v in actions.values()]}
+    for d in target_dates:
+        grid[d] = [(d, k) in done for k in actions]
+    return grid
+
+
+def checked_from_grid(records, actions=MEMBER_ACTIONS, target_dates=MEMBER_DATES):
+    """編集後のチェック表（行の dict のリスト）から、チェックされている {(日付, アクション)}"""
+    label_to_key = {v["label"]: k for k, v in actions.items()}
+    checked = set()
+    for row in records:
+        key = label_to_key[row[GRID_LABEL_COLUMN]]
+        for d in target_dates:
+            if row[d]:
+                checked.add((d, key))
+    return checked
+
+
+def member_points(actions=MEMBER_ACTIONS):
+    return {k: v["point"] for k, v in actions.items()}
+
+
+# ==========================================
+#  小学生
+# ==========================================
+
+# アクション → ビット（logs_student.actions_mask）。値を変えないこと（sql/009 の対応表と同じ）
+STUDENT_ACTION_BITS = {
+    "電気": 1, "食事": 2, "水": 4, "分別": 8, "家族": 16,
+    HERO_ACTION: 32, "デコ活宣言": 64,
+}
+HERO_BIT = STUDENT_ACTION_BITS[HERO_ACTION]
+
+# app.py / visitor.py のチェック表と環境の日アンケートのポイント
+STUDENT_ACTION_POINTS = {"電気": 50, "食事": 100, "水": 30, "分別": 80, "家族": 50, HERO_ACTION: 100}
+
+
+def encode_actions(actions):
+    """[やったこと...] → actions_mask（対応表にないアクションは入らない）"""
+    mask = 0
+    for a in actions or ():
+        mask |= STUDENT_ACTION_BITS.get(a, 0)
+    return mask
+
+
+def decode_actions(mask):
+    """actions_mask → [やったこと...]（対応表の順）"""
+    mask = int(mask or 0)
+    return [a for a, bit in STUDENT_ACTION_BITS.items() if mask & bit]
+
+
+def actions_of(row):
+    """行のやったことリスト（actions_str を読んでいればそれ、なければ actions_mask から）"""
+    if "actions_str" in row:
+        actions = row.get("actions_str")
+        return str(actions).split(", ") if actions else []
+    return decode_actions(row.get("actions_mask"))
+
+
+def mask_points(mask, points=STUDENT_ACTION_POINTS):
+    """actions_mask のポイント合計"""
+    mask = int(mask or 0)
+    return sum(p for a, p in points.items() if mask & STUDENT_ACTION_BITS[a])
+
+
+def action_counts(masks):
+    """actions_mask の並び → {アクション: そのビットが立っている行数}"""
+    counts = dict.fromkeys(STUDENT_ACTION_BITS, 0)
+    for mask in masks:
+        mask = int(mask or 0)
+        if not mask:
+            continue
+        for a, bit in STUDENT_ACTION_BITS.items():
+            if mask & bit:
+                counts[a] += 1
+    return counts
+
+
+@dataclass
+class StudentHistory:
+    pin_code: str = ""
+    nickname: str = ""
+    total: int = 0
+    history: dict = field(default_factory=dict)  # {日付: [やったことリスト]}
+
+
+def parse_student_history(rows, into=None):
+    """logs_student の行（id 順）から あいことば・ニックネーム・合計・日付ごとの履歴 を読み取る
+
+    同じ日付が複数あれば後の行が優先。into に StudentHistory 互換のものを渡すとそこへ書き込む。
+    """
+    record = into if into is not None else StudentHistory()
+    for row in rows or []:
+        record.total += int(row.get("action_points") or 0)
+        if row.get("pin_code"): record.pin_code = row["pin_code"]
+        if row.get("nickname"): record.nickname = row["nickname"]
+        if row.get("target_date"):
+            record.history[row["target_date"]] = actions_of(row)
+    return record
+
+
+def build_student_grid(history, keys, dates):
+    """チェック表の列 {日付: [済み?...]}（行は keys の順）"""
+    grid = {}
+    for d in dates:
+        done = set(history.get(d, ()))
+        grid[d] = [k in done for k in keys]
+    return grid
+
+
+def is_hero_row(row):
+    """環境の日アンケートを含む行か（ヒーロー認定。actions_mask があればビットで見る）"""
+    mask = row.get("actions_mask")
+    if mask is not None:
+        return bool(int(mask) & HERO_BIT)
+    return HERO_ACTION in str(row.get("actions_str") or "")
+
+
+def is_hero_history(history):
+    return any(HERO_ACTION in actions for actions in history.values())
+
+
+# ==========================================
+#  集計（scan.py の集計器を組み合わせる）
+# ==========================================
+
+def student_stats_folds(use_mask=False):
+    """logs_student の CO2合計・参加者数・ヒーロー数
+
+    use_mask=True なら actions_str（文字列）の代わりに actions_mask（整数）を読む（sql/009 適用後）。
+    """
+    return {
+        "co2": SumFold("action_points"),
+        "participants": DistinctFold("user_id"),
+        # ヒーロー認定者数 = 環境の日アンケートを含む行があるIDの数
+        "heroes": DistinctFold("user_id", where=is_hero_row,
+                               extra_columns=["actions_mask" if use_mask else "actions_str"]),
+    }
+
+
+def member_stats_folds():
+    """logs_member の CO2合計・参加者数"""
+    return {
+        "co2": SumFold("points"),
+        "members": DistinctFold("user_name"),
+    }
+
+
+def lom_ranking_folds():
+    return {"lom": GroupSumFold("lom_name", "points")}
+
+
+def global_stats_result(stats):
+    """student_stats_folds の結果 → (CO2削減量, ヒーロー数, 参加者数)"""
+    return int(stats["co2"]), int(stats["heroes"]), int(stats["participants"])
+
+
+def dashboard_stats_result(stu, mem):
+    """student_stats_folds / member_stats_folds の結果 → (ヒーロー数, 参加者総数, CO2削減総量)"""
+    return stu["heroes"], stu["participants"] + mem["members"], stu["co2"] + mem["co2"]
+
+
+def lom_ranking_result(totals):
+    """{LOM: 合計} → [{"lom_name", "points"}]（多い順）"""
+    ranking = [{"lom_name": k, "points": v} for k, v in totals.items()]
+    ranking.sort(key=lambda r: r["points"], reverse=True)
+    return ranking
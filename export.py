@@ -0,0 +1,364 @@
+"""キャンペーンの表を CSV / Parquet に書き出す（主催者の集計・突き合わせ用）
+
+logs_student / logs_member / game_scores を scan.py と同じキーセット方式で1ページずつ読み、
+そのままファイルに書き足す（表が大きくてもメモリは1ページ分）。
+進み具合は出力先の export_state.json に書き、途中で止まっても同じコマンドで続きから書き出す。
+書き終わった表をもう一度書き出すと、前回の最後の id より後ろに増えた行だけを書き足す。
+前回より前の行が書き換わっていても（小学生の記録は1人1日1行で上書きされる）拾わないので、
+その時点の全部がほしいときは --fresh（管理画面では「最初から書き出す」）にする。
+
+    python export.py                           # exports/ に CSV（.streamlit/secrets.toml の接続先）
+    python export.py --format parquet          # pyarrow が入っていれば Parquet
+    python export.py --tables logs_member --fresh --out /tmp/exports
+
+CSV は Excel で開けるよう BOM 付き UTF-8。Parquet は PARQUET_COLUMNS の型で、PART_ROWS 行ごとに
+<表>-0001.parquet, <表>-0002.parquet ... に分ける（閉じたファイルの分だけを「済み」にする）。
+admin.py の ?export=<secrets の export.token> からは ExportJob でワーカースレッドに走らせる。
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+from scan import scan_table, DEFAULT_PAGE_SIZE
+from cli_config import supabase_connection
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+TABLES = ("logs_student", "logs_member", "game_scores")
+DEFAULT_DIR = "exports"
+STATE_FILE = "export_state.json"
+PART_ROWS = 200000      # Parquet の1ファイルの行数（この単位で「済み」になる）
+FORMATS = ("csv", "parquet")
+
+# Parquet の列の型（localbase/schema.py と同じ列。migration 前でまだない列は飛ばす）
+PARQUET_COLUMNS = {
+    "logs_student": (
+        ("id", "int64"), ("created_at", "timestamp"), ("user_id", "string"), ("nickname", "string"),
+        ("pin_code", "string"), ("school_name", "string"), ("target_date", "string"),
+        ("actions_str", "string"), ("action_points", "int64"), ("memo", "string"),
+        ("q1", "string"), ("q2", "string"), ("q3", "string"),
+        ("updated_at", "timestamp"), ("actions_mask", "int32"),
+    ),
+    "logs_member": (
+        ("id", "int64"), ("created_at", "timestamp"), ("user_name", "string"), ("lom_name", "string"),
+        ("target_date", "string"), ("action_label", "string"), ("is_done", "bool"), ("points", "int64"),
+    ),
+    "game_scores": (
+        ("id", "int64"), ("created_at", "timestamp"), ("name", "string"), ("school", "string"),
+        ("time", "double"), ("date", "date"),
+    ),
+}
+
+
+# ==========================================
+#  進み具合（export_state.json）
+# ==========================================
+
+def load_state(out_dir, fmt):
+    """前回の進み具合（形式が違えば最初から）"""
+    path = os.path.join(out_dir, STATE_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {"format": fmt, "tables": {}}
+    if state.get("format") != fmt:
+        return {"format": fmt, "tables": {}}
+    return state
+
+
+def save_state(out_dir, state):
+    """書きかけで止まっても壊れないよう、別名で書いてから置き換える"""
+    path = os.path.join(out_dir, STATE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def count_rows(client, table, key="id"):
+    """進み具合の分母（数えられなければ None）"""
+    try:
+        return client.table(table).select(key, count="exact").limit(1).execute().count
+    except Exception:
+        return None
+
+
+# ==========================================
+#  書き出し
+# ==========================================
+
+def export_table(client, table, out_dir, state, fmt="csv", progress=None, key="id", page_size=DEFAULT_PAGE_SIZE):
+    """1つの表を書き出し、その表の進み具合（state["tables"][table]）を返す
+
+    progress(table, 書き出した行数, 全体の行数 or None) をページごとに呼ぶ。
+    書き終わった表なら、前回の last_key より後ろの行だけを書き足す（entry["added"] がこの回に足した行数）。
+    """
+    entry = state["tables"].setdefault(table, {"last_key": None, "rows": 0, "files": [], "done": False})
+    entry["done"] = False
+    before = entry["rows"]
+    total = count_rows(client, table, key)
+    if progress is not None:
+        progress(table, entry["rows"], total)
+
+    def commit(pending=0):
+        # pending: まだ「済み」にしていない行数（表示だけ進める）
+        if not pending:
+            save_state(out_dir, state)
+        if progress is not None:
+            progress(table, entry["rows"] + pending, total)
+
+    # 前回の「済み」より後ろの書きかけを片付けてから、その続きを読む
+    if fmt == "parquet":
+        _prepare_parquet(table, out_dir, entry)
+    else:
+        _prepare_csv(table, out_dir, entry)
+    filters = None
+    if entry["last_key"] is not None:
+        last = entry["last_key"]
+        filters = lambda q: q.gt(key, last)
+    pages = scan_table(client, table, "*", key=key, page_size=page_size, filters=filters)
+
+    if fmt == "parquet":
+        _write_parquet(table, out_dir, entry, pages, commit, key)
+    else:
+        _write_csv(table, out_dir, entry, pages, commit, key)
+
+    entry["done"] = True
+    entry["added"] = entry["rows"] - before
+    commit()
+    return entry
+
+
+def _prepare_csv(table, out_dir, entry):
+    path = os.path.join(out_dir, f"{table}.csv")
+    if entry["rows"] and os.path.exists(path):
+        # 前回の最後の「済み」より後ろに書きかけの行があれば捨てる
+        with open(path, "r+b") as f:
+            f.truncate(entry.get("bytes", 0))
+    else:
+        entry.update(rows=0, last_key=None, bytes=0, columns=None)
+        if os.path.exists(path):
+            os.remove(path)
+    entry["files"] = [path]
+
+
+def _write_csv(table, out_dir, entry, pages, commit, key):
+    path = entry["files"][0]
+    with open(path, "a", newline="", encoding="utf-8-sig") as f:
+        writer = None
+        for rows in pages:
+            if writer is None:
+                if not entry.get("columns"):
+                    entry["columns"] = list(rows[0].keys())
+                writer = csv.DictWriter(f, fieldnames=entry["columns"], extrasaction="ignore")
+                if entry["rows"] == 0:
+                    writer.writeheader()
+            writer.writerows(rows)
+            f.flush()
+            entry["rows"] += len(rows)
+            entry["last_key"] = rows[-1][key]
+            entry["bytes"] = os.path.getsize(path)
+            commit()
+
+
+def _parquet_columns(table, columns):
+    """PARQUET_COLUMNS から、表にある列だけの [(列, 型名)]（型の決まっていない列があれば例外）"""
+    declared = dict(PARQUET_COLUMNS.get(table, ()))
+    unknown = [c for c in columns if c not in declared]
+    if unknown:
+        raise RuntimeError(f"{table}: Parquet の型が決まっていない列があります: {', '.join(unknown)}"
+                           "（export.py の PARQUET_COLUMNS に足す）")
+    return [(name, declared[name]) for name, _ in PARQUET_COLUMNS[table] if name in columns]
+
+
+def _prepare_parquet(table, out_dir, entry):
+    if not HAS_PYARROW:
+        raise RuntimeError("Parquet には pyarrow が必要です（pip install pyarrow）")
+    declared = dict(PARQUET_COLUMNS.get(table, ()))
+    same_types = all(declared.get(n) == t for n, t in entry.get("schema") or ())
+    if not entry["rows"] or not same_types or not all(os.path.exists(p) for p in entry["files"]):
+        # 型を変えたら途中のファイルとは混ぜられないので最初から
+        entry.update(rows=0, last_key=None, files=[], columns=None, schema=None)
+    # 閉じていないファイル（前回の途中）は消す
+    done = set(entry["files"])
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if name.startswith(f"{table}-") and name.endswith(".parquet") and path not in done:
+            os.remove(path)
+
+
+def _write_parquet(table, out_dir, entry, pages, commit, key):
+    schema, convert = None, None
+    writer, path, part_rows, part_key = None, None, 0, None
+    try:
+        for rows in pages:
+            if schema is None:
+                if not entry.get("schema"):
+                    entry["columns"] = list(rows[0].keys())
+                    entry["schema"] = _parquet_columns(table, entry["columns"])
+                schema = pa.schema([pa.field(n, _arrow_type(t)) for n, t in entry["schema"]])
+                convert = [(n, _ARROW_PARSE.get(t)) for n, t in entry["schema"]]
+            if writer is None:
+                path = os.path.join(out_dir, f"{table}-{len(entry['files']) + 1:04d}.parquet")
+                writer = pq.ParquetWriter(path, schema)
+            # 型が合わない値は pyarrow が例外にする（黙って文字列にはしない）
+            data = [{n: (f(r.get(n)) if f and r.get(n) is not None else r.get(n)) for n, f in convert} for r in rows]
+            writer.write_table(pa.Table.from_pylist(data, schema=schema))
+            part_rows += len(rows)
+            part_key = rows[-1][key]
+            if part_rows >= PART_ROWS:
+                writer.close()
+                writer = None
+                entry["files"].append(path)
+                entry["rows"] += part_rows
+                entry["last_key"] = part_key
+                part_rows = 0
+                commit()
+            else:
+                commit(pending=part_rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    if part_rows:
+        entry["files"].append(path)
+        entry["rows"] += part_rows
+        entry["last_key"] = part_key
+        commit()
+
+
+def _arrow_type(name):
+    """PARQUET_COLUMNS の型名 → pyarrow の型（知らない型名は例外）"""
+    types = {"int64": pa.int64(), "int32": pa.int32(), "double": pa.float64(), "bool": pa.bool_(),
+             "string": pa.string(), "date": pa.date32(), "timestamp": pa.timestamp("us", tz="UTC")}
+    if name not in types:
+        raise ValueError(f"Parquet の型名が不正です: {name}")
+    return types[name]
+
+
+# PostgREST は日付・日時を ISO 形式の文字列で返す
+_ARROW_PARSE = {"date": datetime.date.fromisoformat, "timestamp": datetime.datetime.fromisoformat}
+
+
+def export_all(client, out_dir=DEFAULT_DIR, tables=TABLES, fmt="csv", fresh=False, progress=None):
+    """tables を順に書き出す（fresh=True なら前回の続きではなく最初から）。{表: 進み具合} を返す"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format は {' / '.join(FORMATS)} のどれか: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    state = {"format": fmt, "tables": {}} if fresh else load_state(out_dir, fmt)
+    for table in tables:
+        if fresh:
+            state["tables"].pop(table, None)
+        export_table(client, table, out_dir, state, fmt=fmt, progress=progress)
+    state["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    save_state(out_dir, state)
+    return {t: state["tables"][t] for t in tables}
+
+
+class ExportJob:
+    """export_all をワーカースレッドで走らせ、画面からは進み具合を読むだけにする
+
+    Streamlit の @st.cache_resource で1プロセスに1つだけ作る想定（同時に走るのは1本だけ）。
+    """
+    def __init__(self, client, out_dir=DEFAULT_DIR):
+        self.client = client
+        self.out_dir = out_dir
+        self._lock = threading.Lock()
+        self._thread = None
+        self._progress = {}     # {表: (書き出した行数, 全体の行数 or None)}
+        self._error = None
+        self._finished = False
+
+    def start(self, tables, fmt="csv", fresh=False):
+        """書き出しを始める（もう走っていれば何もせず False）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._progress = {t: (0, None) for t in tables}
+            self._error = None
+            self._finished = False
+            self._thread = threading.Thread(target=self._run, args=(list(tables), fmt, fresh),
+                                            name="export", daemon=True)
+            self._thread.start()
+        return True
+
+    def status(self):
+        """{"running", "progress", "error", "finished"}（progress は {表: (行数, 全体)}）"""
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            return {"running": running, "progress": dict(self._progress),
+                    "error": self._error, "finished": self._finished}
+
+    def _run(self, tables, fmt, fresh):
+        def progress(table, rows, total):
+            with self._lock:
+                self._progress[table] = (rows, total)
+        try:
+            export_all(self.client, self.out_dir, tables, fmt=fmt, fresh=fresh, progress=progress)
+        except Exception as e:
+            with self._lock:
+                self._error = f"{type(e).__name__}: {e}"
+            return
+        with self._lock:
+            self._finished = True
+
+
+# ==========================================
+#  コマンドライン
+# ==========================================
+
+def _print_progress(table, rows, total):
+    tail = f"/{total:,}" if total else ""
+    print(f"\r{table}: {rows:,}{tail} rows", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python export.py", description="キャンペーンの表を CSV / Parquet に書き出す")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--out", default=DEFAULT_DIR, help="出力先のディレクトリ")
+    parser.add_argument("--tables", default=",".join(TABLES), help="書き出す表（カンマ区切り）")
+    parser.add_argument("--fresh", action="store_true", help="前回の続きではなく最初から書き出す")
+    parser.add_argument("--url", default=None, help="Supabase の URL（省略時は secrets.toml / SUPABASE_URL）")
+    parser.add_argument("--key", default=None, help="Supabase の key（省略時は secrets.toml / SUPABASE_KEY）")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet" and not HAS_PYARROW:
+        parser.error("Parquet には pyarrow が必要です（pip install pyarrow）")
+    url, key = supabase_connection(args.url, args.key)
+    if not url or not key:
+        parser.error("接続先がありません（--url / --key か .streamlit/secrets.toml）")
+
+    from supabase import create_client
+    client = create_client(url, key)
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+
+    started = time.perf_counter()
+    last = [None]
+
+    def progress(table, rows, total):
+        if last[0] not in (None, table):
+            print(file=sys.stderr)
+        last[0] = table
+        _print_progress(table, rows, total)
+
+    result = export_all(client, args.out, tables, fmt=args.format, fresh=args.fresh, progress=progress)
+    print(file=sys.stderr)
+    for table, entry in result.items():
+        print(f"{table}: {entry['rows']:,} rows (+{entry['added']:,} this run) -> {', '.join(entry['files'])}")
+    if not args.fresh:
+        print("前回の続きに増えた行だけを足しました（書き換わった行も反映するには --fresh）", file=sys.stderr)
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
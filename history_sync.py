@@ -0,0 +1,119 @@
+"""小学生の履歴のプロセス内キャッシュ（差分同期）
+
+ログインのたび・新しいセッションのたびに logs_student の履歴を全部読み直すのではなく、
+1人ぶんの履歴を「どこまで読んだか（updated_at の最大値 = 高水位）」と一緒に覚えておき、
+次からはそれより新しい行だけを読んで日付ごとに上書きする。
+
+同じ日付の行は id の大きい方が新しい（差分方式の古い行が残っていても、1日1行でも同じ）。
+updated_at は書き込んだ時刻でコミットはそれより遅れるので、後からコミットされた行を
+取りこぼさないよう高水位より LOOKBACK 秒前から読む（同じ行を2回読んでも結果は変わらない）。
+
+Streamlit の @st.cache_resource で1プロセスに1つだけ作って共有する想定。
+"""
+import datetime
+import threading
+from collections import OrderedDict
+
+LOOKBACK = datetime.timedelta(seconds=5)
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+class HistorySnapshot:
+    """1人ぶんの履歴 {日付: (行id, [やったことリスト])} と高水位"""
+
+    __slots__ = ("days", "high_water")
+
+    def __init__(self):
+        self.days = {}
+        self.high_water = None
+
+    def merge(self, rows, advance=True):
+        """行（id / target_date / actions_str / updated_at）を取り込み、変わった日数を返す
+
+        advance=False なら高水位は動かさない（自分の保存の結果だけ先に反映するとき。
+        他のワーカーでの保存を取りこぼさないよう、次の同期は元の高水位から読む）。
+        """
+        changed = 0
+        for row in rows or []:
+            d = row.get("target_date")
+            if not d:
+                continue
+            rid = row.get("id") or 0
+            current = self.days.get(d)
+            if current is None or rid >= current[0]:
+                actions = row.get("actions_str")
+                entry = (rid, str(actions).split(", ") if actions else [])
+                if entry != current:
+                    self.days[d] = entry
+                    changed += 1
+            t = _parse_time(row.get("updated_at")) if advance else None
+            if t is not None and (self.high_water is None or t > self.high_water):
+                self.high_water = t
+        return changed
+
+    def since(self):
+        """次に読む updated_at の下限（ISO 文字列。まだ読んでいなければ None）"""
+        if self.high_water is None:
+            return None
+        return (self.high_water - LOOKBACK).isoformat(timespec="microseconds")
+
+    def history(self):
+        return {d: list(actions) for d, (_, actions) in self.days.items()}
+
+
+class HistoryCache:
+    """user_id → HistorySnapshot（新しく使った順に max_users 人まで）"""
+
+    def __init__(self, max_users=20000):
+        self._max = max_users
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def since(self, user_id):
+        """この人の次に読む updated_at の下限（覚えていなければ None。None なら全部読む）"""
+        with self._lock:
+            snap = self._users.get(user_id)
+            if snap is None:
+                return None
+            self._users.move_to_end(user_id)
+            return snap.since()
+
+    def replace(self, user_id, rows):
+        """全部読んだ行で置き換えて履歴を返す"""
+        snap = HistorySnapshot()
+        snap.merge(rows)
+        with self._lock:
+            self._users[user_id] = snap
+            self._users.move_to_end(user_id)
+            while len(self._users) > self._max:
+                self._users.popitem(last=False)
+            return snap.history()
+
+    def merge(self, user_id, rows, advance=True):
+        """新しい行を足し込んで履歴を返す（覚えていなければ None）"""
+        with self._lock:
+            snap = self._users.get(user_id)
+            if snap is None:
+                return None
+            snap.merge(rows, advance=advance)
+            return snap.history()
+
+    def merge_saved(self, rows):
+        """保存で返ってきた行を、覚えている人の分だけ足し込む"""
+        by_user = {}
+        for row in rows or []:
+            by_user.setdefault(row.get("user_id"), []).append(row)
+        for user_id, mine in by_user.items():
+            self.merge(user_id, mine, advance=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
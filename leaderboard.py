@@ -0,0 +1,92 @@
+"""分別ゲームのランキング（プロセス共通・メモリ上）
+
+ランキング表示のたびに game_scores へ order + limit のクエリを投げる代わりに、
+上位 N 件だけを「歴代」と「日別」のヒープで持っておき、表示はメモリから読む。
+save_game_log で記録を保存したら add() で書き込み時に反映する。
+
+別プロセス（別ワーカー）で保存された記録は、ttl ごとの再読み込みで取り込まれる。
+読み込みに失敗したら前のランキングのまま、retry_after 秒は読み直さない（DB が落ちている間の連打を防ぐ）。
+"""
+import datetime
+import heapq
+import itertools
+import threading
+import time
+
+
+class Leaderboard:
+    """タイムが短い順の上位 size 件を保持するランキング"""
+
+    def __init__(self, loader, size=20, ttl=300, retry_after=30):
+        # loader: (date_str or None, limit) -> [{"name", "school", "time", "date"}, ...]
+        #   date_str が None なら歴代、日付なら その日の上位を返す
+        self._loader = loader
+        self._size = size
+        self._ttl = ttl
+        self._retry_after = retry_after
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._all = []
+        self._daily = {}
+        self._loaded_at = {}
+        self._failed_at = {}
+
+    def top(self, mode="all", n=10, date=None):
+        """上位 n 件をタイムの短い順に返す（mode: "all" / "daily"）"""
+        day = None if mode == "all" else (date or datetime.date.today().isoformat())
+        self._ensure_loaded(day)
+        with self._lock:
+            heap = self._all if day is None else self._daily.get(day, [])
+            entries = [e for _, _, e in heap]
+        entries.sort(key=lambda e: e["time"])
+        return entries[:n]
+
+    def add(self, entry):
+        """新しい記録を反映する（保存直後に呼ぶ）"""
+        day = entry.get("date")
+        with self._lock:
+            self._push(self._all, entry)
+            if day in self._daily:
+                self._push(self._daily, entry, day)
+
+    def refresh(self, date=None):
+        """DB から上位を読み直す"""
+        day = date
+        try:
+            rows = self._loader(day, self._size)
+        except Exception:
+            with self._lock:
+                self._failed_at[day] = time.monotonic()
+            return
+        heap = []
+        for row in rows:
+            self._push_into(heap, row)
+        with self._lock:
+            if day is None:
+                self._all = heap
+            else:
+                # 古い日付は持ち続けない
+                self._daily = {day: heap}
+            self._loaded_at[day] = time.monotonic()
+
+    def _ensure_loaded(self, day):
+        with self._lock:
+            loaded_at = self._loaded_at.get(day)
+            failed_at = self._failed_at.get(day)
+        now = time.monotonic()
+        if failed_at is not None and now - failed_at < self._retry_after:
+            return
+        if loaded_at is None or now - loaded_at >= self._ttl:
+            self.refresh(day)
+
+    def _push(self, target, entry, day=None):
+        heap = target if day is None else target[day]
+        self._push_into(heap, entry)
+
+    def _push_into(self, heap, entry):
+        # heapq は最小ヒープなので、タイムを負にして「最も遅い記録」を先頭に置く
+        item = (-float(entry["time"]), next(self._seq), entry)
+        if len(heap) < self._size:
+            heapq.heappush(heap, item)
+        elif item[0] > heap[0][0]:
+            heapq.heapreplace(heap, item)
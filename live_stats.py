@@ -0,0 +1,81 @@
+"""全体統計のプロセス内アキュムレータ
+
+保存のたびにキャッシュを捨てて logs_student を全件集計し直すのではなく、
+保存ごとの差分（ポイント増減・新規参加・ヒーロー認定）をその場で足し込み、
+一定間隔でだけ DB から全件集計して「答え合わせ」する。
+
+Streamlit の @st.cache_resource で1プロセスに1つだけ作って共有する想定。
+別プロセス（別ワーカー）での保存は、次の答え合わせのタイミングで反映される。
+
+loader を渡さなければ自分では答え合わせせず、load() で外から値を入れてもらう
+（refresher.py のワーカースレッドに任せて、読む側を待たせないとき）。
+"""
+import threading
+import time
+
+
+class StatsAccumulator:
+    """CO2削減量・ヒーロー数・参加者数を差分で更新する集計器"""
+
+    def __init__(self, loader=None, reconcile_interval=600):
+        # loader: () -> (total_co2, total_heroes, total_participants)
+        self._loader = loader
+        self._interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._reconciling = False
+        self._co2 = 0
+        self._heroes = 0
+        self._participants = 0
+        self._loaded_at = None
+
+    def snapshot(self):
+        """現在の集計値を返す（期限切れなら答え合わせしてから返す）"""
+        if self._loader is not None and self._is_stale():
+            self.reconcile()
+        with self._lock:
+            return self._co2, self._heroes, self._participants
+
+    def apply(self, diff_points=0, new_participant=False, new_hero=False):
+        """1回の保存ぶんの差分を足し込む（O(1)）"""
+        with self._lock:
+            if self._loaded_at is None:
+                # まだ一度も全件集計していない場合は、次の読み込みに任せる
+                return
+            self._co2 += int(diff_points)
+            if new_participant: self._participants += 1
+            if new_hero: self._heroes += 1
+
+    def reconcile(self):
+        """DB から全件集計して値を置き換える（同時に走るのは1本だけ）"""
+        with self._lock:
+            if self._reconciling:
+                return
+            self._reconciling = True
+        try:
+            co2, heroes, participants = self._loader()
+        except Exception:
+            co2 = None
+        finally:
+            with self._lock:
+                self._reconciling = False
+        if co2 is None:
+            return
+        self.load((co2, heroes, participants))
+
+    def load(self, values):
+        """全件集計の結果 (CO2, ヒーロー数, 参加者数) で置き換える"""
+        co2, heroes, participants = values
+        with self._lock:
+            self._co2, self._heroes, self._participants = int(co2), int(heroes), int(participants)
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        """次の snapshot で必ず答え合わせさせる"""
+        with self._lock:
+            self._loaded_at = None
+
+    def _is_stale(self):
+        with self._lock:
+            if self._loaded_at is None:
+                return True
+            return time.monotonic() - self._loaded_at >= self._interval
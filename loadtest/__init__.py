@@ -0,0 +1,6 @@
+"""本物の Streamlit アプリに仮想ユーザーをつないで負荷をかける試験ツール
+
+使い方は loadtest/__main__.py を参照（python -m loadtest --help）。
+streamlit と同じ環境で動く（WebSocket は streamlit が依存している tornado を使う）。
+psutil があれば RSS の計測に使い、無ければ /proc から読む。
+"""
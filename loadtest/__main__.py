@@ -0,0 +1,232 @@
+"""python -m loadtest --app visitor --vusers 500 --ramp 60 --users 90000
+
+1. localbase（ローカルの代替バックエンド）を合成データ入りで起動
+2. そこにつながる secrets.toml を作業ディレクトリに書いて、streamlit run で本物のアプリを起動
+3. 仮想ユーザーを ramp 秒かけて順に投入し、WebSocket 越しにシナリオを実行
+4. ステップごとの p50 / p95 / p99、rerun 回数、バックエンドへのリクエスト数、
+   Streamlit プロセスのメモリ（RSS）を表示（--json で保存も可）
+
+既に起動しているサーバーを測るときは --url / --backend-url を指定する（RSS は --pid で）。
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+from localbase import create_store, seed, make_server
+from localbase.__main__ import DUMMY_KEY
+from loadtest.report import Report
+from loadtest.scenarios import SCENARIOS
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_of(pid):
+    """プロセスの常駐メモリ（バイト）。取れなければ None"""
+    if pid is None:
+        return None
+    if HAS_PSUTIL:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+# ==========================================
+#  バックエンド（localbase）
+# ==========================================
+
+class Backend:
+    def __init__(self, url, store=None, server=None):
+        self.url = url
+        self.store = store
+        self.server = server
+
+    @classmethod
+    def start(cls, args):
+        if args.backend_url:
+            return cls(args.backend_url.rstrip("/"))
+        store = create_store()
+        started = time.perf_counter()
+        counts = seed(store, users=args.users, rows_per_user=args.rows_per_user, random_seed=args.seed)
+        print(f"localbase: seeded {counts} in {time.perf_counter() - started:.1f}s", flush=True)
+        server = make_server(store, "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return cls(f"http://127.0.0.1:{server.server_address[1]}", store, server)
+
+    def stats(self):
+        if self.store is not None:
+            return self.store.snapshot_stats()
+        with urllib.request.urlopen(f"{self.url}/__localbase/stats") as r:
+            return json.load(r)
+
+    def reset_stats(self):
+        if self.store is not None:
+            return self.store.reset_stats()
+        urllib.request.urlopen(urllib.request.Request(f"{self.url}/__localbase/stats", method="DELETE")).close()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+# ==========================================
+#  Streamlit
+# ==========================================
+
+class App:
+    def __init__(self, url, proc=None, workdir=None):
+        self.url = url
+        self.proc = proc
+        self.workdir = workdir
+
+    @property
+    def pid(self):
+        return self.proc.pid if self.proc else None
+
+    @classmethod
+    def start(cls, script, backend_url, port):
+        # secrets.toml はカレントディレクトリの .streamlit/ から読まれるので、
+        # リポジトリの secrets を書き換えずに一時ディレクトリから起動する
+        workdir = tempfile.mkdtemp(prefix="decokatsu-loadtest-")
+        conf_dir = os.path.join(workdir, ".streamlit")
+        os.makedirs(conf_dir)
+        config = os.path.join(REPO_DIR, ".streamlit", "config.toml")
+        if os.path.exists(config):
+            shutil.copy(config, conf_dir)
+        with open(os.path.join(conf_dir, "secrets.toml"), "w", encoding="utf-8") as f:
+            f.write(f'[supabase]\nurl = "{backend_url}"\nkey = "{DUMMY_KEY}"\n')
+
+        log = open(os.path.join(workdir, "streamlit.log"), "w")
+        proc = subprocess.Popen([
+            sys.executable, "-m", "streamlit", "run", os.path.join(REPO_DIR, script),
+            "--server.port", str(port),
+            "--server.headless", "true",
+            "--server.fileWatcherType", "none",
+            "--browser.gatherUsageStats", "false",
+        ], cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        app = cls(f"http://127.0.0.1:{port}", proc, workdir)
+        app.wait_healthy()
+        return app
+
+    def wait_healthy(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc is not None and self.proc.poll() is not None:
+                raise RuntimeError(f"streamlit exited (log: {self.workdir}/streamlit.log)")
+            try:
+                with urllib.request.urlopen(f"{self.url}/_stcore/health", timeout=2) as r:
+                    if r.status == 200:
+                        return
+            except OSError:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError(f"streamlit did not become healthy in {timeout}s")
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(10)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            print(f"streamlit log: {self.workdir}/streamlit.log")
+
+
+# ==========================================
+#  実行
+# ==========================================
+
+async def drive(args, app_url, report, pid):
+    scenario_cls = SCENARIOS[args.app]
+    started = time.perf_counter()
+    done = asyncio.Event()
+
+    async def sample_memory():
+        while not done.is_set():
+            report.sample_memory(time.perf_counter() - started, rss_of(pid))
+            try:
+                await asyncio.wait_for(done.wait(), timeout=args.sample_interval)
+            except asyncio.TimeoutError:
+                pass
+        report.sample_memory(time.perf_counter() - started, rss_of(pid))
+
+    async def vuser(k):
+        await asyncio.sleep(args.ramp * k / max(args.vusers, 1))
+        scenario = scenario_cls(app_url, args.first_user + k, report.record,
+                                think_time=args.think, game_seconds=args.game_seconds)
+        try:
+            await scenario.run()
+        finally:
+            report.sessions += 1
+
+    sampler = asyncio.ensure_future(sample_memory())
+    await asyncio.gather(*(vuser(k) for k in range(args.vusers)))
+    done.set()
+    await sampler
+    report.wall_time = time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description="Streamlit アプリの負荷試験")
+    parser.add_argument("--app", choices=sorted(SCENARIOS), default="visitor", help="対象のアプリ（visitor.py / app.py）")
+    parser.add_argument("--vusers", type=int, default=100, help="仮想ユーザー数")
+    parser.add_argument("--ramp", type=float, default=30.0, help="全員を投入し終えるまでの秒数")
+    parser.add_argument("--think", type=float, default=1.0, help="ステップ間の平均待ち時間（秒）")
+    parser.add_argument("--game-seconds", type=float, default=6.0, help="ゲームのプレイ時間（秒）")
+    parser.add_argument("--first-user", type=int, default=0, help="合成データの何番目の小学生から使うか")
+    parser.add_argument("--users", type=int, default=90000, help="合成データの小学生の人数")
+    parser.add_argument("--rows-per-user", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8599, help="起動する streamlit のポート")
+    parser.add_argument("--url", help="起動済みの Streamlit の URL（指定するとアプリを起動しない）")
+    parser.add_argument("--backend-url", help="起動済みの localbase の URL（指定すると localbase を起動しない）")
+    parser.add_argument("--pid", type=int, help="--url 指定時に RSS を測る Streamlit のプロセスID")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="メモリを測る間隔（秒）")
+    parser.add_argument("--json", help="結果を JSON で保存するパス")
+    args = parser.parse_args(argv)
+
+    if args.url and not args.backend_url:
+        parser.error("--url を指定するときは --backend-url も指定してください")
+
+    backend = Backend.start(args)
+    app = App(args.url) if args.url else App.start(SCENARIOS[args.app].app, backend.url, args.port)
+    pid = args.pid or app.pid
+    report = Report()
+    try:
+        backend.reset_stats()
+        asyncio.run(drive(args, app.url, report, pid))
+        report.backend = backend.stats()
+    finally:
+        app.stop()
+        backend.stop()
+
+    print(report.format())
+    if args.json:
+        report.to_json(args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Streamlit のブラウザ側の代わりをする WebSocket クライアント
+
+ブラウザと同じく /_stcore/stream に接続し、BackMsg(rerun_script) を送って
+ForwardMsg を受け取る。画面に出た要素（ウィジェット・コンポーネント）を delta_path ごとに
+覚えておき、ラベルで探して値を入れ、もう一度 rerun_script を送る。
+
+    session = StreamlitSession("http://127.0.0.1:8501")
+    await session.connect()
+    await session.run()                                   # 初回表示
+    session.set_text("小学校名", "倉敷")
+    await session.click("ミッション スタート！")            # フォーム送信
+
+1回の操作で st.rerun() が何回起きたかは RunResult.runs に入る。
+"""
+import json
+import time
+
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+STREAM_PATH = "/_stcore/stream"
+MAX_MESSAGE_SIZE = 200 * 1024 * 1024
+
+# script_finished の値（ForwardMsg.ScriptFinishedStatus）
+_FINISHED_DONE = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR)
+_FINISHED_EARLY = ForwardMsg.FINISHED_EARLY_FOR_RERUN
+
+
+class ProtocolError(Exception):
+    """画面に期待した要素が無い・スクリプトが例外で終わった など"""
+
+
+class RunResult:
+    """1回の操作（rerun_script を1回送ってから、スクリプトが最後まで走り終わるまで）"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.runs = 0
+        self.exceptions = []
+
+    @property
+    def ok(self):
+        return not self.exceptions
+
+
+class StreamlitSession:
+    """1人分のブラウザタブ"""
+
+    def __init__(self, base_url, query_string="", timeout=120):
+        self.url = base_url.replace("http://", "ws://").replace("https://", "wss://").rstrip("/") + STREAM_PATH
+        self.query_string = query_string
+        self.timeout = timeout
+        self.conn = None
+        self.elements = {}        # delta_path → Element
+        self.widgets = {}         # ウィジェットID → WidgetState（毎回の rerun で送り直す値）
+        self._triggers = {}       # ボタンなど、1回送ったら消える値
+        self._cache = {}          # ForwardMsg のハッシュ → メッセージ（ref_hash 用）
+
+    async def connect(self):
+        self.conn = await websocket_connect(self.url, subprotocols=["streamlit"], max_message_size=MAX_MESSAGE_SIZE)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # --- 送受信 ---
+
+    async def run(self):
+        """今のウィジェットの値で rerun_script を送り、スクリプトが止まるまで待つ"""
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.query_string = self.query_string
+        for ws in list(self.widgets.values()) + list(self._triggers.values()):
+            state.widget_states.widgets.add().CopyFrom(ws)
+        self._triggers.clear()
+
+        result = RunResult()
+        await self.conn.write_message(msg.SerializeToString(), binary=True)
+        await self._read_until_finished(result)
+        result.elapsed = time.perf_counter() - result.started
+        return result
+
+    async def _read_until_finished(self, result):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if time.monotonic() > deadline:
+                raise ProtocolError(f"script did not finish within {self.timeout}s")
+            raw = await self.conn.read_message()
+            if raw is None:
+                raise ProtocolError("websocket closed")
+            if isinstance(raw, str):
+                continue
+            fmsg = ForwardMsg()
+            fmsg.ParseFromString(raw)
+            fmsg = self._resolve(fmsg)
+            kind = fmsg.WhichOneof("type")
+            if kind == "new_session":
+                # スクリプトの実行ごとに届く（st.rerun() でもう一度届く）
+                result.runs += 1
+                self.elements.clear()
+            elif kind == "delta":
+                self._apply_delta(fmsg, result)
+            elif kind == "script_finished":
+                if fmsg.script_finished in _FINISHED_DONE:
+                    if fmsg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                        result.exceptions.append("compile error")
+                    return
+                if fmsg.script_finished != _FINISHED_EARLY:
+                    return # フラグメントの実行など
+
+    def _resolve(self, fmsg):
+        """キャッシュ済みメッセージの参照（ref_hash）を元のメッセージに戻す"""
+        if fmsg.WhichOneof("type") == "ref_hash":
+            cached = self._cache.get(fmsg.ref_hash)
+            if cached is None:
+                return fmsg
+            full = ForwardMsg()
+            full.CopyFrom(cached)
+            full.metadata.CopyFrom(fmsg.metadata)
+            return full
+        if fmsg.hash and fmsg.metadata.cacheable:
+            self._cache[fmsg.hash] = fmsg
+        return fmsg
+
+    def _apply_delta(self, fmsg, result):
+        delta = fmsg.delta
+        if delta.WhichOneof("type") != "new_element":
+            return
+        path = tuple(fmsg.metadata.delta_path)
+        element = delta.new_element
+        self.elements[path] = element
+        if element.WhichOneof("type") == "exception":
+            result.exceptions.append(f"{element.exception.type}: {element.exception.message}")
+
+    # --- 画面の要素を探す ---
+
+    def find_all(self, kind):
+        """種類（"button" / "text_input" / "component_instance" など）の要素を画面の上から順に"""
+        found = []
+        for path in sorted(self.elements):
+            element = self.elements[path]
+            if element.WhichOneof("type") == kind:
+                found.append(getattr(element, kind))
+        return found
+
+    def find(self, kind, label=None, predicate=None):
+        for widget in self.find_all(kind):
+            if label is not None and getattr(widget, "label", None) != label:
+                continue
+            if predicate is not None and not predicate(widget):
+                continue
+            return widget
+        raise ProtocolError(f"{kind} {label or ''} not found on screen")
+
+    def has(self, kind, label=None, predicate=None):
+        try:
+            self.find(kind, label, predicate)
+            return True
+        except ProtocolError:
+            return False
+
+    def find_component(self, name_part, predicate=None):
+        """component_name に name_part を含むカスタムコンポーネント（json_args は dict にして渡す）"""
+        def match(c):
+            if name_part not in c.component_name:
+                return False
+            return predicate is None or predicate(json.loads(c.json_args or "{}"))
+        return self.find("component_instance", predicate=match)
+
+    def text(self):
+        """画面の markdown をつなげた文字列（表示内容の確認用）"""
+        return "\n".join(m.body for m in self.find_all("markdown"))
+
+    # --- 値を入れる ---
+
+    def _state(self, widget_id):
+        ws = WidgetState()
+        ws.id = widget_id
+        self.widgets[widget_id] = ws
+        return ws
+
+    def set_text(self, label, value):
+        self._state(self.find("text_input", label).id).string_value = value
+
+    def set_number(self, label, value):
+        widget = self.find("number_input", label)
+        if isinstance(value, int):
+            self._state(widget.id).int_value = value
+        else:
+            self._state(widget.id).double_value = float(value)
+
+    def select(self, label, option):
+        """selectbox の選択肢を文字列で選ぶ（送るのは index）"""
+        widget = self.find("selectbox", label)
+        self._state(widget.id).int_value = list(widget.options).index(option)
+
+    def set_component(self, component, value):
+        """カスタムコンポーネントから Streamlit.setComponentValue(value) が届いたことにする"""
+        self._state(component.id).json_value = json.dumps(value, ensure_ascii=False)
+
+    def edit_data(self, editor, edited_rows):
+        """data_editor のセルを書き換える {行番号: {列名: 値}}"""
+        state = {"edited_rows": {str(k): v for k, v in edited_rows.items()}, "added_rows": [], "deleted_rows": []}
+        self._state(editor.id).string_value = json.dumps(state, ensure_ascii=False)
+
+    def data_editor(self):
+        """画面上の最初の data_editor（編集できる表）"""
+        return self.find("arrow_data_frame", predicate=lambda a: bool(a.id))
+
+    async def click(self, label):
+        """ボタン（フォームの送信ボタンを含む）を押して、走り終わるまで待つ"""
+        ws = WidgetState()
+        ws.id = self.find("button", label).id
+        ws.trigger_value = True
+        self._triggers[ws.id] = ws
+        return await self.run()
@@ -0,0 +1,114 @@
+"""負荷試験の集計と表示"""
+import json
+import math
+
+
+def percentile(values, p):
+    """p（0〜100）パーセンタイル（最近傍法）。空なら None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[k]
+
+
+class Report:
+    """ステップごとの所要時間・スクリプト実行回数・エラーを集める"""
+
+    def __init__(self):
+        self.steps = {}       # ステップ名 → [Step]
+        self.order = []
+        self.memory = []      # [(経過秒, RSS バイト)]
+        self.backend = {}
+        self.sessions = 0
+        self.wall_time = 0.0
+
+    def record(self, step):
+        if step.name not in self.steps:
+            self.steps[step.name] = []
+            self.order.append(step.name)
+        self.steps[step.name].append(step)
+
+    def sample_memory(self, at, rss):
+        if rss is not None:
+            self.memory.append((at, rss))
+
+    def summary(self):
+        steps = {}
+        for name in self.order:
+            items = self.steps[name]
+            ok = [s for s in items if s.ok]
+            times = [s.elapsed for s in ok]
+            errors = {}
+            for s in items:
+                if not s.ok:
+                    errors[s.error] = errors.get(s.error, 0) + 1
+            steps[name] = {
+                "count": len(items),
+                "errors": len(items) - len(ok),
+                "p50": percentile(times, 50),
+                "p95": percentile(times, 95),
+                "p99": percentile(times, 99),
+                "max": max(times) if times else None,
+                "runs_mean": sum(s.runs for s in ok) / len(ok) if ok else None,
+                "error_samples": dict(sorted(errors.items(), key=lambda kv: -kv[1])[:5]),
+            }
+
+        requests = {k: v for k, v in self.backend.get("requests", {}).items() if not k.startswith("rows ")}
+        total_requests = sum(requests.values())
+        rss = [r for _, r in self.memory]
+        return {
+            "sessions": self.sessions,
+            "wall_time": self.wall_time,
+            "steps": steps,
+            "backend": {
+                "requests": total_requests,
+                "requests_per_session": total_requests / self.sessions if self.sessions else None,
+                "rows_read": self.backend.get("requests", {}).get("rows read", 0),
+                "rows_written": self.backend.get("requests", {}).get("rows written", 0),
+                "by_kind": dict(sorted(requests.items(), key=lambda kv: -kv[1])),
+            },
+            "memory": {
+                "rss_start": rss[0] if rss else None,
+                "rss_peak": max(rss) if rss else None,
+                "rss_end": rss[-1] if rss else None,
+            },
+        }
+
+    def to_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    def format(self):
+        s = self.summary()
+        lines = [f"sessions: {s['sessions']}   wall time: {s['wall_time']:.1f}s", ""]
+        lines.append(f"{'step':<12}{'count':>7}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'reruns':>8}")
+        for name, st in s["steps"].items():
+            lines.append(
+                f"{name:<12}{st['count']:>7}{st['errors']:>8}"
+                f"{_sec(st['p50'])}{_sec(st['p95'])}{_sec(st['p99'])}{_sec(st['max'])}"
+                f"{'' if st['runs_mean'] is None else format(st['runs_mean'], '.2f'):>8}"
+            )
+        for name, st in s["steps"].items():
+            for err, n in st["error_samples"].items():
+                lines.append(f"  ! {name}: {n} x {err}")
+
+        b = s["backend"]
+        lines += ["", f"backend requests: {b['requests']}"
+                      + (f"  ({b['requests_per_session']:.1f} / session)" if b["requests_per_session"] is not None else "")
+                      + f"   rows read: {b['rows_read']}   rows written: {b['rows_written']}"]
+        for kind, n in list(b["by_kind"].items())[:10]:
+            lines.append(f"  {kind:<28}{n:>8}")
+
+        m = s["memory"]
+        if m["rss_peak"] is not None:
+            lines += ["", f"worker RSS: start {_mb(m['rss_start'])}  peak {_mb(m['rss_peak'])}  end {_mb(m['rss_end'])}"]
+        return "\n".join(lines)
+
+
+def _sec(v):
+    return f"{'-':>9}" if v is None else f"{v:>8.2f}s"
+
+
+def _mb(v):
+    return f"{v / 1024 / 1024:.0f}MB"
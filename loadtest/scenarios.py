@@ -0,0 +1,193 @@
+"""仮想ユーザーの動き（1人ぶんのシナリオ）
+
+どのシナリオも「ログイン → Cookie 自動ログイン → チェック表の保存 → 分別ゲーム」の順に進み、
+各ステップの所要時間と、そのステップで走ったスクリプトの回数を record() に渡す。
+visitor.py には Cookie 自動ログインが無いので、そのステップは記録しない。
+
+ユーザーは localbase の合成データ（localbase/seed.py）の i 番目の小学生を使う。
+"""
+import asyncio
+import json
+import random
+
+from localbase.seed import student_id, student_pin, is_app_student
+from loadtest.protocol import StreamlitSession, ProtocolError
+
+COOKIE_NAME = "decokatsu_user_id"
+
+
+class Step:
+    """1ステップの結果"""
+
+    def __init__(self, name, elapsed=0.0, runs=0, error=None):
+        self.name = name
+        self.elapsed = elapsed
+        self.runs = runs
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class Scenario:
+    """1人分の流れ。run_step() で1ステップずつ計測する"""
+
+    app = None
+
+    def __init__(self, base_url, user_index, record, think_time=1.0, game_seconds=6.0, rng=None):
+        self.base_url = base_url
+        self.i = user_index
+        self.record = record
+        self.think_time = think_time
+        self.game_seconds = game_seconds
+        self.rng = rng or random.Random(user_index)
+        self.user_id = student_id(user_index)
+
+    def session(self):
+        return StreamlitSession(self.base_url)
+
+    async def think(self):
+        if self.think_time:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+    async def run_step(self, name, action):
+        """action() は RunResult のリストを返す。合計時間とスクリプト実行回数を記録する"""
+        step = Step(name)
+        try:
+            results = await action()
+            step.elapsed = sum(r.elapsed for r in results)
+            step.runs = sum(r.runs for r in results)
+            errors = [e for r in results for e in r.exceptions]
+            if errors:
+                step.error = errors[0]
+        except (ProtocolError, OSError, asyncio.TimeoutError) as e:
+            step.error = f"{type(e).__name__}: {e}"
+        self.record(step)
+        return step.ok
+
+    async def run(self):
+        raise NotImplementedError
+
+    # --- 共通の操作 ---
+
+    async def play_game(self, session, component_name, answer_key):
+        """ゲームのコンポーネントに全問正解の結果を返す（実時間で game_seconds 待ってから）"""
+        game = session.find_component(component_name)
+        args = _json_args(game)
+        await asyncio.sleep(self.game_seconds)
+        answers = [q[answer_key] for q in args["questions"]]
+        session.set_component(game, {"game_id": args["game_id"], "answers": answers, "elapsed": self.game_seconds})
+        return [await session.run()]
+
+    def random_edit(self, session, columns):
+        editor = session.data_editor()
+        row = self.rng.randrange(5)
+        session.edit_data(editor, {row: {self.rng.choice(columns): self.rng.random() < 0.7}})
+
+
+def _json_args(component):
+    return json.loads(component.json_args or "{}")
+
+
+class VisitorScenario(Scenario):
+    """visitor.py: ログインフォーム → チェック表 → 分別ゲーム（10問）"""
+
+    app = "visitor.py"
+    DATES = ["6/1 (月)", "6/2 (火)", "6/3 (水)", "6/4 (木)"]
+
+    async def run(self):
+        school, grade, u_class, number = self.user_id.split("_")
+        session = self.session()
+        try:
+            await session.connect()
+
+            async def login():
+                first = await session.run()
+                session.set_text("小学校名", school[:-len("小学校")])
+                session.select("学年", grade)
+                session.set_text("組（クラス）", u_class)
+                session.set_number("出席番号", int(number))
+                session.set_text("ニックネーム（ひらがな）", f"ユーザー{self.i}")
+                return [first, await session.click("ミッション スタート！")]
+
+            if not await self.run_step("login", login):
+                return
+            await self.think()
+
+            async def save():
+                self.random_edit(session, self.DATES)
+                return [await session.click("✅ チェックした 内容（ないよう）を ほぞん する")]
+
+            await self.run_step("save", save)
+            await self.think()
+            await self.run_step("game", lambda: self.play_game(session, "sorting_game", "type"))
+        finally:
+            session.close()
+
+
+class AppScenario(Scenario):
+    """app.py: 小学生ログイン（あいことば）→ 別タブで Cookie 自動ログイン → チェック表 → 分別ゲーム（5問）"""
+
+    app = "app.py"
+    DATES = ["6/1(月)", "6/2(火)", "6/3(水)", "6/4(木)"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # あいことば付きで作られているのは偶数番目（localbase/seed.py）なので番号を2倍して使う
+        self.i = self.i * 2
+        assert is_app_student(self.i)
+        self.user_id = student_id(self.i)
+        self.pin = student_pin(self.i)
+
+    async def run(self):
+        school, grade, u_class, number = self.user_id.split("_")
+        session = self.session()
+        try:
+            await session.connect()
+
+            async def login():
+                first = await session.run()
+                entered = await session.click("🎒 小学生のみんな\n(エコヒーロー)")
+                session.set_text("小学校名", school[:-len("小学校")])
+                session.select("学年", grade)
+                session.set_text("組", u_class)
+                session.set_number("出席番号", int(number))
+                session.set_text("あいことば (数字4桁)", self.pin)
+                return [first, entered, await session.click("スタート！")]
+
+            if not await self.run_step("login", login):
+                return
+        finally:
+            session.close()
+        await self.think()
+
+        # 次の日にもう一度開いた想定：新しいセッションで Cookie から自動ログイン
+        session = self.session()
+        try:
+            async def auto_login():
+                await session.connect()
+                first = await session.run()
+                cookies = session.find_component("cookie_manager", lambda a: a.get("method") == "getAll")
+                session.set_component(cookies, {COOKIE_NAME: self.user_id})
+                second = await session.run()
+                if not session.has("arrow_data_frame", predicate=lambda a: bool(a.id)):
+                    raise ProtocolError("auto-login did not reach the student screen")
+                return [first, second]
+
+            if not await self.run_step("auto_login", auto_login):
+                return
+            await self.think()
+
+            async def save():
+                self.random_edit(session, self.DATES)
+                return [await session.click("✅ 記録を保存する")]
+
+            await self.run_step("save", save)
+            await self.think()
+            await self.run_step("game", lambda: self.play_game(session, "sorting_game", "type"))
+        finally:
+            session.close()
+
+
+SCENARIOS = {"visitor": VisitorScenario, "app": AppScenario}
@@ -0,0 +1,16 @@
+"""Supabase (PostgREST) の代わりに使えるローカルのインメモリ・バックエンド
+
+app.py / admin.py / visitor.py が使う PostgREST API の一部
+（select・eq / in / gt などの絞り込み・order・limit・insert・upsert(on_conflict)・
+delete・rpc）だけを実装した HTTP サーバー。ネットワークの無い環境での動作確認や、
+同じデータで何度でも性能を測るためのもの。
+
+    python -m localbase --users 90000 --rows-per-user 4 --port 54321
+
+.streamlit/secrets.toml の [supabase] url をこのサーバーに向ければ、
+アプリ側のコードは変えずにそのまま動く（.streamlit/secrets.example.toml 参照）。
+"""
+from localbase.store import Store, QueryError
+from localbase.schema import create_store
+from localbase.seed import seed
+from localbase.server import serve, make_server
@@ -0,0 +1,347 @@
+"""アプリが使うテーブルと、sql/ のトリガー・RPC の Python 版
+
+sql/ に移行スクリプトを足したら、ここにも同じ動きを足す（ローカルと本番で結果を揃える）。
+"""
+from domain import is_hero_row, encode_actions, actions_of, action_counts
+from rollups import Rollup
+from localbase.store import Store, Filter, QueryError, now_iso
+
+
+def create_store(audit=False):
+    """空のテーブルとトリガー・RPC を登録した Store を作る"""
+    store = Store()
+    store.create_table("logs_student", [
+        "id", "created_at", "user_id", "nickname", "pin_code", "school_name",
+        "target_date", "actions_str", "action_points", "memo", "q1", "q2", "q3", "updated_at", "actions_mask",
+    ], indexes=("user_id",), defaults={"created_at": now_iso, "updated_at": now_iso})
+    # sql/009_actions_mask.sql（ほかのトリガーが actions_mask を見られるよう最初に登録）
+    store.add_trigger("logs_student", student_mask_trigger, columns=("actions_str",))
+    store.create_table("logs_member", [
+        "id", "created_at", "user_name", "lom_name", "target_date", "action_label", "is_done", "points",
+    ], indexes=("user_name",), defaults={"created_at": now_iso})
+    store.create_table("game_scores", [
+        "id", "created_at", "name", "school", "time", "date",
+    ], indexes=("name", "date"), defaults={"created_at": now_iso})
+
+    # sql/002_lom_totals.sql
+    store.create_table("lom_totals", ["lom_name", "points", "updated_at"],
+                       primary_key=("lom_name",), serial=None,
+                       defaults={"points": lambda: 0, "updated_at": now_iso})
+    store.add_trigger("logs_member", lom_totals_trigger, columns=("lom_name", "points"))
+
+    # sql/003_game_best.sql
+    store.create_table("game_best", ["name", "school", "time", "updated_at"],
+                       primary_key=("name", "school"), serial=None,
+                       defaults={"updated_at": now_iso})
+    store.add_trigger("game_scores", game_best_trigger)
+
+    # sql/007_student_profiles.sql
+    store.create_table("student_profiles", [
+        "user_id", "pin_code", "nickname", "school_name", "total_points", "is_hero", "updated_at",
+    ], primary_key=("user_id",), serial=None,
+       defaults={"total_points": lambda: 0, "is_hero": lambda: False, "updated_at": now_iso})
+    store.add_trigger("logs_student", student_profiles_trigger)
+
+    # sql/008_student_updated_at.sql
+    store.add_trigger("logs_student", student_touch_trigger)
+
+    # sql/005_student_audit.sql（任意なので audit=True のときだけ）
+    if audit:
+        store.create_table("logs_student_audit", [
+            "id", "logged_at", "op", "log_id", "user_id", "target_date", "actions_str", "action_points", "diff_points",
+        ], indexes=("user_id",), defaults={"logged_at": now_iso})
+        store.add_trigger("logs_student", student_audit_trigger, columns=("actions_str", "action_points"))
+
+    # sql/010_rollups.sql（shard は分けずに 0 だけ）
+    store.create_table("rollups", ["id", "kind", "key", "shard", "row_count", "points", "updated_at"],
+                       indexes=("kind",),
+                       defaults={"shard": lambda: 0, "row_count": lambda: 0, "points": lambda: 0, "updated_at": now_iso})
+    # sql/011_rollups_hourly.sql（hour 系は rollups.py が作るので created_at を見るだけ）
+    store.add_trigger("logs_student", rollups_trigger("logs_student"),
+                      columns=("school_name", "target_date", "created_at", "action_points", "actions_str", "actions_mask"))
+    store.add_trigger("logs_member", rollups_trigger("logs_member"),
+                      columns=("action_label", "target_date", "created_at", "points"))
+    store.add_trigger("student_profiles", rollups_trigger("student_profiles"), columns=("school_name",))
+
+    store.add_function("get_dashboard_stats", get_dashboard_stats)
+    store.add_function("sync_member_logs", sync_member_logs)
+    store.add_function("compact_student_logs", compact_student_logs)
+    store.add_function("get_action_counts", get_action_counts)
+    store.add_function("rebuild_rollups", rebuild_rollups)
+    # sql/012_apply_rebuild.sql
+    store.add_function("rebuild_watermarks", rebuild_watermarks)
+    store.add_function("apply_rebuild", apply_rebuild)
+    return store
+
+
+# ==========================================
+#  トリガー
+# ==========================================
+
+def lom_totals_apply(store, lom_name, delta):
+    table = store.table("lom_totals")
+    row = table.find({"lom_name": lom_name})
+    if row is None:
+        store.insert("lom_totals", [{"lom_name": lom_name, "points": delta}])
+    else:
+        table._update(row, {"points": row["points"] + delta, "updated_at": now_iso()})
+
+
+def lom_totals_trigger(store, op, old, new):
+    if op in ("DELETE", "UPDATE") and old.get("lom_name") is not None:
+        lom_totals_apply(store, old["lom_name"], -int(old.get("points") or 0))
+    if op in ("INSERT", "UPDATE") and new.get("lom_name") is not None:
+        lom_totals_apply(store, new["lom_name"], int(new.get("points") or 0))
+
+
+def game_best_trigger(store, op, old, new):
+    if op != "INSERT" or new.get("name") is None or new.get("school") is None or new.get("time") is None:
+        return
+    table = store.table("game_best")
+    row = table.find({"name": new["name"], "school": new["school"]})
+    if row is None:
+        store.insert("game_best", [{"name": new["name"], "school": new["school"], "time": float(new["time"])}])
+    elif float(new["time"]) < row["time"]:
+        table._update(row, {"time": float(new["time"]), "updated_at": now_iso()})
+
+
+def student_mask_trigger(store, op, old, new):
+    """sql/009_actions_mask.sql（actions_str から actions_mask を作る）"""
+    if op != "DELETE":
+        store.table("logs_student")._update(new, {"actions_mask": encode_actions(actions_of(new))})
+
+
+def student_touch_trigger(store, op, old, new):
+    """sql/008_student_updated_at.sql（更新時に updated_at を今の時刻に）"""
+    if op == "UPDATE":
+        store.table("logs_student")._update(new, {"updated_at": now_iso()})
+
+
+def student_profiles_trigger(store, op, old, new):
+    """sql/007_student_profiles.sql"""
+    table = store.table("student_profiles")
+    if op in ("UPDATE", "DELETE") and old.get("user_id") is not None:
+        profile = table.find({"user_id": old["user_id"]})
+        if profile is not None:
+            mine, _ = store.table("logs_student").select([Filter("user_id", "eq", old["user_id"])])
+            hero = any(is_hero_row(r) for r in mine if op == "DELETE" or r["id"] != old["id"])
+            before = table._update(profile, {"total_points": profile["total_points"] - int(old.get("action_points") or 0),
+                                             "is_hero": hero, "updated_at": now_iso()})
+            store._fire("student_profiles", "UPDATE", before, profile)
+    if op in ("INSERT", "UPDATE") and new.get("user_id") is not None:
+        profile = table.find({"user_id": new["user_id"]})
+        points = int(new.get("action_points") or 0)
+        if profile is None:
+            store.insert("student_profiles", [{
+                "user_id": new["user_id"], "pin_code": new.get("pin_code") or None,
+                "nickname": new.get("nickname") or None, "school_name": new.get("school_name"),
+                "total_points": points, "is_hero": is_hero_row(new),
+            }])
+        else:
+            before = table._update(profile, {
+                "pin_code": new.get("pin_code") or profile["pin_code"],
+                "nickname": new.get("nickname") or profile["nickname"],
+                "school_name": new.get("school_name") or profile["school_name"],
+                "total_points": profile["total_points"] + points,
+                "is_hero": profile["is_hero"] or is_hero_row(new),
+                "updated_at": now_iso(),
+            })
+            store._fire("student_profiles", "UPDATE", before, profile)
+
+
+def student_audit_trigger(store, op, old, new):
+    """sql/005_student_audit.sql"""
+    if getattr(store, "compacting", False):
+        return
+    row = old if op == "DELETE" else new
+    points = 0 if op == "DELETE" else int(new.get("action_points") or 0)
+    before = int(old.get("action_points") or 0) if old else 0
+    store.insert("logs_student_audit", [{
+        "op": op.lower(), "log_id": row.get("id"), "user_id": row.get("user_id"),
+        "target_date": row.get("target_date"), "actions_str": row.get("actions_str"),
+        "action_points": points, "diff_points": points - before,
+    }])
+
+
+def rollups_apply(store, rollup):
+    """Rollup の差分を rollups 表に足し込む"""
+    table = store.table("rollups")
+    for (kind, key), (rows, points) in rollup.totals.items():
+        row = table.find({"kind": kind, "key": key, "shard": 0})
+        if row is None:
+            store.insert("rollups", [{"kind": kind, "key": key, "row_count": rows, "points": points}])
+        else:
+            table._update(row, {"row_count": row["row_count"] + rows, "points": row["points"] + points,
+                                "updated_at": now_iso()})
+
+
+def rollups_trigger(name):
+    """sql/010_rollups.sql（行ごとの足し方は rollups.py）"""
+    def trigger(store, op, old, new):
+        rollup = Rollup()
+        rollup.apply_change(name, old if op != "INSERT" else None, new if op != "DELETE" else None)
+        rollups_apply(store, rollup)
+    return trigger
+
+
+# ==========================================
+#  RPC
+# ==========================================
+
+def get_dashboard_stats(store, top_n=10):
+    """sql/001_dashboard_stats.sql（ヒーロー判定は 009 で actions_mask に）"""
+    students = store.table("logs_student").rows()
+    members = store.table("logs_member").rows()
+    heroes = {r["user_id"] for r in students if is_hero_row(r)}
+    heroes.discard(None)
+    users = {r["user_id"] for r in students} - {None}
+    member_names = {r["user_name"] for r in members} - {None}
+    ranking = []
+    if top_n:
+        ranking, _ = store.select("game_scores", order=[("time", False, False)], limit=int(top_n))
+    return {
+        "hero_count": len(heroes),
+        "participant_count": len(users) + len(member_names),
+        "total_co2": sum(int(r.get("action_points") or 0) for r in students)
+                     + sum(int(r.get("points") or 0) for r in members),
+        "ranking": ranking,
+    }
+
+
+def sync_member_logs(store, p_user_name, p_lom_name, p_inserts=(), p_deletes=()):
+    """sql/004_sync_member_logs.sql（Store のロック内で呼ばれるので1トランザクション相当）"""
+    table = store.table("logs_member")
+    mine, _ = table.select([Filter("user_name", "eq", p_user_name), Filter("lom_name", "eq", p_lom_name)])
+
+    targets = {(d.get("target_date"), d.get("action_label")) for d in p_deletes or []}
+    n_deleted = 0
+    for row in mine:
+        if (row.get("target_date"), row.get("action_label")) in targets:
+            table._remove(row)
+            store._fire("logs_member", "DELETE", row, None)
+            n_deleted += 1
+
+    existing = {(r.get("target_date"), r.get("action_label")) for r in mine} - targets
+    rows = []
+    for i in p_inserts or []:
+        key = (i.get("target_date"), i.get("action_label"))
+        if key in existing:
+            continue
+        existing.add(key)
+        rows.append({"user_name": p_user_name, "lom_name": p_lom_name, "target_date": key[0],
+                     "action_label": key[1], "is_done": True, "points": i.get("points")})
+    store.insert("logs_member", rows)
+    return n_deleted + len(rows)
+
+
+def compact_student_logs(store, max_groups=5000):
+    """sql/006_compact_student_logs.sql（まとめたグループ数を返す）"""
+    table = store.table("logs_student")
+    groups = {}
+    for row in table.rows():
+        if row.get("user_id") is None or row.get("target_date") is None:
+            continue
+        groups.setdefault((row["user_id"], row["target_date"]), []).append(row)
+    groups = [rows for rows in groups.values() if len(rows) > 1]
+    finished = len(groups) <= int(max_groups)
+    groups = groups[:int(max_groups)]
+
+    store.compacting = True
+    try:
+        for rows in groups:
+            rows.sort(key=lambda r: r["id"])
+            keep = rows[-1]
+            if "logs_student_audit" in store.tables:
+                store.insert("logs_student_audit", [{
+                    "logged_at": r.get("created_at"), "op": "compacted", "log_id": r["id"], "user_id": r["user_id"],
+                    "target_date": r["target_date"], "actions_str": r.get("actions_str"),
+                    "action_points": r.get("action_points"), "diff_points": r.get("action_points"),
+                } for r in rows])
+            nickname = next((r["nickname"] for r in reversed(rows) if r.get("nickname")), None)
+            pin_code = next((r["pin_code"] for r in reversed(rows) if r.get("pin_code")), None)
+            changes = {"action_points": sum(int(r.get("action_points") or 0) for r in rows)}
+            if nickname: changes["nickname"] = nickname
+            if pin_code: changes["pin_code"] = pin_code
+            old = table._update(keep, changes)
+            store._fire("logs_student", "UPDATE", old, keep)
+            for r in rows[:-1]:
+                table._remove(r)
+                store._fire("logs_student", "DELETE", r, None)
+    finally:
+        store.compacting = False
+    if finished and ("user_id", "target_date") not in table.unique:
+        # sql/006 の最後と同じ（まとめ終わったら一意インデックスを作る）
+        table.add_unique(("user_id", "target_date"), "logs_student_user_date_key")
+    return len(groups)
+
+
+def get_action_counts(store):
+    """sql/009_actions_mask_finish.sql"""
+    return action_counts(r.get("actions_mask") for r in store.table("logs_student").rows())
+
+
+def rebuild_rollups(store):
+    """sql/010_rollups.sql（Store のロック内で呼ばれるので書き込みは割り込まない）"""
+    rollup = Rollup()
+    for row in store.table("logs_student").rows():
+        rollup.add_student(row)
+    for row in store.table("logs_member").rows():
+        rollup.add_member(row)
+    for row in store.table("student_profiles").rows():
+        rollup.add_profile(row)
+    table = store.table("rollups")
+    for row in list(table.rows()):
+        table._remove(row)
+    rows = [r for r in rollup.to_rows() if r["row_count"] or r["points"]]
+    store.insert("rollups", rows)
+    return len(rows)
+
+
+def rebuild_watermarks(store):
+    """sql/012_apply_rebuild.sql"""
+    def mark(name, points=None):
+        rows = store.table(name).rows()
+        out = {"count": len(rows), "max_id": max((r["id"] for r in rows), default=None)}
+        if points:
+            out["points"] = sum(int(r.get(points) or 0) for r in rows)
+        return out
+    marks = {"logs_student": mark("logs_student", "action_points"),
+             "logs_member": mark("logs_member", "points"),
+             "game_scores": mark("game_scores")}
+    marks["logs_student"]["max_updated_at"] = max(
+        (r["updated_at"] for r in store.table("logs_student").rows() if r.get("updated_at")), default=None)
+    return marks
+
+
+def apply_rebuild(store, p_expected, p_changes):
+    """sql/012_apply_rebuild.sql（Store のロック内で呼ばれるので元の表は変わらない）"""
+    if rebuild_watermarks(store) != p_expected:
+        raise QueryError("apply_rebuild: source tables changed since they were read", code="40001")
+    result = {}
+    keys = {"lom_totals": ("lom_name",), "game_best": ("name", "school"), "student_profiles": ("user_id",)}
+    for name, cols in keys.items():
+        c = (p_changes or {}).get(name)
+        if c is None:
+            continue
+        table = store.table(name)
+        for k in c.get("delete") or []:
+            row = table.find(k if isinstance(k, dict) else {cols[0]: k})
+            if row is not None:
+                table._remove(row)
+                store._fire(name, "DELETE", row, None)
+        rows = [dict(r) for r in c.get("upsert") or []]
+        for r in rows:
+            r["updated_at"] = now_iso()
+        store.upsert(name, rows, on_conflict=cols)
+        result[name] = len(rows)
+    c = (p_changes or {}).get("rollups")
+    if c is not None:
+        table = store.table("rollups")
+        targets = {(k["kind"], k["key"]) for k in c.get("delete") or []}
+        targets |= {(r["kind"], r["key"]) for r in c.get("upsert") or []}
+        for row in [r for r in table.rows() if (r["kind"], r["key"]) in targets]:
+            table._remove(row)
+        store.insert("rollups", [{"kind": r["kind"], "key": r["key"], "row_count": r["row_count"],
+                                  "points": r["points"]} for r in c.get("upsert") or []])
+        result["rollups"] = len(c.get("upsert") or [])
+    return result
@@ -0,0 +1,148 @@
+"""テスト用の合成データ
+
+人数（users）と1人あたりの行数（rows_per_user）で大きさを決める。乱数の種が同じなら
+毎回同じデータになるので、変更の前後で同じ条件の計測ができる。
+
+小学生の半分は app.py 方式（1日1行・あいことば付き）、残りは visitor.py 方式
+（保存のたびに差分ポイントの行が増える）で作る。rows_per_user が日数より多いと、
+visitor.py 方式の人は同じ日付の行が複数になる（後の行が画面上の最新）。
+compact=True（既定）なら最後に sql/006 と同じく1人1日1行にまとめる（本番の移行後の状態）。
+"""
+import random
+
+from domain import HERO_ACTION, LOM_LIST, MEMBER_DATES, member_points
+
+# app.py の小学生チェック表
+APP_DATES = ["6/1(月)", "6/2(火)", "6/3(水)", "6/4(木)"]
+APP_ACTIONS = {"電気": 50, "食事": 100, "水": 30, "分別": 80, "家族": 50}
+HERO_DATE = "6/5(金)"
+
+# visitor.py のチェック表
+VISITOR_DATES = ["6/1 (月)", "6/2 (火)", "6/3 (水)", "6/4 (木)"]
+
+# app.py / admin.py の JCメンバー
+MEMBER_ACTIONS = member_points()
+
+SCHOOLS = ["倉敷", "岡山", "津山", "玉島", "児島", "水島", "笠岡", "総社", "赤磐", "備前",
+           "真庭", "新見", "高梁", "井原", "浅口", "瀬戸", "西大寺", "庭瀬", "妹尾", "御津"]
+GRADES = ["1年", "2年", "3年", "4年", "5年", "6年"]
+CLASSES = ["1", "2", "3", "A"]
+PER_CLASS = 35
+
+HERO_RATE = 0.3
+GAME_DATES = ["2026-06-01", "2026-06-02", "2026-06-03", "2026-06-04", "2026-06-05"]
+
+
+def student_id(i):
+    """i 番目の小学生の user_id（学校 → 学年 → 組 → 番号の順に埋まる）"""
+    num = i % PER_CLASS + 1
+    u_class = CLASSES[i // PER_CLASS % len(CLASSES)]
+    grade = GRADES[i // (PER_CLASS * len(CLASSES)) % len(GRADES)]
+    s = i // (PER_CLASS * len(CLASSES) * len(GRADES))
+    school = SCHOOLS[s % len(SCHOOLS)] + (str(s // len(SCHOOLS) + 1) if s >= len(SCHOOLS) else "")
+    return f"{school}小学校_{grade}_{u_class}_{num}"
+
+
+def student_pin(i):
+    """i 番目の小学生のあいことば（app.py 方式の人だけ使う）"""
+    return f"{(i * 7919 + 1234) % 10000:04d}"
+
+
+def is_app_student(i):
+    return i % 2 == 0
+
+
+def member_name(i):
+    return f"メンバー{i + 1}", LOM_LIST[i % len(LOM_LIST)]
+
+
+def _student_row(user_id, target_date, actions, points, memo, nickname, pin_code=None):
+    row = {
+        "user_id": user_id,
+        "nickname": nickname,
+        "school_name": user_id.split("_")[0],
+        "target_date": target_date,
+        "actions_str": ", ".join(actions),
+        "action_points": points,
+        "memo": memo, "q1": "", "q2": "", "q3": "",
+    }
+    if pin_code is not None:
+        row["pin_code"] = pin_code
+    return row
+
+
+def _app_student_rows(rng, i, rows_per_user):
+    user_id, pin = student_id(i), student_pin(i)
+    rows = []
+    for d in APP_DATES[:rows_per_user]:
+        acts = [k for k in APP_ACTIONS if rng.random() < 0.5]
+        rows.append(_student_row(user_id, d, acts, sum(APP_ACTIONS[a] for a in acts), "一括", "エコヒーロー", pin))
+    if rows_per_user > len(APP_DATES) and rng.random() < HERO_RATE:
+        rows.append(_student_row(user_id, HERO_DATE, [HERO_ACTION], 100, "", "エコヒーロー", pin))
+    return rows
+
+
+def _visitor_student_rows(rng, i, rows_per_user):
+    user_id = student_id(i)
+    nickname = f"ユーザー{i}"
+    history = {}
+    rows = []
+    for n in range(rows_per_user):
+        d = VISITOR_DATES[n % len(VISITOR_DATES)]
+        acts = [k for k in APP_ACTIONS if rng.random() < 0.5]
+        if n == rows_per_user - 1 and rng.random() < HERO_RATE:
+            acts.append(HERO_ACTION)
+        prev = history.get(d, [])
+        diff = sum(APP_ACTIONS.get(a, 100) for a in acts) - sum(APP_ACTIONS.get(a, 100) for a in prev)
+        rows.append(_student_row(user_id, d, acts, diff, "一括更新", nickname))
+        history[d] = acts
+    return rows
+
+
+def seed(store, users=1000, rows_per_user=4, members=None, games=None, random_seed=0, batch=5000, compact=True):
+    """store に合成データを入れ、入れた行数 {テーブル: 件数} を返す
+
+    members / games を省略すると users に比例した件数にする。
+    """
+    rng = random.Random(random_seed)
+    members = users // 50 if members is None else members
+    games = users // 10 if games is None else games
+    counts = {"logs_student": 0, "logs_member": 0, "game_scores": 0}
+
+    def flush(table, buf):
+        if buf:
+            store.insert(table, buf)
+            counts[table] += len(buf)
+            buf.clear()
+
+    buf = []
+    for i in range(users):
+        make = _app_student_rows if is_app_student(i) else _visitor_student_rows
+        buf.extend(make(rng, i, rows_per_user))
+        if len(buf) >= batch:
+            flush("logs_student", buf)
+    flush("logs_student", buf)
+    if compact:
+        store.rpc("compact_student_logs", {"max_groups": counts["logs_student"]})
+        counts["logs_student"] = len(store.table("logs_student").rows())
+
+    for i in range(members):
+        name, lom = member_name(i)
+        for d in MEMBER_DATES:
+            for k, pt in MEMBER_ACTIONS.items():
+                if rng.random() < 0.4:
+                    buf.append({"user_name": name, "lom_name": lom, "target_date": d,
+                                "action_label": k, "is_done": True, "points": pt})
+        if len(buf) >= batch:
+            flush("logs_member", buf)
+    flush("logs_member", buf)
+
+    for n in range(games):
+        i = rng.randrange(max(users, 1))
+        _, grade, u_class, num = student_id(i).split("_")
+        buf.append({"name": f"{grade} {u_class}組 {num}番", "school": student_id(i).split("_")[0],
+                    "time": round(rng.uniform(4.0, 30.0), 2), "date": rng.choice(GAME_DATES)})
+        if len(buf) >= batch:
+            flush("game_scores", buf)
+    flush("game_scores", buf)
+    return counts
@@ -0,0 +1,204 @@
+"""PostgREST 互換の HTTP サーバー（標準ライブラリだけで動く）
+
+    /rest/v1/<table>       GET（select）/ POST（insert・upsert）/ PATCH / DELETE
+    /rest/v1/rpc/<name>    POST（RPC）
+    /__localbase/stats     GET: テーブルごとのリクエスト数 / DELETE: カウンタを0に戻す
+
+apikey や Authorization ヘッダーは確認しない（ローカル専用）。
+Supabase と同じく、1リクエストで返す行数は max_rows（既定1000）で打ち切る。
+"""
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+from localbase.store import QueryError, Filter, parse_order
+
+REST_PREFIX = "/rest/v1/"
+RESERVED_PARAMS = ("select", "order", "limit", "offset", "on_conflict", "columns")
+DEFAULT_MAX_ROWS = 1000
+
+
+def _parse_prefer(header):
+    prefer = {}
+    for part in (header or "").split(","):
+        key, _, value = part.strip().partition("=")
+        if key:
+            prefer[key] = value
+    return prefer
+
+
+def _parse_select(raw):
+    cols = [c.strip() for c in (raw or "*").split(",") if c.strip()]
+    return None if not cols or "*" in cols else cols
+
+
+def _parse_query(query):
+    params, filters = {}, []
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key in RESERVED_PARAMS:
+            params[key] = value
+        elif key in ("or", "and"):
+            raise QueryError(f'"{key}" filters are not supported by localbase', code="PGRST100")
+        else:
+            filters.append(Filter.parse(key, value))
+    return params, filters
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "localbase"
+    store = None
+    verbose = False
+    max_rows = DEFAULT_MAX_ROWS
+
+    # --- 振り分け ---
+
+    def do_GET(self): self._dispatch("GET")
+    def do_HEAD(self): self._dispatch("HEAD")
+    def do_POST(self): self._dispatch("POST")
+    def do_PATCH(self): self._dispatch("PATCH")
+    def do_DELETE(self): self._dispatch("DELETE")
+
+    def do_OPTIONS(self):
+        self._send(204, None)
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        try:
+            if path.startswith("/__localbase/stats"):
+                return self._stats(method)
+            if not path.startswith(REST_PREFIX):
+                raise QueryError(f"no route for {path}", code="PGRST125", status=404)
+            target = path[len(REST_PREFIX):].strip("/")
+            body = self._read_body()
+            if target.startswith("rpc/"):
+                name = target[4:]
+                self.store.count(f"rpc {name}")
+                args = body if method == "POST" else dict(parse_qsl(url.query))
+                return self._send(200, self.store.rpc(name, args))
+            params, filters = _parse_query(url.query)
+            prefer = _parse_prefer(self.headers.get("Prefer"))
+            self.store.count(f"{method} {target}")
+            if method in ("GET", "HEAD"):
+                return self._select(method, target, params, filters, prefer)
+            if method == "POST":
+                return self._insert(target, params, prefer, body)
+            if method == "PATCH":
+                rows = self.store.update(target, body or {}, filters)
+                return self._write_result(rows, params, prefer)
+            if method == "DELETE":
+                rows = self.store.delete(target, filters)
+                return self._write_result(rows, params, prefer)
+        except QueryError as e:
+            self._send(e.status, e.to_dict())
+        except (ValueError, TypeError) as e:
+            self._send(400, QueryError(str(e)).to_dict())
+
+    # --- 各操作 ---
+
+    def _select(self, method, table, params, filters, prefer):
+        order = parse_order(params["order"]) if params.get("order") else ()
+        limit = int(params["limit"]) if params.get("limit") else None
+        if self.max_rows:
+            limit = self.max_rows if limit is None else min(limit, self.max_rows)
+        offset = int(params.get("offset") or 0)
+        rows, count = self.store.select(table, filters, order, limit, offset, count="count" in prefer)
+        rows = self._project(rows, params)
+        self.store.count("rows read", len(rows))
+        headers = {"Content-Range": self._content_range(offset, len(rows), count)}
+        if self._wants_object():
+            if len(rows) != 1:
+                raise QueryError("JSON object requested, multiple (or no) rows returned", code="PGRST116", status=406,
+                                 details=f"The result contains {len(rows)} rows")
+            rows = rows[0]
+        self._send(200, None if method == "HEAD" else rows, headers)
+
+    def _insert(self, table, params, prefer, body):
+        rows = body if isinstance(body, list) else [body or {}]
+        resolution = prefer.get("resolution")
+        if resolution in ("merge-duplicates", "ignore-duplicates"):
+            on_conflict = [c.strip() for c in params.get("on_conflict", "").split(",") if c.strip()] or None
+            saved = self.store.upsert(table, rows, on_conflict, ignore_duplicates=resolution == "ignore-duplicates")
+        else:
+            saved = self.store.insert(table, rows)
+        self.store.count("rows written", len(saved))
+        self._write_result(saved, params, prefer, status=201)
+
+    def _write_result(self, rows, params, prefer, status=200):
+        headers = {"Content-Range": self._content_range(0, len(rows), len(rows) if "count" in prefer else None)}
+        if prefer.get("return") == "representation":
+            return self._send(status, self._project(rows, params), headers)
+        # return=minimal でも postgrest-py が JSON として読めるように空配列を返す
+        self._send(status, [], headers)
+
+    def _stats(self, method):
+        if method == "DELETE":
+            self.store.reset_stats()
+            return self._send(200, {})
+        self._send(200, self.store.snapshot_stats())
+
+    # --- 入出力 ---
+
+    def _project(self, rows, params):
+        cols = _parse_select(params.get("select"))
+        if cols is None:
+            return rows
+        if rows:
+            missing = [c for c in cols if c not in rows[0]]
+            if missing:
+                raise QueryError(f"column {missing[0]} does not exist", code="42703")
+        return [{c: r.get(c) for c in cols} for r in rows]
+
+    def _wants_object(self):
+        return "vnd.pgrst.object" in (self.headers.get("Accept") or "")
+
+    @staticmethod
+    def _content_range(offset, n, total):
+        span = f"{offset}-{offset + n - 1}" if n else "*"
+        return f"{span}/{'*' if total is None else total}"
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        raw = self.rfile.read(length)
+        try:
+            return json.loads(raw)
+        except ValueError:
+            raise QueryError("Empty or invalid json", code="PGRST102") from None
+
+    def _send(self, status, payload, headers=None):
+        body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            sys.stderr.write("%s - %s\n" % (self.address_string(), format % args))
+
+
+def make_server(store, host="127.0.0.1", port=54321, verbose=False, max_rows=DEFAULT_MAX_ROWS):
+    """store を配信する HTTP サーバーを作る（serve_forever() は呼び出し側で）"""
+    attrs = {"store": store, "verbose": verbose, "max_rows": max_rows}
+    handler = type("LocalbaseHandler", (Handler,), attrs)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(store, host="127.0.0.1", port=54321, verbose=False, max_rows=DEFAULT_MAX_ROWS):
+    server = make_server(store, host, port, verbose, max_rows)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,548 @@
+"""インメモリのテーブルと、PostgREST の絞り込み・並べ替えの評価
+
+値はすべて Python の dict（1行 = 1 dict）で持つ。HTTP の文字列パラメータは
+比較する列の値の型（int / float / bool / str）に合わせて変換してから比べる。
+トリガーと RPC は Python 関数として登録する（schema.py 参照）。
+"""
+import bisect
+import datetime
+import re
+import threading
+from collections import Counter
+
+
+class QueryError(Exception):
+    """PostgREST 形式のエラー（server.py が JSON にして返す）"""
+
+    def __init__(self, message, code="PGRST100", status=400, details=None, hint=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status = status
+        self.details = details
+        self.hint = hint
+
+    def to_dict(self):
+        return {"code": self.code, "message": self.message, "details": self.details, "hint": self.hint}
+
+
+def now_iso():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="microseconds")
+
+
+# ==========================================
+#  絞り込み
+# ==========================================
+
+_NULL = object()
+
+
+def _coerce(raw, sample):
+    """文字列 raw を sample と同じ型に変換する（変換できなければ文字列のまま）"""
+    if isinstance(sample, bool):
+        return raw.lower() in ("true", "t", "1")
+    if isinstance(sample, int):
+        try:
+            return int(raw)
+        except ValueError:
+            try:
+                return float(raw)
+            except ValueError:
+                return raw
+    if isinstance(sample, float):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def split_list(raw):
+    """in.(a,"b,c",d) の括弧の中身を分割する（ダブルクォートで囲まれた値に対応）"""
+    raw = raw.strip()
+    if raw.startswith("(") and raw.endswith(")"):
+        raw = raw[1:-1]
+    values, buf, quoted, escaped = [], [], False, False
+    for ch in raw:
+        if escaped:
+            buf.append(ch)
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            values.append("".join(buf))
+            buf = []
+        else:
+            buf.append(ch)
+    if buf or values:
+        values.append("".join(buf))
+    return values
+
+
+def _like_regex(pattern, ignore_case):
+    # PostgREST では % の代わりに * も使える
+    parts = []
+    for ch in pattern:
+        if ch in "*%":
+            parts.append(".*")
+        elif ch == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(ch))
+    return re.compile("^" + "".join(parts) + "$", re.S | (re.I if ignore_case else 0))
+
+
+class Filter:
+    """1つの絞り込み条件（例: user_id=eq.倉敷小学校_1年_A_10）"""
+
+    OPS = ("eq", "neq", "gt", "gte", "lt", "lte", "in", "is", "like", "ilike")
+
+    def __init__(self, column, op, value, negate=False):
+        if op not in self.OPS:
+            raise QueryError(f'"{op}" is not supported by localbase', code="PGRST100")
+        self.column = column
+        self.op = op
+        self.negate = negate
+        if op == "in":
+            self.value = split_list(value)
+        elif op in ("like", "ilike"):
+            self.value = _like_regex(value, op == "ilike")
+        elif op == "is":
+            self.value = {"null": None, "true": True, "false": False}.get(value.lower(), _NULL)
+            if self.value is _NULL:
+                raise QueryError(f'"{value}" is not a valid value for is', code="PGRST100")
+        else:
+            self.value = value
+        self._cache = {}
+
+    @classmethod
+    def parse(cls, column, expr):
+        """クエリ文字列の値（"eq.xxx" / "not.in.(a,b)"）から作る"""
+        negate = False
+        if expr.startswith("not."):
+            negate, expr = True, expr[4:]
+        op, sep, value = expr.partition(".")
+        if not sep:
+            raise QueryError(f'failed to parse filter ({column}={expr})', code="PGRST100")
+        return cls(column, op, value, negate)
+
+    def _typed(self, raw, sample):
+        key = (type(sample), raw)
+        if key not in self._cache:
+            self._cache[key] = _coerce(raw, sample)
+        return self._cache[key]
+
+    def match(self, row):
+        result = self._match(row.get(self.column))
+        return not result if self.negate else result
+
+    def _match(self, v):
+        op = self.op
+        if op == "is":
+            return v is self.value if self.value is None else v == self.value
+        if v is None:
+            return False
+        if op == "in":
+            return any(v == self._typed(x, v) for x in self.value)
+        if op in ("like", "ilike"):
+            return bool(self.value.match(str(v)))
+        other = self._typed(self.value, v)
+        try:
+            if op == "eq": return v == other
+            if op == "neq": return v != other
+            if op == "gt": return v > other
+            if op == "gte": return v >= other
+            if op == "lt": return v < other
+            if op == "lte": return v <= other
+        except TypeError:
+            return False
+        return False
+
+
+def parse_order(raw):
+    """order=time.asc,id.desc.nullslast → [(列, desc, nulls_first)]"""
+    order = []
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        pieces = part.split(".")
+        column, desc, nulls_first = pieces[0], False, None
+        for p in pieces[1:]:
+            if p == "desc": desc = True
+            elif p == "asc": desc = False
+            elif p == "nullsfirst": nulls_first = True
+            elif p == "nullslast": nulls_first = False
+            else: raise QueryError(f'failed to parse order ({part})', code="PGRST100")
+        # Postgres の既定: 昇順は NULL が最後、降順は NULL が最初
+        order.append((column, desc, desc if nulls_first is None else nulls_first))
+    return order
+
+
+# ==========================================
+#  テーブル
+# ==========================================
+
+class Table:
+    """1つのテーブル
+
+    serial: 自動採番する列（"id"）。None なら自動採番なし
+    primary_key: 主キー列のタプル（upsert の on_conflict 省略時に使う）
+    unique: 一意インデックス {列の組: 名前}（add_unique で足す。on_conflict に使えるのは主キーとこれだけ）
+    indexes: eq 検索を速くするハッシュ索引を張る列
+    defaults: 列 → 既定値を返す関数
+    """
+
+    def __init__(self, name, columns, primary_key=("id",), serial="id", indexes=(), defaults=None):
+        self.name = name
+        self.columns = list(columns)
+        self.primary_key = tuple(primary_key)
+        self.serial = serial
+        self.defaults = dict(defaults or {})
+        self._next_id = 1
+        self._rows = {}           # 内部行番号 → 行（挿入順）
+        self._order = []          # serial 値の昇順（行番号と同じ順）
+        self._by_serial = {}      # serial 値 → 内部行番号
+        self._rowid = 0
+        self._indexes = {c: {} for c in set(indexes) | set(self.primary_key) if c != serial}
+        self.unique = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    # --- 読み出し ---
+
+    def rows(self):
+        return list(self._rows.values())
+
+    def _candidates(self, filters):
+        """索引で引ける eq 条件があれば、その行番号だけを返す"""
+        best = None
+        for f in filters:
+            if f.op == "eq" and not f.negate and f.column in self._indexes:
+                ids = self._indexes[f.column].get(f.value)
+                if ids is None:
+                    # 索引のキーは元の型なので、文字列以外はもう一度変換して探す
+                    ids = self._lookup_typed(f)
+                if best is None or len(ids) < len(best):
+                    best = ids
+            elif f.op == "eq" and not f.negate and f.column == self.serial:
+                rid = self._by_serial.get(_coerce(f.value, 0))
+                ids = {rid} if rid is not None else set()
+                if best is None or len(ids) < len(best):
+                    best = ids
+        return best
+
+    def _lookup_typed(self, f):
+        index = self._indexes[f.column]
+        for key, ids in index.items():
+            if key is not None and key == _coerce(f.value, key):
+                return ids
+        return set()
+
+    def select(self, filters=(), order=(), limit=None, offset=0, count=False):
+        """(該当行のリスト, 該当件数) を返す。order は parse_order の形式
+
+        count=False のときは件数を数えずに打ち切ることがある（件数は None）。
+        """
+        filters = list(filters)
+        for f in filters:
+            self._check_column(f.column)
+        for col, _, _ in order:
+            self._check_column(col)
+
+        def ok(row):
+            return all(f.match(row) for f in filters)
+
+        # 主キー順のキーセットページング（scan.py）は先頭から limit 件で打ち切る
+        if self.serial and all(col == self.serial and not desc for col, desc, _ in order) and self._candidates(filters) is None:
+            start = 0
+            for f in filters:
+                if f.column == self.serial and f.op in ("gt", "gte") and not f.negate:
+                    value = _coerce(f.value, 0)
+                    pos = bisect.bisect_right(self._order, value) if f.op == "gt" else bisect.bisect_left(self._order, value)
+                    start = max(start, pos)
+            matched, n = [], 0
+            stop = None if limit is None else offset + limit
+            for pos in range(start, len(self._order)):
+                row = self._rows[self._by_serial[self._order[pos]]]
+                if not ok(row):
+                    continue
+                n += 1
+                if stop is None or n <= stop:
+                    matched.append(row)
+                elif not count:
+                    break
+            return matched[offset:], (n if count else None)
+
+        ids = self._candidates(filters)
+        source = self._rows.values() if ids is None else (self._rows[i] for i in sorted(ids))
+        matched = [row for row in source if ok(row)]
+        total = len(matched)
+        # 後ろの並べ替えキーから順に安定ソート
+        for col, desc, nulls_first in reversed(list(order)):
+            present = [r for r in matched if r.get(col) is not None]
+            nulls = [r for r in matched if r.get(col) is None]
+            present.sort(key=lambda r: r[col], reverse=desc)
+            matched = nulls + present if nulls_first else present + nulls
+        matched = matched[offset:]
+        if limit is not None:
+            matched = matched[:limit]
+        return matched, (total if count else None)
+
+    def find(self, values):
+        """列 → 値 がすべて一致する行（最初の1行。なければ None）"""
+        filters = [Filter(c, "eq", str(v) if not isinstance(v, str) else v) for c, v in values.items()]
+        ids = self._candidates(filters)
+        source = self._rows.values() if ids is None else (self._rows[i] for i in sorted(ids))
+        for row in source:
+            if all(row.get(c) == v for c, v in values.items()):
+                return row
+        return None
+
+    # --- 書き込み（Store からだけ呼ぶ） ---
+
+    def add_unique(self, columns, name):
+        """create unique index 相当（重複した行が残っていれば 23505）"""
+        columns = tuple(columns)
+        seen = set()
+        for row in self._rows.values():
+            key = tuple(row.get(c) for c in columns)
+            if None not in key and key in seen:
+                raise QueryError(f'could not create unique index "{name}"', code="23505", status=409,
+                                 details=f"Key ({', '.join(columns)})=({', '.join(map(str, key))}) is duplicated.")
+            seen.add(key)
+        for col in columns:
+            if col != self.serial:
+                self._indexes.setdefault(col, {})
+                for rid, row in self._rows.items():
+                    self._indexes[col].setdefault(row.get(col), set()).add(rid)
+        self.unique[columns] = name
+
+    def conflict_target(self, columns):
+        """on_conflict に使える列の組か（主キーか一意インデックスと同じ列。順番は問わない）"""
+        return set(columns) == set(self.primary_key) or any(set(columns) == set(u) for u in self.unique)
+
+    def _check_column(self, column):
+        if column not in self.columns:
+            raise QueryError(f"column {self.name}.{column} does not exist", code="42703")
+
+    def _new_row(self, values):
+        for col in values:
+            if col not in self.columns:
+                raise QueryError(f"Could not find the '{col}' column of '{self.name}' in the schema cache", code="PGRST204")
+        row = {}
+        for col in self.columns:
+            if col in values:
+                row[col] = values[col]
+            elif col == self.serial:
+                row[col] = None
+            elif col in self.defaults:
+                row[col] = self.defaults[col]()
+            else:
+                row[col] = None
+        if self.serial:
+            if row[self.serial] is None:
+                row[self.serial] = self._next_id
+            self._next_id = max(self._next_id, row[self.serial] + 1)
+        return row
+
+    def _add(self, row):
+        if self.serial is None and self.find({c: row.get(c) for c in self.primary_key}) is not None:
+            key = ", ".join(f"{c}={row.get(c)}" for c in self.primary_key)
+            raise QueryError(f'duplicate key value violates unique constraint "{self.name}_pkey"',
+                             code="23505", status=409, details=f"Key ({key}) already exists.")
+        for columns, name in self.unique.items():
+            values = {c: row.get(c) for c in columns}
+            if None not in values.values() and self.find(values) is not None:
+                key = ", ".join(f"{c}={v}" for c, v in values.items())
+                raise QueryError(f'duplicate key value violates unique constraint "{name}"',
+                                 code="23505", status=409, details=f"Key ({key}) already exists.")
+        self._rowid += 1
+        rid = self._rowid
+        self._rows[rid] = row
+        if self.serial:
+            sid = row[self.serial]
+            if self._order and sid <= self._order[-1]:
+                bisect.insort(self._order, sid)
+            else:
+                self._order.append(sid)
+            self._by_serial[sid] = rid
+        for col, index in self._indexes.items():
+            index.setdefault(row.get(col), set()).add(rid)
+        return row
+
+    def _rid_of(self, row):
+        if self.serial:
+            return self._by_serial[row[self.serial]]
+        for rid, r in self._rows.items():
+            if r is row:
+                return rid
+        raise KeyError(row)
+
+    def _remove(self, row):
+        rid = self._rid_of(row)
+        del self._rows[rid]
+        if self.serial:
+            sid = row[self.serial]
+            del self._by_serial[sid]
+            pos = bisect.bisect_left(self._order, sid)
+            del self._order[pos]
+        for col, index in self._indexes.items():
+            ids = index.get(row.get(col))
+            if ids is not None:
+                ids.discard(rid)
+                if not ids:
+                    del index[row.get(col)]
+
+    def _update(self, row, values):
+        """行をその場で書き換え、書き換え前のコピーを返す"""
+        for col in values:
+            self._check_column(col)
+        old = dict(row)
+        rid = self._rid_of(row)
+        for col, index in self._indexes.items():
+            if col in values and values[col] != row.get(col):
+                index[row.get(col)].discard(rid)
+                if not index[row.get(col)]:
+                    del index[row.get(col)]
+                index.setdefault(values[col], set()).add(rid)
+        row.update(values)
+        return old
+
+
+# ==========================================
+#  データベース全体
+# ==========================================
+
+class Store:
+    """テーブル・トリガー・RPC の集まり（スレッドセーフ）
+
+    トリガーは fn(store, op, old, new) で、op は "INSERT" / "UPDATE" / "DELETE"。
+    行の書き込みのたびに（after ... for each row 相当で）呼ばれる。
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.functions = {}
+        self.triggers = {}
+        self.lock = threading.RLock()
+        self.stats = Counter()
+
+    def count(self, key, n=1):
+        """リクエスト数などのカウンタを足す（/__localbase/stats で見られる）"""
+        with self.lock:
+            self.stats[key] += n
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+
+    def snapshot_stats(self):
+        with self.lock:
+            return {
+                "requests": dict(self.stats),
+                "tables": {name: len(t) for name, t in self.tables.items()},
+            }
+
+    def create_table(self, name, columns, **kwargs):
+        table = Table(name, columns, **kwargs)
+        self.tables[name] = table
+        return table
+
+    def add_trigger(self, table, fn, columns=None):
+        """columns を指定すると、UPDATE はその列が変わったときだけ呼ぶ（update of ...）"""
+        self.triggers.setdefault(table, []).append((fn, tuple(columns) if columns else None))
+
+    def add_function(self, name, fn):
+        """RPC を登録する。fn(store, **params) の戻り値がそのまま JSON で返る"""
+        self.functions[name] = fn
+
+    def table(self, name):
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise QueryError(f'relation "public.{name}" does not exist', code="42P01", status=404) from None
+
+    def _fire(self, name, op, old, new):
+        for fn, columns in self.triggers.get(name, ()):
+            if op == "UPDATE" and columns and all(old.get(c) == new.get(c) for c in columns):
+                continue
+            fn(self, op, old, new)
+
+    # --- SQL 相当の操作 ---
+
+    def select(self, name, filters=(), order=(), limit=None, offset=0, count=False):
+        with self.lock:
+            rows, total = self.table(name).select(filters, order, limit, offset, count)
+            return [dict(r) for r in rows], total
+
+    def insert(self, name, rows):
+        with self.lock:
+            table = self.table(name)
+            new_rows = [table._new_row(values) for values in rows]
+            saved = []
+            for row in new_rows:
+                table._add(row)
+                self._fire(name, "INSERT", None, row)
+                saved.append(dict(row))
+            return saved
+
+    def upsert(self, name, rows, on_conflict=None, ignore_duplicates=False):
+        """on_conflict の列が一致する行があれば更新（ignore_duplicates なら何もしない）、なければ追加"""
+        with self.lock:
+            table = self.table(name)
+            keys = tuple(on_conflict or table.primary_key)
+            for col in keys:
+                table._check_column(col)
+            if not table.conflict_target(keys):
+                # 本番と同じく、一意インデックスのない列では upsert できない（sql/006 の前など）
+                raise QueryError("there is no unique or exclusion constraint matching the ON CONFLICT specification",
+                                 code="42P10")
+            saved = []
+            for values in rows:
+                existing = table.find({c: values.get(c) for c in keys})
+                if existing is None:
+                    row = table._new_row(values)
+                    table._add(row)
+                    self._fire(name, "INSERT", None, row)
+                    saved.append(dict(row))
+                elif not ignore_duplicates:
+                    changes = {c: v for c, v in values.items() if c != table.serial}
+                    old = table._update(existing, changes)
+                    self._fire(name, "UPDATE", old, existing)
+                    saved.append(dict(existing))
+            return saved
+
+    def update(self, name, values, filters=()):
+        with self.lock:
+            table = self.table(name)
+            rows, _ = table.select(filters)
+            saved = []
+            for row in rows:
+                old = table._update(row, values)
+                self._fire(name, "UPDATE", old, row)
+                saved.append(dict(row))
+            return saved
+
+    def delete(self, name, filters=()):
+        with self.lock:
+            table = self.table(name)
+            rows, _ = table.select(filters)
+            for row in rows:
+                table._remove(row)
+                self._fire(name, "DELETE", row, None)
+            return [dict(r) for r in rows]
+
+    def rpc(self, name, params):
+        with self.lock:
+            fn = self.functions.get(name)
+            if fn is None:
+                raise QueryError(f"Could not find the function public.{name} in the schema cache",
+                                 code="PGRST202", status=404)
+            try:
+                return fn(self, **(params or {}))
+            except TypeError as e:
+                raise QueryError(f"Could not call public.{name}: {e}", code="PGRST202", status=404) from None
@@ -0,0 +1,541 @@
+"""計測（バックエンド呼び出しとスクリプト実行の時間）
+
+- instrument(client): Supabase クライアントを包み、table(...)/rpc(...) の execute() ごとに
+  時間・行数・成否を呼び出し元（fetch_global_stats / save_member_logs など）別に記録する。
+  呼び出し元は app.py / visitor.py / admin.py の関数名をスタックから拾う（call_site() で上書き可）。
+- track_run(app): スクリプト1回の実行時間・その間のクエリ数・st.rerun() で続いた一連の
+  実行（rerun サイクル）の時間を、アプリ別・セッション別に記録する。
+- metrics_gate(): ?metrics=<secrets の metrics.token> のときだけ集計ページを表示する（隠しページ）。
+- REGISTRY.prometheus(): Prometheus のテキスト形式。secrets の metrics.textfile を指定すると
+  そのファイルにも定期的に書き出す（node_exporter の textfile collector 向け）。
+
+集計はプロセスごと（Streamlit のワーカーごと）で、再起動すると消える。
+"""
+import contextvars
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import streamlit as st
+
+# 秒のバケット（Prometheus のヒストグラム）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+MAX_SESSIONS = 5000         # セッション別の記録は新しい順にこの数まで
+ACTIVE_SESSION_WINDOW = 300 # 直近この秒数に実行があったセッションを「アクティブ」と数える
+TEXTFILE_INTERVAL = 15      # textfile への書き出し間隔（秒）
+
+APP_FILES = ("app.py", "visitor.py", "admin.py")
+_SKIP_FILES = ("metrics.py",)
+QUERY_OPS = ("select", "insert", "upsert", "update", "delete")
+
+_site_override = contextvars.ContextVar("metrics_site", default=None)
+_run_queries = contextvars.ContextVar("metrics_run_queries", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """バケットから近似したパーセンタイル（バケットの上限値）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for b, c in zip(self.buckets, self.counts):
+            seen += c
+            if seen >= target:
+                return min(b, self.max)
+        return self.max
+
+    def cumulative(self):
+        total, out = 0, []
+        for b, c in zip(self.buckets, self.counts):
+            total += c
+            out.append((b, total))
+        return out
+
+
+class QueryStat:
+    __slots__ = ("latency", "rows", "errors")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+
+class RunStat:
+    __slots__ = ("latency", "cycles", "queries", "outcomes")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.cycles = Histogram()
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.outcomes = {}
+
+
+class SessionStat:
+    __slots__ = ("app", "runs", "reruns", "seconds", "queries", "last_run", "last_seen")
+
+    def __init__(self, app):
+        self.app = app
+        self.runs = 0
+        self.reruns = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.last_run = 0.0
+        self.last_seen = 0.0
+
+
+class Metrics:
+    """プロセス共通の集計（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sources = []
+        self.reset()
+
+    def watch(self, source):
+        """status() -> dict を持つもの（refresher.py の BackgroundRefresher など）を表示・出力に加える"""
+        with self._lock:
+            self.sources = [s for s in self.sources if s.name != source.name] + [source]
+
+    def source_table(self):
+        with self._lock:
+            sources = list(self.sources)
+        return [s.status() for s in sources]
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.queries = {}                 # (呼び出し元, テーブル, 操作) → QueryStat
+            self.runs = {}                    # アプリ → RunStat
+            self.sessions = OrderedDict()     # セッションID → SessionStat
+
+    # --- 記録 ---
+
+    def record_query(self, site, table, op, seconds, rows, ok=True):
+        counter = _run_queries.get()
+        if counter is not None:
+            counter[0] += 1
+        key = (site, table, op)
+        with self._lock:
+            stat = self.queries.get(key)
+            if stat is None:
+                stat = self.queries[key] = QueryStat()
+            stat.latency.observe(seconds)
+            stat.rows += rows
+            if not ok:
+                stat.errors += 1
+
+    def record_run(self, app, session_id, seconds, outcome, queries):
+        now = time.time()
+        with self._lock:
+            stat = self.runs.get(app)
+            if stat is None:
+                stat = self.runs[app] = RunStat()
+            stat.latency.observe(seconds)
+            stat.queries.observe(queries)
+            stat.outcomes[outcome] = stat.outcomes.get(outcome, 0) + 1
+            if session_id is None:
+                return
+            sess = self.sessions.pop(session_id, None) or SessionStat(app)
+            sess.runs += 1
+            sess.reruns += outcome == "rerun"
+            sess.seconds += seconds
+            sess.queries += queries
+            sess.last_run = seconds
+            sess.last_seen = now
+            self.sessions[session_id] = sess
+            while len(self.sessions) > MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+
+    def record_cycle(self, app, seconds):
+        """st.rerun() で続いた一連の実行の、最初の開始から最後の終了まで"""
+        with self._lock:
+            stat = self.runs.get(app)
+            if stat is None:
+                stat = self.runs[app] = RunStat()
+            stat.cycles.observe(seconds)
+
+    # --- 読み出し ---
+
+    def query_table(self):
+        """呼び出し元・テーブル・操作ごとの集計（合計時間の多い順）"""
+        with self._lock:
+            items = list(self.queries.items())
+        rows = []
+        for (site, table, op), s in items:
+            h = s.latency
+            rows.append({
+                "site": site, "table": table, "op": op,
+                "count": h.count, "errors": s.errors,
+                "total_s": round(h.sum, 3),
+                "avg_ms": round(h.sum / h.count * 1000, 1) if h.count else None,
+                "p95_ms": _ms(h.quantile(0.95)), "max_ms": _ms(h.max),
+                "rows": s.rows, "rows_avg": round(s.rows / h.count, 1) if h.count else None,
+            })
+        rows.sort(key=lambda r: r["total_s"], reverse=True)
+        return rows
+
+    def run_table(self):
+        with self._lock:
+            items = list(self.runs.items())
+        rows = []
+        for app, s in items:
+            h, c, q = s.latency, s.cycles, s.queries
+            rows.append({
+                "app": app, "runs": h.count, **{f"runs_{k}": v for k, v in sorted(s.outcomes.items())},
+                "avg_ms": round(h.sum / h.count * 1000, 1) if h.count else None,
+                "p95_ms": _ms(h.quantile(0.95)), "max_ms": _ms(h.max),
+                "cycles": c.count, "cycle_p95_ms": _ms(c.quantile(0.95)), "cycle_max_ms": _ms(c.max),
+                "queries_per_run": round(q.sum / q.count, 2) if q.count else None,
+            })
+        return rows
+
+    def session_table(self, limit=100):
+        """直近のセッション（新しい順）"""
+        with self._lock:
+            items = list(self.sessions.items())[-limit:]
+        rows = []
+        for sid, s in reversed(items):
+            rows.append({
+                "session": sid[:8], "app": s.app, "runs": s.runs, "reruns": s.reruns,
+                "total_s": round(s.seconds, 3), "last_run_ms": _ms(s.last_run),
+                "queries": s.queries, "last_seen": time.strftime("%H:%M:%S", time.localtime(s.last_seen)),
+            })
+        return rows
+
+    def active_sessions(self, window=ACTIVE_SESSION_WINDOW):
+        cutoff = time.time() - window
+        with self._lock:
+            counts = {}
+            for s in self.sessions.values():
+                if s.last_seen >= cutoff:
+                    counts[s.app] = counts.get(s.app, 0) + 1
+        return counts
+
+    def prometheus(self, prefix="decokatsu"):
+        """Prometheus のテキスト形式"""
+        with self._lock:
+            queries = [(k, v.latency, v.rows, v.errors) for k, v in self.queries.items()]
+            runs = [(k, v.latency, v.cycles, v.queries, dict(v.outcomes)) for k, v in self.runs.items()]
+        lines = []
+
+        def help_type(name, kind, text):
+            lines.append(f"# HELP {prefix}_{name} {text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        help_type("backend_request_seconds", "histogram", "Supabase request latency by call site")
+        for (site, table, op), h, _, _ in queries:
+            _histogram_lines(lines, f"{prefix}_backend_request_seconds", h, site=site, table=table, op=op)
+        help_type("backend_request_errors_total", "counter", "Supabase requests that raised")
+        for (site, table, op), _, _, errors in queries:
+            lines.append(f"{prefix}_backend_request_errors_total{_labels(site=site, table=table, op=op)} {errors}")
+        help_type("backend_rows_total", "counter", "Rows returned or written")
+        for (site, table, op), _, rows, _ in queries:
+            lines.append(f"{prefix}_backend_rows_total{_labels(site=site, table=table, op=op)} {rows}")
+
+        help_type("script_run_seconds", "histogram", "Duration of one script run")
+        for app, h, _, _, _ in runs:
+            _histogram_lines(lines, f"{prefix}_script_run_seconds", h, app=app)
+        help_type("script_runs_total", "counter", "Script runs by outcome (ok / rerun / stop / error)")
+        for app, _, _, _, outcomes in runs:
+            for outcome, n in sorted(outcomes.items()):
+                lines.append(f"{prefix}_script_runs_total{_labels(app=app, outcome=outcome)} {n}")
+        help_type("rerun_cycle_seconds", "histogram", "From the first run to the last run of an st.rerun() chain")
+        for app, _, c, _, _ in runs:
+            _histogram_lines(lines, f"{prefix}_rerun_cycle_seconds", c, app=app)
+        help_type("queries_per_run", "histogram", "Supabase requests made during one script run")
+        for app, _, _, q, _ in runs:
+            _histogram_lines(lines, f"{prefix}_queries_per_run", q, app=app)
+
+        sources = self.source_table()
+        help_type("refresher_age_seconds", "gauge", "Age of the last good background aggregate")
+        for src in sources:
+            if src["age_s"] is not None:
+                lines.append(f"{prefix}_refresher_age_seconds{_labels(name=src['name'])} {src['age_s']}")
+        help_type("refresher_errors_total", "counter", "Background aggregate failures")
+        for src in sources:
+            lines.append(f"{prefix}_refresher_errors_total{_labels(name=src['name'])} {src['errors']}")
+
+        help_type("active_sessions", "gauge", f"Sessions with a run in the last {ACTIVE_SESSION_WINDOW}s")
+        for app, n in sorted(self.active_sessions().items()):
+            lines.append(f"{prefix}_active_sessions{_labels(app=app)} {n}")
+        help_type("process_start_time_seconds", "gauge", "When this worker started collecting")
+        lines.append(f"{prefix}_process_start_time_seconds {self.started_at:.0f}")
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _labels(**labels):
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def _histogram_lines(lines, name, h, **labels):
+    for b, total in h.cumulative():
+        lines.append(f"{name}_bucket{_labels(**labels, le=b)} {total}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {h.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {h.sum:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {h.count}")
+
+
+REGISTRY = Metrics()
+
+
+# ==========================================
+#  バックエンド呼び出しの計測
+# ==========================================
+
+@contextmanager
+def call_site(name):
+    """この中の呼び出しを name として記録する（スタックから拾う代わりに明示したいとき）"""
+    token = _site_override.set(name)
+    try:
+        yield
+    finally:
+        _site_override.reset(token)
+
+
+def _call_site():
+    site = _site_override.get()
+    if site:
+        return site
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        if filename in APP_FILES and code.co_name != "<module>":
+            return code.co_name
+        if fallback is None and filename not in _SKIP_FILES:
+            fallback = code.co_name
+        frame = frame.f_back
+    return fallback or "unknown"
+
+
+class _Query:
+    """postgrest のリクエストビルダーを包み、execute() だけを計測する"""
+
+    __slots__ = ("_builder", "_table", "_op")
+
+    def __init__(self, builder, table, op):
+        self._builder = builder
+        self._table = table
+        self._op = op
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        op = name if name in QUERY_OPS else self._op
+        if not callable(attr):
+            return _Query(attr, self._table, op) if hasattr(attr, "execute") else attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return _Query(result, self._table, op) if hasattr(result, "execute") else result
+        return call
+
+    def execute(self, *args, **kwargs):
+        site = _call_site()
+        started = time.perf_counter()
+        try:
+            response = self._builder.execute(*args, **kwargs)
+        except Exception:
+            REGISTRY.record_query(site, self._table, self._op, time.perf_counter() - started, 0, ok=False)
+            raise
+        data = getattr(response, "data", None)
+        rows = len(data) if isinstance(data, list) else int(data is not None)
+        REGISTRY.record_query(site, self._table, self._op, time.perf_counter() - started, rows)
+        return response
+
+
+class InstrumentedClient:
+    """Supabase クライアントの代わりに渡す（table / from_ / rpc 以外はそのまま通す）"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return _Query(self._client.table(name), name, "select")
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, fn, params=None, *args, **kwargs):
+        return _Query(self._client.rpc(fn, params or {}, *args, **kwargs), f"rpc:{fn}", "rpc")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def instrument(client):
+    return client if client is None or isinstance(client, InstrumentedClient) else InstrumentedClient(client)
+
+
+# ==========================================
+#  スクリプト実行の計測
+# ==========================================
+
+_CHAIN_KEY = "_metrics_rerun_chain_started"
+
+
+def _session_id():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+
+def _outcome(exc):
+    name = type(exc).__name__
+    if name == "RerunException": return "rerun"
+    if name == "StopException": return "stop"
+    return "error"
+
+
+@contextmanager
+def track_run(app):
+    """メインの処理を囲んで、スクリプト1回ぶんを記録する
+
+        with track_run("visitor"):
+            main_screen()
+    """
+    started = time.perf_counter()
+    counter = [0]
+    token = _run_queries.set(counter)
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = _outcome(e)
+        raise
+    finally:
+        _run_queries.reset(token)
+        ended = time.perf_counter()
+        REGISTRY.record_run(app, _session_id(), ended - started, outcome, counter[0])
+        _track_chain(app, started, ended, outcome)
+        _maybe_write_textfile()
+
+
+def _track_chain(app, started, ended, outcome):
+    try:
+        chain_started = st.session_state.get(_CHAIN_KEY)
+        if outcome == "rerun":
+            if chain_started is None:
+                st.session_state[_CHAIN_KEY] = time.time() - (ended - started)
+        elif chain_started is not None:
+            REGISTRY.record_cycle(app, time.time() - chain_started)
+            del st.session_state[_CHAIN_KEY]
+    except Exception:
+        pass
+
+
+# ==========================================
+#  隠しページ・テキスト出力
+# ==========================================
+
+def _settings():
+    try:
+        return dict(st.secrets.get("metrics", {}))
+    except Exception:
+        return {}
+
+
+_textfile_lock = threading.Lock()
+_textfile_written = [0.0]
+
+
+def _maybe_write_textfile():
+    path = _settings().get("textfile")
+    if not path:
+        return
+    now = time.monotonic()
+    with _textfile_lock:
+        if now - _textfile_written[0] < TEXTFILE_INTERVAL:
+            return
+        _textfile_written[0] = now
+    write_textfile(path)
+
+
+def write_textfile(path):
+    """Prometheus 形式で書き出す（一時ファイルに書いてから置き換える）"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(REGISTRY.prometheus())
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def metrics_gate():
+    """?metrics=<トークン> が secrets の metrics.token と一致したら集計ページを出して止める"""
+    token = str(_settings().get("token") or "")
+    if not token:
+        return
+    given = st.query_params.get("metrics")
+    if given and hmac.compare_digest(str(given), token):
+        show_metrics_page()
+        st.stop()
+
+
+def show_metrics_page():
+    st.title("📈 メトリクス")
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(REGISTRY.started_at))
+    active = REGISTRY.active_sessions()
+    st.caption(f"pid {os.getpid()} / {started} から集計 / アクティブなセッション: {sum(active.values())}")
+
+    tab_q, tab_r, tab_b, tab_s, tab_p = st.tabs(["バックエンド呼び出し", "スクリプト実行", "バックグラウンド集計", "セッション", "Prometheus"])
+    with tab_q:
+        rows = REGISTRY.query_table()
+        if rows: st.dataframe(rows, use_container_width=True, hide_index=True)
+        else: st.info("まだ記録がありません")
+    with tab_r:
+        rows = REGISTRY.run_table()
+        if rows: st.dataframe(rows, use_container_width=True, hide_index=True)
+        else: st.info("まだ記録がありません")
+    with tab_b:
+        rows = REGISTRY.source_table()
+        if rows: st.dataframe(rows, use_container_width=True, hide_index=True)
+        else: st.info("まだ記録がありません")
+    with tab_s:
+        rows = REGISTRY.session_table()
+        if rows: st.dataframe(rows, use_container_width=True, hide_index=True)
+        else: st.info("まだ記録がありません")
+    with tab_p:
+        text = REGISTRY.prometheus()
+        st.download_button("テキストをダウンロード", text, file_name="decokatsu.prom", mime="text/plain")
+        st.code(text, language="text")
+
+    if st.button("集計をリセット"):
+        REGISTRY.reset()
+        st.rerun()
@@ -0,0 +1,210 @@
+"""1セッションだけのプロファイル（本番の重い画面を調べる用）
+
+?profile=<secrets の profiling.token> を付けて開いたセッションでは、以降の実行
+（st.rerun() で続く分も含む）を cProfile で計測し、profiles/ に保存して画面下に要約を出す。
+?profiler=pyinstrument を足すと、入っていればサンプリングの pyinstrument を使う
+（フレームグラフ相当の HTML と speedscope 用の JSON も保存する）。?profile=off で止める。
+
+保存したファイルの見方:
+    python -m pstats profiles/<名前>.pstats      （sort cumulative / stats 30 など）
+    snakeviz profiles/<名前>.pstats              （入っていれば）
+    https://www.speedscope.app/ に .speedscope.json を読み込む
+"""
+import cProfile
+import hmac
+import os
+import pstats
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+    HAS_PYINSTRUMENT = True
+except ImportError:
+    HAS_PYINSTRUMENT = False
+
+DEFAULT_DIR = "profiles"
+MAX_FILES = 200         # profiles/ に残すファイル数（古いものから消す）
+TOP_FUNCTIONS = 25      # 画面に出す関数の数
+KEEP_SUMMARIES = 5      # 画面に出す直近の実行数
+
+_STATE_KEY = "_profiling"
+_SUMMARY_KEY = "_profiling_summaries"
+
+
+def _settings():
+    try:
+        return dict(st.secrets.get("profiling", {}))
+    except Exception:
+        return {}
+
+
+def _enabled():
+    """このセッションをプロファイルするか（一度トークンが合えば以降の実行も続ける）"""
+    given = st.query_params.get("profile")
+    if given == "off":
+        st.session_state.pop(_STATE_KEY, None)
+        return False
+    if st.session_state.get(_STATE_KEY):
+        return True
+    token = str(_settings().get("token") or "")
+    if token and given and hmac.compare_digest(str(given), token):
+        st.session_state[_STATE_KEY] = True
+        return True
+    return False
+
+
+def _session_tag():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id[:8] if ctx else "nosession"
+    except Exception:
+        return "nosession"
+
+
+def _output_dir():
+    path = _settings().get("dir") or DEFAULT_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _prune(path):
+    files = sorted((os.path.join(path, f) for f in os.listdir(path)), key=os.path.getmtime)
+    for f in files[:-MAX_FILES]:
+        try:
+            os.remove(f)
+        except OSError:
+            pass
+
+
+@contextmanager
+def profile_run(app):
+    """メインの処理を囲む。プロファイル対象のセッションでなければ何もしない
+
+        with profile_run("admin"):
+            main()
+    """
+    if not _enabled():
+        yield
+        return
+
+    use_sampling = HAS_PYINSTRUMENT and st.query_params.get("profiler") == "pyinstrument"
+    profiler = SamplingProfiler(async_mode="disabled") if use_sampling else cProfile.Profile()
+    try:
+        if use_sampling: profiler.start()
+        else: profiler.enable()
+    except (RuntimeError, ValueError):
+        # 他のプロファイラが動いている（デバッガなど）
+        yield
+        return
+
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = {"RerunException": "rerun", "StopException": "stop"}.get(type(e).__name__, "error")
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if use_sampling: profiler.stop()
+        else: profiler.disable()
+        summary = _save(app, profiler, use_sampling, elapsed, outcome)
+        summaries = [summary] + st.session_state.get(_SUMMARY_KEY, [])
+        st.session_state[_SUMMARY_KEY] = summaries[:KEEP_SUMMARIES]
+        if outcome == "ok":
+            show_profile_summary()
+
+
+def _save(app, profiler, use_sampling, elapsed, outcome):
+    path = _output_dir()
+    base = os.path.join(path, f"{app}-{time.strftime('%Y%m%d-%H%M%S')}-{_session_tag()}-{outcome}")
+    files = []
+    if use_sampling:
+        session = profiler.last_session
+        with open(base + ".html", "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+        files.append(base + ".html")
+        try:
+            from pyinstrument.renderers import SpeedscopeRenderer
+            with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+                f.write(SpeedscopeRenderer().render(session))
+            files.append(base + ".speedscope.json")
+        except ImportError:
+            pass
+        rows = _sampling_rows(session)
+    else:
+        profiler.dump_stats(base + ".pstats")
+        files.append(base + ".pstats")
+        rows = _pstats_rows(pstats.Stats(profiler))
+    _prune(path)
+    return {
+        "app": app, "outcome": outcome, "seconds": round(elapsed, 3),
+        "at": time.strftime("%H:%M:%S"), "files": files,
+        "top": rows[:TOP_FUNCTIONS], "by_package": _by_package(rows),
+    }
+
+
+def _short(filename):
+    """site-packages 以下はパッケージからの相対、それ以外はファイル名だけ"""
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+
+def _pstats_rows(stats):
+    """関数ごとの行（累積時間の多い順）"""
+    rows = []
+    for (filename, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({
+            "function": f"{_short(filename)}:{line}({name})",
+            "calls": nc, "self_ms": round(tt * 1000, 1), "cum_ms": round(ct * 1000, 1),
+        })
+    rows.sort(key=lambda r: r["cum_ms"], reverse=True)
+    return rows
+
+
+def _sampling_rows(session):
+    """pyinstrument の結果を関数ごとに合計（同じ関数が何度出ても1行）"""
+    totals = {}
+    root = session.root_frame() if session else None
+    stack = [root] if root else []
+    while stack:
+        frame = stack.pop()
+        key = f"{_short(frame.file_path or '')}:{frame.line_no}({frame.function})"
+        row = totals.setdefault(key, {"function": key, "calls": 0, "self_ms": 0.0, "cum_ms": 0.0})
+        row["calls"] += 1
+        row["self_ms"] += frame.total_self_time * 1000
+        row["cum_ms"] += frame.time * 1000
+        stack.extend(frame.children)
+    rows = sorted(totals.values(), key=lambda r: r["cum_ms"], reverse=True)
+    for r in rows:
+        r["self_ms"], r["cum_ms"] = round(r["self_ms"], 1), round(r["cum_ms"], 1)
+    return rows
+
+
+def _by_package(rows):
+    """self 時間をパッケージ（pandas / streamlit / 自前のファイル…）ごとに"""
+    totals = {}
+    for r in rows:
+        head = r["function"].split(":", 1)[0]
+        package = head.split("/", 1)[0] if "/" in head else head
+        totals[package] = totals.get(package, 0) + r["self_ms"]
+    return sorted(({"package": k, "self_ms": round(v, 1)} for k, v in totals.items()),
+                  key=lambda r: r["self_ms"], reverse=True)
+
+
+def show_profile_summary():
+    summaries = st.session_state.get(_SUMMARY_KEY)
+    if not summaries:
+        return
+    with st.expander(f"⏱ プロファイル（直近 {len(summaries)} 回）", expanded=False):
+        for s in summaries:
+            st.markdown(f"**{s['at']} {s['app']}** — {s['seconds']:.3f} 秒（{s['outcome']}）")
+            st.caption(" / ".join(s["files"]))
+            st.dataframe(s["by_package"], use_container_width=True, hide_index=True)
+            st.dataframe(s["top"], use_container_width=True, hide_index=True)
@@ -0,0 +1,426 @@
+"""集計テーブルを元の表から作り直す（ずれたとき・スキーマを変えたあと用）
+
+対象（元の表 → 集計）:
+    logs_member  → lom_totals（sql/002）
+    game_scores  → game_best（sql/003）
+    logs_student → student_profiles（sql/007）
+    logs_student, logs_member → rollups（sql/010, 011。shard は 0 にまとめる）
+    全体統計（CO2削減量・ヒーロー数・参加者数）は表を持たないので、get_dashboard_stats と比べて表示だけ
+    --only で対象を絞ると、その対象に要る元の表だけを読む（TARGET_SOURCES）
+
+id の範囲をチャンクに分けてプロセスプールで並列に読み（scan.py のキーセット方式）、
+チャンクごとの途中結果（Partial）を足し合わせる。表を丸ごとメモリに載せることはない。
+今の集計テーブルとの差分を表示し、--apply のときだけ sql/012 の apply_rebuild で
+差分を1トランザクションで反映する。読み始めから反映までに元の表が変わっていたら
+（rebuild_watermarks の値が違えば）何も書かずに失敗するので、もう一度実行する。
+
+    python rebuild.py                   # 差分を表示するだけ
+    python rebuild.py --apply           # 反映（service_role の key が必要）
+    python rebuild.py --workers 8 --only lom_totals,rollups
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from scan import scan_table, DEFAULT_PAGE_SIZE
+from domain import is_hero_row
+from rollups import Rollup
+from cli_config import supabase_connection
+
+TARGETS = ("lom_totals", "game_best", "student_profiles", "rollups")
+SOURCES = {
+    "logs_student": "id, user_id, pin_code, nickname, school_name, target_date, created_at, action_points, actions_str",
+    "logs_member": "id, user_name, lom_name, action_label, target_date, created_at, points",
+    "game_scores": "id, name, school, time",
+}
+# 対象ごとに読む元の表（--only で要らない表は読まない）
+TARGET_SOURCES = {
+    "lom_totals": ("logs_member",),
+    "game_best": ("game_scores",),
+    "student_profiles": ("logs_student",),
+    "rollups": ("logs_student", "logs_member"),
+}
+CHUNKS_PER_WORKER = 4
+TIME_TOLERANCE = 1e-6    # game_best.time（double precision）の比較
+SHOW_DIFFS = 10          # 表ごとに表示する差分の数
+
+
+# ==========================================
+#  途中結果（チャンクごとに作って足し合わせる）
+# ==========================================
+
+class Partial:
+    def __init__(self):
+        self.rollup = Rollup()
+        self.lom = {}               # lom_name → points
+        self.best = {}              # (name, school) → time
+        self.profiles = {}          # user_id → {合計, ヒーロー, (id, あいことば), (id, ニックネーム), (id, 学校)}
+        self.heroes = set()
+        self.members = set()
+        self.co2 = 0
+        self.rows = {}              # 元の表 → 読んだ行数（rebuild_watermarks の件数と比べる）
+
+    def update(self, table, rows):
+        self.rows[table] = self.rows.get(table, 0) + len(rows)
+        if table == "logs_student":
+            for r in rows:
+                self.rollup.add_student(r)
+                self._add_profile(r)
+        elif table == "logs_member":
+            for r in rows:
+                self.rollup.add_member(r)
+                if r.get("lom_name") is not None:
+                    self.lom[r["lom_name"]] = self.lom.get(r["lom_name"], 0) + int(r.get("points") or 0)
+                if r.get("user_name") is not None:
+                    self.members.add(r["user_name"])
+                self.co2 += int(r.get("points") or 0)
+        elif table == "game_scores":
+            for r in rows:
+                if r.get("name") is None or r.get("school") is None or r.get("time") is None:
+                    continue
+                k = (r["name"], r["school"])
+                t = float(r["time"])
+                if k not in self.best or t < self.best[k]:
+                    self.best[k] = t
+
+    def _add_profile(self, r):
+        """sql/007 の初期値と同じ（後の行の空でないあいことば・ニックネーム、後の行の学校）"""
+        user_id = r.get("user_id")
+        points = int(r.get("action_points") or 0)
+        self.co2 += points
+        if user_id is None:
+            return
+        hero = is_hero_row(r)
+        if hero:
+            self.heroes.add(user_id)
+        rid = r.get("id") or 0
+        p = self.profiles.get(user_id)
+        if p is None:
+            p = self.profiles[user_id] = {"total_points": 0, "is_hero": False,
+                                          "pin_code": (-1, None), "nickname": (-1, None), "school_name": (-1, None)}
+        p["total_points"] += points
+        p["is_hero"] = p["is_hero"] or hero
+        if r.get("pin_code") and rid > p["pin_code"][0]:
+            p["pin_code"] = (rid, r["pin_code"])
+        if r.get("nickname") and rid > p["nickname"][0]:
+            p["nickname"] = (rid, r["nickname"])
+        if rid > p["school_name"][0]:
+            p["school_name"] = (rid, r.get("school_name"))
+
+    def merge(self, other):
+        self.rollup.merge(other.rollup)
+        for k, v in other.lom.items():
+            self.lom[k] = self.lom.get(k, 0) + v
+        for k, t in other.best.items():
+            if k not in self.best or t < self.best[k]:
+                self.best[k] = t
+        for user_id, q in other.profiles.items():
+            p = self.profiles.get(user_id)
+            if p is None:
+                self.profiles[user_id] = q
+                continue
+            p["total_points"] += q["total_points"]
+            p["is_hero"] = p["is_hero"] or q["is_hero"]
+            for col in ("pin_code", "nickname", "school_name"):
+                if q[col][0] > p[col][0]:
+                    p[col] = q[col]
+        self.heroes |= other.heroes
+        self.members |= other.members
+        self.co2 += other.co2
+        for table, n in other.rows.items():
+            self.rows[table] = self.rows.get(table, 0) + n
+        return self
+
+    # --- 集計テーブルの形（dict のキー → 行） ---
+
+    def lom_totals(self):
+        return {k: {"lom_name": k, "points": v} for k, v in self.lom.items()}
+
+    def game_best(self):
+        return {k: {"name": k[0], "school": k[1], "time": t} for k, t in self.best.items()}
+
+    def student_profiles(self):
+        return {user_id: {"user_id": user_id, "pin_code": p["pin_code"][1], "nickname": p["nickname"][1],
+                          "school_name": p["school_name"][1], "total_points": p["total_points"],
+                          "is_hero": p["is_hero"]}
+                for user_id, p in self.profiles.items()}
+
+    def rollups(self):
+        """(kind, key) → 行（school_users はプロフィールの学校から数える）"""
+        rollup = Rollup().merge(self.rollup)
+        for p in self.profiles.values():
+            rollup.add_profile({"school_name": p["school_name"][1]})
+        return {(r["kind"], r["key"]): r for r in rollup.to_rows() if r["row_count"] or r["points"]}
+
+    def global_stats(self):
+        """get_dashboard_stats と同じ (ヒーロー数, 参加者総数, CO2削減総量)"""
+        return len(self.heroes), len(self.profiles) + len(self.members), self.co2
+
+
+# ==========================================
+#  並列に読む
+# ==========================================
+
+class Connector:
+    """ワーカープロセスで Supabase クライアントを作る（プロセスごとに1つ）
+
+    ワーカーは spawn で起動するので、親プロセスのクライアント（と接続中のソケット）は引き継がない。
+    """
+
+    def __init__(self, url, key):
+        self.url = url
+        self.key = key
+
+    def __call__(self):
+        global _client
+        if _client is None:
+            from supabase import create_client
+            _client = create_client(self.url, self.key)
+        return _client
+
+
+_client = None
+
+
+def key_range(client, table, key="id"):
+    """(最小, 最大) の key（空なら None）"""
+    first = client.table(table).select(key).order(key, desc=False).limit(1).execute().data
+    if not first:
+        return None
+    last = client.table(table).select(key).order(key, desc=True).limit(1).execute().data
+    return first[0][key], last[0][key]
+
+
+def chunks(lo, hi, n):
+    """[lo, hi] を n 個の [始まり, 終わり) に分ける（整数の key）"""
+    n = max(1, min(n, hi - lo + 1))
+    step = -(-(hi - lo + 1) // n)
+    return [(start, min(start + step, hi + 1)) for start in range(lo, hi + 1, step)]
+
+
+def fold_chunk(connect, table, lo, hi, page_size=DEFAULT_PAGE_SIZE):
+    """ワーカー: table の id が [lo, hi) の行を読んで Partial にする"""
+    partial = Partial()
+    columns = SOURCES[table]
+    for rows in scan_table(connect(), table, columns, page_size=page_size,
+                           filters=lambda q: q.gte("id", lo).lt("id", hi)):
+        partial.update(table, rows)
+    return partial
+
+
+def sources_for(targets):
+    """targets を作るのに読む元の表（SOURCES の順）"""
+    needed = {table for target in targets for table in TARGET_SOURCES[target]}
+    return [table for table in SOURCES if table in needed]
+
+
+def compute(client, connect, workers=4, page_size=DEFAULT_PAGE_SIZE, progress=None, tables=tuple(SOURCES)):
+    """元の表（tables）を並列に読んで足し合わせた Partial
+
+    workers=1 ならプロセスを作らずにこのプロセスで読む。progress(済みのチャンク数, 全体) を呼ぶ。
+    """
+    tasks = []
+    for table in tables:
+        bounds = key_range(client, table)
+        if bounds is not None:
+            tasks += [(table, lo, hi) for lo, hi in chunks(bounds[0], bounds[1], workers * CHUNKS_PER_WORKER)]
+    total = Partial()
+    for table, _, _ in tasks:
+        total.rows.setdefault(table, 0)
+    if workers <= 1:
+        for i, (table, lo, hi) in enumerate(tasks, 1):
+            total.merge(fold_chunk(connect, table, lo, hi, page_size))
+            if progress is not None: progress(i, len(tasks))
+        return total
+    # fork だと親がもう作ったクライアント（_client）とその接続をワーカーが共有してしまう
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(fold_chunk, connect, table, lo, hi, page_size) for table, lo, hi in tasks]
+        for i, future in enumerate(futures, 1):
+            total.merge(future.result())
+            if progress is not None: progress(i, len(tasks))
+    return total
+
+
+# ==========================================
+#  今の値との差分
+# ==========================================
+
+def watermarks(client):
+    """sql/012 の rebuild_watermarks（元の表の件数・最大 id など。無ければ None）"""
+    try:
+        return client.rpc("rebuild_watermarks", {}).execute().data
+    except Exception:
+        return None
+
+
+def _read_all(client, table, columns, order, page_size=DEFAULT_PAGE_SIZE):
+    """集計テーブルを全部読む（一意な列が1つとは限らないので order の列で並べて offset で読む）
+
+    サーバーの max-rows が page_size より小さいと1ページが短く返るので、空のページで終わる。
+    """
+    out = []
+    while True:
+        query = client.table(table).select(columns)
+        for col in order:
+            query = query.order(col, desc=False)
+        rows = query.range(len(out), len(out) + page_size - 1).execute().data or []
+        if not rows:
+            return out
+        out += rows
+
+
+def missing_rows(computed, marks):
+    """読んだ行数が rebuild_watermarks の件数と違う表 [(表, 読んだ行数, 件数)]"""
+    return [(table, n, (marks.get(table) or {}).get("count"))
+            for table, n in sorted(computed.rows.items())
+            if n != (marks.get(table) or {}).get("count")]
+
+
+def _live_rollups(client):
+    """rollups を (kind, key) ごとに shard を足し合わせて読む（date 系の表記は揃えない）"""
+    live = {}
+    for r in _read_all(client, "rollups", "kind, key, row_count, points", ("id",)):
+        cell = live.setdefault((r["kind"], r["key"]), {"kind": r["kind"], "key": r["key"], "row_count": 0, "points": 0})
+        cell["row_count"] += int(r.get("row_count") or 0)
+        cell["points"] += int(r.get("points") or 0)
+    return {k: c for k, c in live.items() if c["row_count"] or c["points"]}
+
+
+def live_values(client, targets=TARGETS):
+    """今の集計テーブル {対象: {キー: 行}}（読めなければその対象は None）"""
+    readers = {
+        "lom_totals": lambda: {r["lom_name"]: r for r in _read_all(
+            client, "lom_totals", "lom_name, points", ("lom_name",))},
+        "game_best": lambda: {(r["name"], r["school"]): r for r in _read_all(
+            client, "game_best", "name, school, time", ("name", "school"))},
+        "student_profiles": lambda: {r["user_id"]: r for r in _read_all(
+            client, "student_profiles", "user_id, pin_code, nickname, school_name, total_points, is_hero", ("user_id",))},
+        "rollups": lambda: _live_rollups(client),
+    }
+    out = {}
+    for target in targets:
+        try:
+            out[target] = readers[target]()
+        except Exception as e:
+            print(f"{target}: 読めません（{e}）", file=sys.stderr)
+            out[target] = None
+    return out
+
+
+def _same(a, b):
+    for col, v in a.items():
+        w = b.get(col)
+        if isinstance(v, float) or isinstance(w, float):
+            if w is None or v is None or abs(float(v) - float(w)) > TIME_TOLERANCE:
+                return False
+        elif (v or None) != (w or None) and not (v == 0 and w == 0):
+            return False
+    return True
+
+
+def diff(computed, live):
+    """{"upsert": [作り直した行], "delete": [今だけにあるキー]}"""
+    upsert = [row for k, row in computed.items() if k not in live or not _same(row, live[k])]
+    delete = [k for k in live if k not in computed]
+    return {"upsert": upsert, "delete": delete}
+
+
+def _keys(target, keys):
+    """apply_rebuild に渡す形の削除キー"""
+    if target == "game_best":
+        return [{"name": n, "school": s} for n, s in keys]
+    if target == "rollups":
+        return [{"kind": k, "key": v} for k, v in keys]
+    return list(keys)
+
+
+def apply(client, expected, changes):
+    """sql/012 の apply_rebuild（元の表が読んだときと違えば例外で何も書かない）"""
+    payload = {}
+    for target, d in changes.items():
+        payload[target] = {"upsert": d["upsert"], "delete": _keys(target, d["delete"])}
+    return client.rpc("apply_rebuild", {"p_expected": expected, "p_changes": payload}).execute().data
+
+
+# ==========================================
+#  コマンドライン
+# ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python rebuild.py", description="集計テーブルを元の表から作り直す")
+    parser.add_argument("--apply", action="store_true", help="差分を反映する（省略時は表示だけ）")
+    parser.add_argument("--only", default=",".join(TARGETS), help="対象（カンマ区切り）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="並列に読むプロセス数")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--url", default=None, help="Supabase の URL（省略時は secrets.toml / SUPABASE_URL）")
+    parser.add_argument("--key", default=None, help="Supabase の key（省略時は secrets.toml / SUPABASE_KEY）")
+    args = parser.parse_args(argv)
+
+    targets = [t.strip() for t in args.only.split(",") if t.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"対象は {' / '.join(TARGETS)} のどれか: {', '.join(sorted(unknown))}")
+    url, key = supabase_connection(args.url, args.key)
+    if not url or not key:
+        parser.error("接続先がありません（--url / --key か .streamlit/secrets.toml）")
+
+    connect = Connector(url, key)
+    client = connect()
+    started = time.perf_counter()
+    before = watermarks(client)
+    tables = sources_for(targets)
+    computed = compute(client, connect, workers=args.workers, page_size=args.page_size, tables=tables,
+                       progress=lambda i, n: print(f"\rchunks {i}/{n}", end="", file=sys.stderr, flush=True))
+    after = watermarks(client)
+    print(file=sys.stderr)
+    print(f"computed in {time.perf_counter() - started:.1f}s")
+    short = missing_rows(computed, after) if after else []
+    for table, n, count in short:
+        print(f"{table}: {n:,} 行しか読めていません（件数 {count}）", file=sys.stderr)
+
+    # 全体統計は小学生と JCメンバーの両方を読んだときだけ
+    if {"logs_student", "logs_member"} <= set(tables):
+        heroes, participants, co2 = computed.global_stats()
+        try:
+            stats = client.rpc("get_dashboard_stats", {"top_n": 0}).execute().data or {}
+            print(f"global: heroes {heroes:,} (live {stats.get('hero_count')}), participants {participants:,} "
+                  f"(live {stats.get('participant_count')}), co2 {co2:,} (live {stats.get('total_co2')})")
+        except Exception:
+            print(f"global: heroes {heroes:,}, participants {participants:,}, co2 {co2:,}")
+
+    live = live_values(client, targets)
+    changes = {}
+    for target in targets:
+        if live[target] is None:
+            continue
+        d = diff(getattr(computed, target)(), live[target])
+        print(f"{target}: {len(d['upsert']):,} to write, {len(d['delete']):,} to delete")
+        for row in d["upsert"][:SHOW_DIFFS]:
+            k = {"lom_totals": lambda r: r["lom_name"], "game_best": lambda r: (r["name"], r["school"]),
+                 "student_profiles": lambda r: r["user_id"], "rollups": lambda r: (r["kind"], r["key"])}[target](row)
+            print(f"  {k}: {live[target].get(k)} -> {row}")
+        for k in d["delete"][:SHOW_DIFFS]:
+            print(f"  {k}: {live[target][k]} -> (delete)")
+        if d["upsert"] or d["delete"]:
+            changes[target] = d
+
+    if not args.apply:
+        print("dry run（--apply で反映）" if changes else "差分なし")
+        return
+    if not changes:
+        print("差分なし")
+        return
+    if before is None:
+        sys.exit("sql/012_apply_rebuild.sql が未適用です")
+    if before != after:
+        sys.exit("読んでいる間に元の表が変わりました。もう一度実行してください")
+    if short:
+        sys.exit("読んだ行数が元の表の件数と合いません（途中で切れた読み取りは反映しない）")
+    print(f"applied: {apply(client, after, changes)}")
+
+
+if __name__ == "__main__":
+    main()
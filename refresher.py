@@ -0,0 +1,122 @@
+"""重い集計をバックグラウンドで定期的に作り直す（stale-while-revalidate）
+
+st.cache_data(ttl=...) だと、期限が切れた直後に来た人がその場で集計を待ち、
+同じ時刻に来た何人もが同じ集計を同時に走らせてしまう。ここでは
+  - 集計はワーカースレッドが interval 秒ごとに行う（同時に走るのは1本だけ）
+  - 読む側は最後に成功した値とその経過秒数をすぐ受け取る（待たない）
+  - 失敗したら前の値を使い続ける
+ようにする。待つのはプロセスが起動して最初の1回だけ（最大 first_wait 秒）。
+最初の集計が失敗したら、retry_after 秒はリクエストの中で集計し直さず (None, None) を返す
+（DB が落ちている間に、表示のたびに全件集計が走らないように。再試行はワーカースレッドが行う）。
+しばらく誰も読まなければ（idle_after 秒）集計を止め、次に読まれたときに再開する。
+
+Streamlit の @st.cache_resource で1プロセスに1つだけ作って共有する想定。
+loader はワーカースレッドから呼ばれるので、st.* を使わないこと。
+"""
+import threading
+import time
+
+
+class BackgroundRefresher:
+    def __init__(self, loader, interval, name="refresher", first_wait=10.0, idle_after=1800.0, on_refresh=None,
+                 retry_after=30.0):
+        # loader: () -> 値（例外なら前の値のまま）
+        # on_refresh: 新しい値が入るたびに呼ぶ（値を別の場所にも反映したいとき）
+        self.name = name
+        self._loader = loader
+        self._interval = interval
+        self._first_wait = first_wait
+        self._idle_after = idle_after
+        self._on_refresh = on_refresh
+        self._retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._loading = threading.Lock()      # 集計の single-flight
+        self._loaded = threading.Event()      # 一度でも成功したか
+        self._wake = threading.Event()
+        self._thread = None
+
+        self._value = None
+        self._loaded_at = None
+        self._last_read = time.monotonic()
+        self._last_duration = None
+        self._errors = 0
+        self._last_error = None
+        self._failed_at = None      # 最後に失敗した時刻（まだ値がない間の再試行の間隔に使う）
+
+    def get(self):
+        """(最後に成功した値, 経過秒数) を返す。まだ値がなければ最初の集計を待つ（値がなければ (None, None)）"""
+        self._ensure_thread()
+        with self._lock:
+            idle = time.monotonic() - self._last_read >= self._idle_after
+            self._last_read = time.monotonic()
+        if idle:
+            # 止まっていた間の値なので、返しつつ裏で作り直す
+            self._wake.set()
+        if not self._loaded.is_set():
+            with self._lock:
+                failed_at = self._failed_at
+            if failed_at is not None and time.monotonic() - failed_at < self._retry_after:
+                return None, None
+            if not self.refresh():
+                self._loaded.wait(self._first_wait)
+        with self._lock:
+            if self._loaded_at is None:
+                return None, None
+            return self._value, time.monotonic() - self._loaded_at
+
+    def refresh(self):
+        """今すぐ集計する（別の集計が走っていれば何もせず False）"""
+        if not self._loading.acquire(blocking=False):
+            return False
+        try:
+            started = time.monotonic()
+            try:
+                value = self._loader()
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                    self._last_error = f"{type(e).__name__}: {e}"
+                    self._failed_at = time.monotonic()
+                return True
+            with self._lock:
+                self._value = value
+                self._loaded_at = time.monotonic()
+                self._last_duration = self._loaded_at - started
+            if self._on_refresh is not None:
+                self._on_refresh(value)
+            self._loaded.set()
+            return True
+        finally:
+            self._loading.release()
+
+    def status(self):
+        """メトリクス表示用"""
+        with self._lock:
+            return {
+                "name": self.name,
+                "age_s": None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 1),
+                "last_duration_s": None if self._last_duration is None else round(self._last_duration, 3),
+                "interval_s": self._interval,
+                "errors": self._errors,
+                "last_error": self._last_error,
+            }
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=f"refresher-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            # まだ値がなければ retry_after ごとに再試行する
+            wait = self._interval if self._loaded.is_set() else min(self._interval, self._retry_after)
+            self._wake.wait(wait)
+            self._wake.clear()
+            with self._lock:
+                idle = time.monotonic() - self._last_read >= self._idle_after
+            if idle:
+                continue
+            self.refresh()
@@ -0,0 +1,552 @@
+"""データアクセス層（app.py / admin.py / visitor.py 共通）
+
+Supabase クライアントの作成、リクエストのタイムアウト、クエリごとのキャッシュ方針と
+キャッシュの破棄をここにまとめる。画面側は get_repository() から
+students / members / games / rollups を取り出して使い、supabase.table(...) を直接呼ばない。
+
+    repo = get_repository()
+    profile = repo.students.profile(user_id)
+    ranking = repo.members.lom_ranking()
+
+戻り値は pandas に依存しない list / dict / タプルにしてある（DataFrame 化は画面側で）。
+"""
+from dataclasses import dataclass, field
+import datetime
+
+import streamlit as st
+from supabase import create_client, ClientOptions
+
+from scan import aggregate, scan_table
+from domain import (
+    is_hero_history, parse_student_history,
+    student_stats_folds, member_stats_folds, lom_ranking_folds,
+    global_stats_result, dashboard_stats_result, lom_ranking_result,
+)
+from live_stats import StatsAccumulator
+from rollups import StudentRollupFold, breakdown, trend
+from history_sync import HistoryCache
+from refresher import BackgroundRefresher
+from metrics import instrument, REGISTRY as METRICS
+from leaderboard import Leaderboard
+
+# Supabase (PostgREST) へのリクエストのタイムアウト秒数（secrets の timeout で上書き可）
+DEFAULT_TIMEOUT = 10
+
+# ==========================================
+#  キャッシュ方針（秒）
+# ==========================================
+DASHBOARD_STATS_REFRESH = 300  # app.py の全体統計（DB側の集計関数）を裏で作り直す間隔
+GLOBAL_STATS_RECONCILE = 600  # visitor.py の全体統計の答え合わせ間隔（裏で行う）
+LOM_RANKING_TTL = 60        # LOM対抗ランキング（15行）。保存時にも破棄
+ROLLUPS_TTL = 60            # アクション別・学校別・日付別の集計（rollups 表）
+LEADERBOARD_TTL = 300       # ゲームランキングの DB 読み直し間隔
+LEADERBOARD_SIZE = 20
+HISTORY_CACHE_USERS = 20000  # 履歴を覚えておく人数（プロセスごと）
+
+# visitor.py の保存方式。"snapshot" は1人1日1行の Upsert（sql/006 の一意インデックスが必要。
+# なければ自動で "delta" に戻る）、"delta" は従来どおり差分ポイントの行を Insert
+# （sql/010 の rollups は1人1日1行が前提。"delta" だとアクション別の集計が膨らむ）
+STUDENT_WRITE_MODE = "snapshot"
+
+# ==========================================
+#  接続
+# ==========================================
+
+@st.cache_resource
+def init_connection():
+    """Supabase クライアント（プロセスで1つ。呼び出しは metrics.py で計測する）"""
+    try:
+        conf = st.secrets["supabase"]
+        timeout = int(conf.get("timeout", DEFAULT_TIMEOUT))
+        options = ClientOptions(postgrest_client_timeout=timeout)
+        return instrument(create_client(conf["url"], conf["key"], options=options))
+    except Exception as e:
+        st.error(f"Supabase接続エラー: secretsを確認してください。 {e}")
+        return None
+
+
+@st.cache_resource
+def get_repository():
+    """画面から使うリポジトリ（プロセスで1つ）"""
+    return Repository(init_connection())
+
+
+class Repository:
+    def __init__(self, client):
+        self.client = client
+        self.students = StudentRepository(client)
+        self.members = MemberRepository(client)
+        self.games = GameRepository(client)
+        self.rollups = RollupRepository(client)
+
+    @property
+    def connected(self):
+        return self.client is not None
+
+
+# ==========================================
+#  小学生（logs_student）
+# ==========================================
+
+@dataclass
+class StudentRecord:
+    user_id: str
+    pin_code: str = ""
+    nickname: str = ""
+    total: int = 0
+    history: dict = field(default_factory=dict)  # {日付: [やったことリスト]}
+
+    @property
+    def is_new(self):
+        return not self.history
+
+
+@dataclass
+class StudentProfile:
+    """ログインに使う1人1行（sql/007 の student_profiles）"""
+    user_id: str
+    pin_code: str = ""
+    nickname: str = ""
+    total: int = 0
+    is_hero: bool = False
+    exists: bool = False
+    history: dict = None  # 予備ルートで履歴ごと読んだときだけ入る
+
+
+def build_student_row(user_id, target_date, actions, points, memo, nickname="", pin_code=None, q1="", q2="", q3=""):
+    """logs_student に入れる1行を作る"""
+    row = {
+        "user_id": user_id,
+        "nickname": nickname,
+        "school_name": user_id.split("_")[0], # IDから学校名を抽出
+        "target_date": target_date,
+        "actions_str": ", ".join(actions),
+        "action_points": points,
+        "memo": memo, "q1": q1, "q2": q2, "q3": q3,
+        # created_at は自動で入る
+    }
+    if pin_code is not None:
+        row["pin_code"] = pin_code
+    return row
+
+
+# on_conflict に合う一意インデックスがない（PostgreSQL のエラーコード）
+NO_UNIQUE_INDEX = "42P10"
+# 表・列がない（PostgreSQL / PostgREST のエラーコード）
+MISSING_TABLE = ("42P01", "PGRST205")
+MISSING_COLUMN = "42703"
+
+HISTORY_COLUMNS = "id, user_id, target_date, actions_str, updated_at"
+
+
+class StudentRepository:
+    def __init__(self, client):
+        self.client = client
+        self.snapshot_supported = True
+        self.profiles_supported = True
+        self.history_sync_supported = True
+
+    def load(self, user_id: str):
+        """ユーザーの記録を取得（StudentRecord。取得に失敗したら None）"""
+        if not self.client: return StudentRecord(user_id)
+        try:
+            rows = self.client.table("logs_student").select("*").eq("user_id", user_id).order("id").execute().data
+        except Exception:
+            return None
+        return parse_student_history(rows, into=StudentRecord(user_id))
+
+    def profile(self, user_id: str):
+        """ログイン用のプロフィール（StudentProfile。取得に失敗したら None）
+
+        student_profiles を主キーで1行引く。表がまだない（sql/007 未適用）と分かったら、
+        このプロセスでは以後 logs_student を全部読んで作る。
+        """
+        if not self.client: return StudentProfile(user_id)
+        if self.profiles_supported:
+            try:
+                rows = (self.client.table("student_profiles")
+                        .select("pin_code, nickname, total_points, is_hero")
+                        .eq("user_id", user_id).limit(1).execute().data)
+            except Exception as e:
+                if getattr(e, "code", None) not in MISSING_TABLE:
+                    return None
+                self.profiles_supported = False
+            else:
+                if not rows: return StudentProfile(user_id, history={})
+                row = rows[0]
+                return StudentProfile(user_id, pin_code=row.get("pin_code") or "", nickname=row.get("nickname") or "",
+                                      total=int(row.get("total_points") or 0), is_hero=bool(row.get("is_hero")), exists=True)
+        record = self.load(user_id)
+        if record is None: return None
+        return StudentProfile(user_id, pin_code=record.pin_code, nickname=record.nickname, total=record.total,
+                              is_hero=is_hero_history(record.history), exists=not record.is_new, history=record.history)
+
+    def history(self, user_id: str):
+        """チェック表の履歴 {日付: [やったことリスト]}（失敗したら None）
+
+        プロセス内に覚えている人は、前回読んだ updated_at より新しい行だけを読んで足し込む
+        （history_sync.py）。updated_at 列がまだない（sql/008 未適用）と分かったら、
+        このプロセスでは以後 日付とアクションの2列を毎回全部読む。
+        """
+        if not self.client: return {}
+        if self.history_sync_supported:
+            cache = get_history_cache()
+            since = cache.since(user_id)
+            try:
+                rows = self._history_rows(user_id, since)
+                if since is not None:
+                    merged = cache.merge(user_id, rows)
+                    if merged is not None: return merged
+                    # 読んでいる間に LRU から追い出された。新しい行だけでは全体にならないので全部読み直す
+                    rows = self._history_rows(user_id, None)
+            except Exception as e:
+                if getattr(e, "code", None) != MISSING_COLUMN:
+                    return None
+                self.history_sync_supported = False
+            else:
+                return cache.replace(user_id, rows)
+        try:
+            rows = (self.client.table("logs_student").select("target_date, actions_str")
+                    .eq("user_id", user_id).order("id").execute().data)
+        except Exception:
+            return None
+        return parse_student_history(rows).history
+
+    def _history_rows(self, user_id, since=None):
+        """履歴の行（since があればその updated_at 以降だけ）"""
+        query = self.client.table("logs_student").select(HISTORY_COLUMNS).eq("user_id", user_id)
+        if since is not None:
+            query = query.gte("updated_at", since)
+        return query.order("id").execute().data
+
+    def insert_days(self, rows: list, is_new_participant=False, became_hero=False):
+        """複数日ぶんを1回の Insert で保存（差分ポイント方式）。保存した行を返す（失敗時は例外）"""
+        if not self.client or not rows: return None
+        data = self.client.table("logs_student").insert(rows).execute().data
+        get_history_cache().merge_saved(data)
+        # キャッシュは捨てずに差分だけ足し込む
+        diff_points = sum(r["action_points"] for r in rows)
+        get_stats_accumulator().apply(diff_points, new_participant=is_new_participant, new_hero=became_hero)
+        return data or rows
+
+    def upsert_days(self, rows: list, diff_points=0, is_new_participant=False, became_hero=False):
+        """複数日ぶんを1回の Upsert で保存（1日1行方式）。保存した行を返す（失敗時は例外）"""
+        if not self.client or not rows: return None
+        data = self.client.table("logs_student").upsert(rows, on_conflict="user_id, target_date").execute().data
+        get_history_cache().merge_saved(data)
+        get_stats_accumulator().apply(diff_points, new_participant=is_new_participant, new_hero=became_hero)
+        return data or rows
+
+    def save_days(self, rows: list, diffs: list, is_new_participant=False, became_hero=False):
+        """その日の絶対ポイントの rows と、前回からの差分 diffs（rows と同じ順）で保存
+
+        上書き方式で1人1日1行に保つ。(user_id, target_date) の一意インデックスがまだない
+        （sql/006 未適用）と分かったら、このプロセスでは以後ずっと差分方式で Insert する。
+        """
+        if not self.client or not rows: return None
+        if STUDENT_WRITE_MODE == "snapshot" and self.snapshot_supported:
+            try:
+                return self.upsert_days(rows, diff_points=sum(diffs), is_new_participant=is_new_participant, became_hero=became_hero)
+            except Exception as e:
+                if getattr(e, "code", None) != NO_UNIQUE_INDEX:
+                    raise
+                self.snapshot_supported = False
+        delta_rows = [{**row, "action_points": diff} for row, diff in zip(rows, diffs)]
+        return self.insert_days(delta_rows, is_new_participant=is_new_participant, became_hero=became_hero)
+
+    def global_stats(self):
+        """((CO2削減量, ヒーロー数, 参加者数), 経過秒数)：保存ごとの差分を反映済みの値
+
+        全件集計はワーカースレッドが定期的に行うので、ここでは待たない（プロセスの最初の1回だけ待つ）。
+        """
+        accumulator, refresher = get_global_stats()
+        _, age = refresher.get()
+        return accumulator.snapshot(), age
+
+    def dashboard_stats(self):
+        """((ヒーロー数, 参加者総数, CO2削減総量), 経過秒数)：小学生 + JCメンバー"""
+        if not self.client: return (0, 0, 0), None
+        value, age = get_dashboard_refresher().get()
+        return value or (0, 0, 0), age
+
+
+def aggregate_student_stats(client, with_rollups=False):
+    """logs_student を1回スキャンして student_stats_folds を集計
+
+    actions_mask（整数）で読み、列がまだない（sql/009 未適用）なら actions_str で読み直す。
+    with_rollups=True なら同じスキャンでアクション別・学校別・日付別の集計（"rollup"）も作る。
+    """
+    def folds(use_mask):
+        f = student_stats_folds(use_mask=use_mask)
+        if with_rollups:
+            f["rollup"] = StudentRollupFold(use_mask=use_mask)
+        return f
+
+    try:
+        return aggregate(client, "logs_student", folds(True))
+    except Exception as e:
+        if getattr(e, "code", None) != MISSING_COLUMN:
+            raise
+        return aggregate(client, "logs_student", folds(False))
+
+
+def load_global_stats(client):
+    """logs_student を全件集計（1000件ずつページング。失敗時は例外）
+
+    ((CO2削減量, ヒーロー数, 参加者数), rollups 表と同じ形の行) を返す。後者は rollups 表が
+    ない環境で RollupRepository が使う（スキャンの回数は増えない）。
+    """
+    stats = aggregate_student_stats(client, with_rollups=True)
+    return global_stats_result(stats), stats["rollup"].to_rows()
+
+
+@st.cache_resource
+def get_global_stats():
+    """プロセス共通の統計アキュムレータと、その答え合わせを定期的に行うワーカー（9万人対策）"""
+    client = init_connection()
+    accumulator = StatsAccumulator()
+    if not client:
+        accumulator.load((0, 0, 0))
+    refresher = BackgroundRefresher(
+        (lambda: load_global_stats(client)) if client else (lambda: ((0, 0, 0), [])),
+        interval=GLOBAL_STATS_RECONCILE, name="global_stats",
+        on_refresh=lambda value: accumulator.load(value[0]))
+    METRICS.watch(refresher)
+    return accumulator, refresher
+
+
+def get_stats_accumulator():
+    """保存時に差分を足し込む先"""
+    return get_global_stats()[0]
+
+
+@st.cache_resource
+def get_history_cache():
+    """プロセス共通の履歴キャッシュ（新しいセッション・自動ログインでも差分だけ読む）"""
+    return HistoryCache(max_users=HISTORY_CACHE_USERS)
+
+
+@st.cache_resource
+def get_dashboard_refresher():
+    """ダッシュボード統計を定期的に作り直すワーカー（プロセスで1つ）"""
+    client = init_connection()
+    refresher = BackgroundRefresher(lambda: load_dashboard_stats(client), interval=DASHBOARD_STATS_REFRESH, name="dashboard_stats")
+    METRICS.watch(refresher)
+    return refresher
+
+
+def load_dashboard_stats(client):
+    try:
+        # sql/001_dashboard_stats.sql の get_dashboard_stats を呼ぶ
+        # ゲームランキングは GameRepository から読むので top_n=0
+        stats = client.rpc("get_dashboard_stats", {"top_n": 0}).execute().data or {}
+        return (
+            int(stats.get("hero_count") or 0),
+            int(stats.get("participant_count") or 0),
+            int(stats.get("total_co2") or 0),
+        )
+    except Exception:
+        # 集計関数がまだ作成されていない環境向けの予備ルート
+        return dashboard_stats_by_scan(client)
+
+
+def dashboard_stats_by_scan(client):
+    """旧方式: 各テーブルをページングしながら読み、Python 側で集計"""
+    stu = aggregate_student_stats(client)
+    mem = aggregate(client, "logs_member", member_stats_folds())
+    return dashboard_stats_result(stu, mem)
+
+
+# ==========================================
+#  アクション別・学校別・日付別の集計（rollups）
+# ==========================================
+
+class RollupRepository:
+    def __init__(self, client):
+        self.client = client
+
+    def breakdown(self, kind, n=None):
+        """[{"key", "rows", "points"}]（ポイントの多い順。date 系は日付順）
+
+        kind: action / school / date / hour / member_action / member_date / member_hour / school_users（rollups.py）
+        読めなければ例外。
+        """
+        if not self.client: return []
+        return breakdown(self._rows(), kind, n)
+
+    def trend(self, by="date"):
+        """CO2削減量の推移 [{"key", "student", "member", "total", "cumulative"}]（by は "date" か "hour"。失敗時は例外）"""
+        if not self.client: return []
+        return trend(self._rows(), by=by)
+
+    def _rows(self):
+        rows = rollups_cached(self.client)
+        if rows is None:
+            # rollups 表が無い環境向け：全体統計のスキャンで一緒に作った小学生の分
+            # （member_* と school_users は出ない）
+            value, _ = get_global_stats()[1].get()
+            rows = value[1] if value else []
+        return rows
+
+
+@st.cache_data(ttl=ROLLUPS_TTL)
+def rollups_cached(_client):
+    """sql/010_rollups.sql の集計テーブル（数百〜千行程度。表がまだなければ None、ほかの失敗は例外）"""
+    try:
+        return [r for page in scan_table(_client, "rollups", "kind, key, row_count, points") for r in page]
+    except Exception as e:
+        if getattr(e, "code", None) not in MISSING_TABLE:
+            raise
+        return None
+
+
+# ==========================================
+#  JCメンバー（logs_member）
+# ==========================================
+
+class MemberRepository:
+    def __init__(self, client):
+        self.client = client
+
+    def fetch_logs(self, user_name: str, lom_name: str):
+        """ログインユーザーの過去の記録（行のリスト）"""
+        if not self.client: return []
+        try:
+            return self.client.table("logs_member")\
+                .select("*")\
+                .eq("user_name", user_name)\
+                .eq("lom_name", lom_name)\
+                .execute().data or []
+        except Exception:
+            return []
+
+    def lom_ranking(self):
+        """LOMごとの合計ポイント [{"lom_name", "points"}]（多い順。失敗時は例外）"""
+        if not self.client: return []
+        return lom_ranking_cached(self.client)
+
+    def sync_checks(self, user_name: str, lom_name: str, existing_rows: list, checked: set, points: dict, target_dates: list):
+        """チェック表を保存（変わったセルだけを1回の呼び出しで反映）
+
+        existing_rows: fetch_logs で読み込み済みの行
+        checked: 画面でチェックされている {(日付, アクション)}
+        points: {アクション: ポイント}
+        """
+        if not self.client: return False
+        # 失敗時は例外
+        existing = {(r.get("target_date"), r.get("action_label")) for r in existing_rows if r.get("target_date") in target_dates}
+        inserts = [{"target_date": d, "action_label": k, "points": points[k]} for d, k in sorted(checked - existing)]
+        deletes = [{"target_date": d, "action_label": k} for d, k in sorted(existing - checked)]
+        if not inserts and not deletes:
+            return True # 変更なし
+
+        try:
+            # sql/004_sync_member_logs.sql：追加と削除を1トランザクションで
+            self.client.rpc("sync_member_logs", {
+                "p_user_name": user_name,
+                "p_lom_name": lom_name,
+                "p_inserts": inserts,
+                "p_deletes": deletes,
+            }).execute()
+        except Exception:
+            # 同期関数がまだ無い環境向け：期間中を全削除して入れ直す（旧方式）
+            self.client.table("logs_member")\
+                .delete()\
+                .eq("user_name", user_name)\
+                .eq("lom_name", lom_name)\
+                .in_("target_date", target_dates)\
+                .execute()
+            rows = [
+                {"user_name": user_name, "lom_name": lom_name, "target_date": d,
+                 "action_label": k, "is_done": True, "points": points[k]}
+                for d, k in sorted(checked)
+            ]
+            if rows:
+                self.client.table("logs_member").insert(rows).execute()
+
+        # 自分の保存をすぐランキングに反映（15行なので読み直しは軽い）
+        lom_ranking_cached.clear()
+        return True
+
+
+@st.cache_data(ttl=LOM_RANKING_TTL)
+def lom_ranking_cached(_client):
+    """失敗は例外（キャッシュされないので次の表示で読み直す）"""
+    try:
+        # sql/002_lom_totals.sql の集計テーブル（最大15行）
+        return _client.table("lom_totals")\
+            .select("lom_name, points")\
+            .order("points", desc=True)\
+            .execute().data or []
+    except Exception as e:
+        if getattr(e, "code", None) not in MISSING_TABLE:
+            raise
+    # 集計テーブルが無い環境向け：logs_member をページングしながら集計
+    totals = aggregate(_client, "logs_member", lom_ranking_folds())["lom"]
+    return lom_ranking_result(totals)
+
+
+# ==========================================
+#  分別ゲーム（game_scores）
+# ==========================================
+
+class GameRepository:
+    def __init__(self, client):
+        self.client = client
+
+    def save_score(self, name: str, school: str, score_time: float):
+        """記録を保存し、ランキングにも即反映（失敗時は例外）"""
+        if not self.client: return False
+        data = {
+            "name": name,
+            "school": school,
+            "time": score_time,
+            "date": datetime.date.today().isoformat()
+        }
+        self.client.table("game_scores").insert(data).execute()
+        get_leaderboard().add(data)
+        return True
+
+    def rankings(self, mode="all", n=10):
+        """最速ランキング（mode: "all" / "daily"）。DB ではなくメモリから読む"""
+        if not self.client: return []
+        return get_leaderboard().top(mode, n=n)
+
+    def personal_best(self, name: str, school: str):
+        """自己ベスト（記録なしは None）"""
+        if not self.client: return None
+        try:
+            # 自己ベスト表（sql/003_game_best.sql）を主キーで引く
+            rows = self.client.table("game_best")\
+                .select("time")\
+                .eq("name", name)\
+                .eq("school", school)\
+                .limit(1)\
+                .execute().data
+        except Exception:
+            try:
+                # 自己ベスト表がまだ無い環境向け：自分の記録の中で最速を取得
+                rows = self.client.table("game_scores")\
+                    .select("time")\
+                    .eq("name", name)\
+                    .eq("school", school)\
+                    .order("time", desc=False)\
+                    .limit(1)\
+                    .execute().data
+            except Exception:
+                return None
+        return rows[0]["time"] if rows else None
+
+
+def load_game_rankings(date_str, limit):
+    """game_scores の上位（date_str が None なら歴代、日付ならその日）"""
+    query = init_connection().table("game_scores").select("name, school, time, date")
+    if date_str is not None:
+        query = query.eq("date", date_str)
+    return query.order("time", desc=False).limit(limit).execute().data or [] # タイムが短い順
+
+
+@st.cache_resource
+def get_leaderboard():
+    """プロセス共通のゲームランキング（保存時に書き込み、定期的に DB から読み直し）"""
+    return Leaderboard(load_game_rankings, size=LEADERBOARD_SIZE, ttl=LEADERBOARD_TTL)
@@ -0,0 +1,282 @@
+"""アクション別・学校別・日付別の集計（ロールアップ）
+
+1行がどの集計にいくつ足されるかをここで決める（画面や DB に依存しない）。
+  小学生（logs_student）: action（actions_mask のビットごと）/ school / date / hour
+  JCメンバー（logs_member）: member_action / member_date / member_hour
+  （hour 系の key は created_at の日本時間の1時間ごと "2026-06-01 09:00"）
+  学校ごとの参加人数（student_profiles の行が増えたとき）: school_users
+各集計は (kind, key) ごとの [行数, ポイント]。DB の rollups 表は同じ (kind, key) を
+shard（user_id のハッシュ）で何行かに分けて持つ（同時の保存が1行の更新待ちで並ばないように）。
+読むときは shard を足し合わせる。
+
+action は行ごとに actions_mask の行動を数えるので、logs_student が1人1日1行（sql/006）
+であることが前提（差分ポイントの行が何行もあると、同じ行動を何度も数える）。
+
+本番では sql/010_rollups.sql のトリガーが保存のたびに rollups 表へ差分を足し、
+localbase はこのモジュールで同じことをする。全部作り直すときは行を流し込んで
+Rollup を作る（scan.py の集計器 StudentRollupFold / MemberRollupFold、rebuild_rollups）。
+"""
+import datetime
+
+from domain import STUDENT_ACTION_BITS, STUDENT_ACTION_POINTS, actions_of, encode_actions
+
+STUDENT_KINDS = ("action", "school", "date", "hour")
+MEMBER_KINDS = ("member_action", "member_date", "member_hour")
+KINDS = STUDENT_KINDS + MEMBER_KINDS + ("school_users",)
+DATE_KINDS = ("date", "member_date")
+HOUR_KINDS = ("hour", "member_hour")
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+_hours = {}
+
+
+def normalize_date(key):
+    """"6/1 (月)"（visitor.py）と "6/1(月)"（app.py）を同じ日にする"""
+    return str(key).replace(" ", "") if key is not None else key
+
+
+def hour_bucket(created_at):
+    """created_at（ISO 文字列）→ 日本時間の1時間の区切り "2026-06-01 09:00"（読めなければ None）
+
+    同じ時間帯・同じタイムゾーン表記の文字列は同じ結果なので、先頭13文字と末尾6文字で覚えておく。
+    """
+    if not created_at:
+        return None
+    value = str(created_at).replace("Z", "+00:00")
+    key = (value[:13], value[-6:])
+    bucket = _hours.get(key)
+    if bucket is None:
+        try:
+            t = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=datetime.timezone.utc)
+        bucket = t.astimezone(JST).strftime("%Y-%m-%d %H:00")
+        if len(_hours) < 100000:
+            _hours[key] = bucket
+    return bucket
+
+
+def row_mask(row):
+    mask = row.get("actions_mask")
+    return int(mask) if mask is not None else encode_actions(actions_of(row))
+
+
+def student_contributions(row):
+    """logs_student の1行 → [(kind, key, ポイント)]（行数はそれぞれ 1）"""
+    points = int(row.get("action_points") or 0)
+    out = []
+    if row.get("school_name") is not None:
+        out.append(("school", row["school_name"], points))
+    if row.get("target_date") is not None:
+        out.append(("date", row["target_date"], points))
+    hour = hour_bucket(row.get("created_at"))
+    if hour is not None:
+        out.append(("hour", hour, points))
+    mask = row_mask(row)
+    for action, bit in STUDENT_ACTION_BITS.items():
+        if mask & bit:
+            out.append(("action", action, STUDENT_ACTION_POINTS.get(action, 0)))
+    return out
+
+
+def member_contributions(row):
+    """logs_member の1行 → [(kind, key, ポイント)]"""
+    points = int(row.get("points") or 0)
+    out = []
+    if row.get("action_label") is not None:
+        out.append(("member_action", row["action_label"], points))
+    if row.get("target_date") is not None:
+        out.append(("member_date", row["target_date"], points))
+    hour = hour_bucket(row.get("created_at"))
+    if hour is not None:
+        out.append(("member_hour", hour, points))
+    return out
+
+
+class Rollup:
+    """(kind, key) → [行数, ポイント]"""
+
+    def __init__(self):
+        self.totals = {}
+
+    def add(self, kind, key, rows, points):
+        cell = self.totals.get((kind, key))
+        if cell is None:
+            self.totals[(kind, key)] = [rows, points]
+        else:
+            cell[0] += rows
+            cell[1] += points
+
+    def add_student(self, row, sign=1):
+        for kind, key, points in student_contributions(row):
+            self.add(kind, key, sign, sign * points)
+
+    def add_member(self, row, sign=1):
+        for kind, key, points in member_contributions(row):
+            self.add(kind, key, sign, sign * points)
+
+    def add_profile(self, row, sign=1):
+        if row.get("school_name") is not None:
+            self.add("school_users", row["school_name"], sign, 0)
+
+    def apply_change(self, table, old, new):
+        """トリガーと同じ差分（古い行を引いて新しい行を足す）"""
+        add = {"logs_student": self.add_student, "logs_member": self.add_member,
+               "student_profiles": self.add_profile}[table]
+        if old is not None:
+            add(old, -1)
+        if new is not None:
+            add(new, 1)
+
+    def merge(self, other):
+        for (kind, key), (rows, points) in other.totals.items():
+            self.add(kind, key, rows, points)
+        return self
+
+    def to_rows(self):
+        """rollups 表の行 [{"kind", "key", "row_count", "points"}]（0 になったものも含む）"""
+        return [{"kind": kind, "key": key, "row_count": rows, "points": points}
+                for (kind, key), (rows, points) in self.totals.items()]
+
+    @classmethod
+    def from_rows(cls, rows):
+        rollup = cls()
+        for r in rows or []:
+            rollup.add(r["kind"], r["key"], int(r.get("row_count") or 0), int(r.get("points") or 0))
+        return rollup
+
+
+def breakdown(rollup_rows, kind, n=None):
+    """rollups 表の行から1種類を [{"key", "rows", "points"}] で取り出す
+
+    shard は合算する。ポイントの多い順（date 系は表記を揃えて合算し日付順、hour 系は時刻順）。
+    """
+    merged = {}
+    for r in rollup_rows:
+        if r["kind"] != kind:
+            continue
+        key = normalize_date(r["key"]) if kind in DATE_KINDS else r["key"]
+        cell = merged.setdefault(key, {"key": key, "rows": 0, "points": 0})
+        cell["rows"] += int(r.get("row_count") or 0)
+        cell["points"] += int(r.get("points") or 0)
+    items = [c for c in merged.values() if c["rows"] or c["points"]]
+    if kind in DATE_KINDS:
+        items.sort(key=lambda c: _date_order(c["key"]))
+    elif kind in HOUR_KINDS:
+        items.sort(key=lambda c: c["key"])
+    else:
+        items.sort(key=lambda c: (c["points"], c["rows"]), reverse=True)
+    return items[:n] if n else items
+
+
+def trend(rollup_rows, by="date"):
+    """日ごと（by="date"）・1時間ごと（by="hour"）の CO2削減量（g）を古い順に
+
+    [{"key", "student", "member", "total", "cumulative"}]
+    """
+    student_kind, member_kind = ("date", "member_date") if by == "date" else ("hour", "member_hour")
+    student = {c["key"]: c["points"] for c in breakdown(rollup_rows, student_kind)}
+    member = {c["key"]: c["points"] for c in breakdown(rollup_rows, member_kind)}
+    keys = sorted(set(student) | set(member), key=_date_order if by == "date" else str)
+    out, cumulative = [], 0
+    for key in keys:
+        total = student.get(key, 0) + member.get(key, 0)
+        cumulative += total
+        out.append({"key": key, "student": student.get(key, 0), "member": member.get(key, 0),
+                    "total": total, "cumulative": cumulative})
+    return out
+
+
+def _date_order(key):
+    """"6/12(金)" → (6, 12)（並べ替え用）"""
+    try:
+        month, rest = str(key).split("/", 1)
+        return int(month), int("".join(ch for ch in rest.split("(")[0] if ch.isdigit()) or 0)
+    except ValueError:
+        return 99, 99
+
+
+# ==========================================
+#  全部作り直す（scan.py の集計器）
+# ==========================================
+
+class StudentRollupFold:
+    """logs_student のページ → Rollup
+
+    行ごとに student_contributions を作ると全体統計のスキャンより何倍も遅いので、
+    学校・日付・時間ごとの [行数, ポイント] と actions_mask ごとの行数だけ数え、
+    アクションへの展開は result() で1回だけ行う（結果は add_student と同じ）。
+    """
+
+    def __init__(self, use_mask=True):
+        self.use_mask = use_mask
+        self.extra_columns = ("school_name", "target_date", "created_at", "action_points",
+                              "actions_mask" if use_mask else "actions_str")
+        self.schools = {}
+        self.dates = {}
+        self.hours = {}
+        self.masks = {}
+
+    def update(self, rows):
+        schools, dates, hours, masks = self.schools, self.dates, self.hours, self.masks
+        use_mask = self.use_mask
+        for r in rows:
+            points = int(r.get("action_points") or 0)
+            school, date = r.get("school_name"), r.get("target_date")
+            hour = hour_bucket(r.get("created_at"))
+            if hour is not None:
+                cell = hours.get(hour)
+                if cell is None: hours[hour] = [1, points]
+                else: cell[0] += 1; cell[1] += points
+            if school is not None:
+                cell = schools.get(school)
+                if cell is None: schools[school] = [1, points]
+                else: cell[0] += 1; cell[1] += points
+            if date is not None:
+                cell = dates.get(date)
+                if cell is None: dates[date] = [1, points]
+                else: cell[0] += 1; cell[1] += points
+            mask = r.get("actions_mask") if use_mask else None
+            mask = int(mask) if mask is not None else encode_actions(actions_of(r))
+            if mask:
+                masks[mask] = masks.get(mask, 0) + 1
+
+    def result(self):
+        rollup = Rollup()
+        for school, (rows, points) in self.schools.items():
+            rollup.add("school", school, rows, points)
+        for date, (rows, points) in self.dates.items():
+            rollup.add("date", date, rows, points)
+        for hour, (rows, points) in self.hours.items():
+            rollup.add("hour", hour, rows, points)
+        for mask, rows in self.masks.items():
+            for action, bit in STUDENT_ACTION_BITS.items():
+                if mask & bit:
+                    rollup.add("action", action, rows, rows * STUDENT_ACTION_POINTS.get(action, 0))
+        return rollup
+
+
+class MemberRollupFold:
+    """logs_member のページ → Rollup"""
+
+    def __init__(self):
+        self.extra_columns = ("action_label", "target_date", "created_at", "points")
+        self.rollup = Rollup()
+
+    def update(self, rows):
+        add = self.rollup.add_member
+        for row in rows:
+            add(row)
+
+    def result(self):
+        return self.rollup
+
+
+def school_users(profile_rows):
+    """student_profiles の行 → 学校ごとの参加人数の Rollup"""
+    rollup = Rollup()
+    for r in profile_rows:
+        rollup.add_profile(r)
+    return rollup
@@ -0,0 +1,123 @@
+"""テーブル全件をページ単位で読む共通スキャナ
+
+PostgREST は1リクエストあたりの最大行数（Supabase の既定は1000行）を超えると
+黙って結果を切り詰めるため、select(...).execute() 1回では全件を取れない。
+ここでは主キー（または created_at）の昇順にキーセット方式でページングし、
+1ページずつ集計器に流し込むことで、件数が増えてもメモリを一定に保つ。
+
+    folds = {"co2": SumFold("action_points"), "users": DistinctFold("user_id")}
+    result = aggregate(supabase, "logs_student", folds)
+    result["co2"], result["users"]
+"""
+
+DEFAULT_PAGE_SIZE = 1000
+
+
+def scan_table(client, table, columns, key="id", page_size=DEFAULT_PAGE_SIZE, filters=None):
+    """テーブルを key の昇順で page_size 件ずつ読み出すジェネレータ
+
+    key は重複しない列（主キーなど）を指定すること。created_at のように
+    値が重複しうる列を使うと、ページ境界で同じ値の行を取りこぼす可能性がある。
+    filters には query を受け取って絞り込み済みの query を返す関数を渡せる。
+    サーバーの最大行数が page_size より小さいとページが短く返ってくるので、
+    終わりは「短いページ」ではなく「空のページ」で判定する（最後に1回だけ余分に読む）。
+    """
+    cols = [c.strip() for c in columns.split(",")] if isinstance(columns, str) else list(columns)
+    if key not in cols:
+        cols.append(key)
+    select_str = ", ".join(cols)
+
+    last_key = None
+    while True:
+        query = client.table(table).select(select_str)
+        if filters is not None:
+            query = filters(query)
+        if last_key is not None:
+            query = query.gt(key, last_key)
+        rows = query.order(key, desc=False).limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        last_key = rows[-1][key]
+
+
+# ==========================================
+#  集計器（1ページずつ update して最後に result）
+# ==========================================
+
+class SumFold:
+    """列の合計"""
+
+    def __init__(self, column):
+        self.column = column
+        self.total = 0
+
+    def update(self, rows):
+        col = self.column
+        self.total += sum(int(r.get(col) or 0) for r in rows)
+
+    def result(self):
+        return self.total
+
+
+class DistinctFold:
+    """列のユニーク数（where で行を絞り込める。where が見る列は extra_columns に指定）"""
+
+    def __init__(self, column, where=None, extra_columns=()):
+        self.column = column
+        self.where = where
+        self.extra_columns = tuple(extra_columns)
+        self.seen = set()
+
+    def update(self, rows):
+        col, where = self.column, self.where
+        self.seen.update(r.get(col) for r in rows if where is None or where(r))
+        self.seen.discard(None)
+
+    def result(self):
+        return len(self.seen)
+
+
+class GroupSumFold:
+    """group_column ごとの value_column の合計 {グループ: 合計}"""
+
+    def __init__(self, group_column, value_column):
+        self.group_column = group_column
+        self.value_column = value_column
+        self.totals = {}
+
+    def update(self, rows):
+        g_col, v_col, totals = self.group_column, self.value_column, self.totals
+        for r in rows:
+            g = r.get(g_col)
+            totals[g] = totals.get(g, 0) + int(r.get(v_col) or 0)
+
+    def result(self):
+        return self.totals
+
+
+def fold_columns(folds):
+    """集計器が読む列の一覧"""
+    columns = []
+    for fold in folds.values():
+        for col in (getattr(fold, "column", None), getattr(fold, "group_column", None), getattr(fold, "value_column", None)):
+            if col and col not in columns:
+                columns.append(col)
+        for col in getattr(fold, "extra_columns", ()):
+            if col not in columns:
+                columns.append(col)
+    return columns
+
+
+def fold_pages(folds, pages):
+    """ページ（行のリスト）の列を集計器に流し込み {名前: 結果} を返す（DB なしで使える）"""
+    for rows in pages:
+        for fold in folds.values():
+            fold.update(rows)
+    return {name: fold.result() for name, fold in folds.items()}
+
+
+def aggregate(client, table, folds, key="id", page_size=DEFAULT_PAGE_SIZE, filters=None):
+    """テーブルを1回スキャンして複数の集計をまとめて計算する"""
+    pages = scan_table(client, table, fold_columns(folds), key=key, page_size=page_size, filters=filters)
+    return fold_pages(folds, pages)
@@ -0,0 +1,96 @@
+"""激闘！分別マスター（ブラウザ内で動くカスタムコンポーネント）
+
+問題の出題・タイム計測・ミス時の +5秒・効果音はすべてブラウザ側で処理し、
+Python 側には全問終了時に結果（回答列と経過秒数）が1回だけ届く。
+届いた結果は score_result() でサーバー側の問題データと突き合わせて検証する。
+"""
+import os
+import time
+import uuid
+import random
+import hashlib
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+_COMPONENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "sorting_game")
+_component_func = components.declare_component("sorting_game", path=_COMPONENT_DIR)
+
+# 効果音はコンポーネントのディレクトリ（components/sorting_game/sounds/）から配信する。
+# Streamlit の静的ファイル配信（/app/static/）は mp3 を text/plain + nosniff で返し、
+# Safari では再生できないので使わない（コンポーネントの配信は拡張子から audio/mpeg を付ける）。
+SOUND_DIR = os.path.join(_COMPONENT_DIR, "sounds")
+SOUND_FILES = {"correct": "correct.mp3", "wrong": "wrong.mp3", "clear": "clear.mp3"}
+
+# 1問あたりの最短回答時間（これより速い結果は不正とみなす）
+MIN_SEC_PER_QUESTION = 0.2
+
+
+def new_game(garbage_data, num_questions):
+    """新しいゲーム（問題セット）を作る。session_state に保存して使う"""
+    return {
+        "id": uuid.uuid4().hex,
+        "questions": random.sample(garbage_data, min(num_questions, len(garbage_data))),
+        "issued_at": time.time(),
+    }
+
+
+@st.cache_resource
+def sound_urls():
+    """効果音の URL を返す（?v= に内容のハッシュを付け、差し替えたら読み直させる）
+
+    毎回 base64 の data URI を送る代わりに URL だけを渡し、
+    ブラウザはゲーム開始時に1回だけダウンロードして使い回す。
+    URL はコンポーネントの index.html からの相対パスなので、baseUrlPath があってもそのまま使える。
+    """
+    urls = {}
+    for name, filename in SOUND_FILES.items():
+        path = os.path.join(SOUND_DIR, filename)
+        if not os.path.exists(path): continue
+        try:
+            with open(path, "rb") as f:
+                version = hashlib.sha1(f.read()).hexdigest()[:10]
+        except OSError:
+            continue
+        urls[name] = f"sounds/{filename}?v={version}"
+    return urls
+
+
+def sorting_game(game, categories, penalty_sec=5, sounds=None, key=None):
+    """ゲーム本体を表示し、終了していれば結果（dict）を返す。未終了なら None"""
+    return _component_func(
+        game_id=game["id"],
+        questions=[{"name": q["name"], "type": q["type"]} for q in game["questions"]],
+        categories=[{"name": categories[i]["name"], "color": categories[i].get("color", "primary")} for i in sorted(categories)],
+        penalty_sec=penalty_sec,
+        sounds=sounds or {},
+        key=key or f"sorting_game_{game['id']}",
+        default=None,
+    )
+
+
+def score_result(result, game, categories, penalty_sec=5):
+    """ブラウザから届いた結果を検証し {"time", "misses", "penalty"} を返す（不正なら None）"""
+    if not isinstance(result, dict) or result.get("game_id") != game["id"]:
+        return None
+
+    questions = game["questions"]
+    answers = result.get("answers")
+    if not isinstance(answers, list) or len(answers) != len(questions):
+        return None
+    if any(a not in categories for a in answers):
+        return None
+
+    try:
+        elapsed = float(result.get("elapsed"))
+    except (TypeError, ValueError):
+        return None
+    # 速すぎる・ゲーム発行からの実時間より長い、は改ざんとみなす
+    if elapsed < MIN_SEC_PER_QUESTION * len(questions):
+        return None
+    if elapsed > time.time() - game["issued_at"] + 5:
+        return None
+
+    misses = sum(1 for a, q in zip(answers, questions) if a != q["type"])
+    penalty = misses * penalty_sec
+    return {"time": round(elapsed + penalty, 2), "misses": misses, "penalty": penalty}
@@ -0,0 +1,45 @@
+-- ==========================================
+--  001. ダッシュボード集計 RPC
+-- ==========================================
+-- app.py の fetch_dashboard_stats から呼び出す集計関数。
+-- これまでは logs_student / logs_member / game_scores を5回に分けて全件取得し、
+-- Streamlit 側の pandas で集計していたが、DB 側で1回の呼び出しにまとめる。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+create or replace function public.get_dashboard_stats(top_n integer default 10)
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        -- エコヒーロー数（環境の日アンケートを送信した人）
+        'hero_count', (
+            select count(distinct user_id)
+            from public.logs_student
+            where actions_str like '%環境の日アンケート%'
+        ),
+        -- 参加者総数（小学生 + JCメンバー）
+        'participant_count', (
+            (select count(distinct user_id) from public.logs_student)
+            + (select count(distinct user_name) from public.logs_member)
+        ),
+        -- CO2削減総量 (g)
+        'total_co2', (
+            coalesce((select sum(action_points) from public.logs_student), 0)
+            + coalesce((select sum(points) from public.logs_member), 0)
+        ),
+        -- 分別ゲーム 最速ランキング
+        'ranking', coalesce((
+            select json_agg(r order by r.time asc)
+            from (
+                select *
+                from public.game_scores
+                order by time asc
+                limit top_n
+            ) r
+        ), '[]'::json)
+    );
+$$;
+
+grant execute on function public.get_dashboard_stats(integer) to anon, authenticated;
@@ -0,0 +1,61 @@
+-- ==========================================
+--  002. LOM対抗ランキング用の集計テーブル
+-- ==========================================
+-- logs_member の INSERT / UPDATE / DELETE のたびにトリガーで lom_totals を更新する。
+-- save_member_logs は「削除 → 再登録」するため、DELETE でも必ず減算すること。
+-- ランキング表示は全件集計ではなく、この15行のテーブルを読むだけになる。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+create table if not exists public.lom_totals (
+    lom_name   text primary key,
+    points     bigint not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create or replace function public.lom_totals_apply(p_lom_name text, p_delta bigint)
+returns void
+language sql
+as $$
+    insert into public.lom_totals as t (lom_name, points, updated_at)
+    values (p_lom_name, p_delta, now())
+    on conflict (lom_name) do update
+        set points = t.points + excluded.points,
+            updated_at = now();
+$$;
+
+create or replace function public.logs_member_lom_totals_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('DELETE', 'UPDATE') and old.lom_name is not null then
+        perform public.lom_totals_apply(old.lom_name, -coalesce(old.points, 0));
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') and new.lom_name is not null then
+        perform public.lom_totals_apply(new.lom_name, coalesce(new.points, 0));
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists logs_member_lom_totals on public.logs_member;
+create trigger logs_member_lom_totals
+    after insert or update of lom_name, points or delete on public.logs_member
+    for each row execute function public.logs_member_lom_totals_trigger();
+
+-- 既存データからの初期値（再実行しても同じ結果になる）
+insert into public.lom_totals (lom_name, points, updated_at)
+select lom_name, coalesce(sum(points), 0), now()
+from public.logs_member
+where lom_name is not null
+group by lom_name
+on conflict (lom_name) do update
+    set points = excluded.points,
+        updated_at = now();
+
+alter table public.lom_totals enable row level security;
+drop policy if exists "lom_totals read" on public.lom_totals;
+create policy "lom_totals read" on public.lom_totals for select using (true);
@@ -0,0 +1,55 @@
+-- ==========================================
+--  003. 分別ゲームの自己ベスト
+-- ==========================================
+-- game_scores に記録が追加されたとき、トリガーで game_best を更新する。
+-- 既存の記録より速いときだけ上書きするので、game_best は1人1行のまま増えない。
+-- 自己ベストの表示は game_scores を並べ替えずに、この表を主キーで引くだけになる。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+create table if not exists public.game_best (
+    name       text not null,
+    school     text not null,
+    time       double precision not null,
+    updated_at timestamptz not null default now(),
+    primary key (name, school)
+);
+
+create or replace function public.game_scores_best_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if new.name is null or new.school is null or new.time is null then
+        return null;
+    end if;
+    insert into public.game_best as b (name, school, time, updated_at)
+    values (new.name, new.school, new.time, now())
+    on conflict (name, school) do update
+        set time = excluded.time,
+            updated_at = now()
+        where excluded.time < b.time;
+    return null;
+end;
+$$;
+
+drop trigger if exists game_scores_best on public.game_scores;
+create trigger game_scores_best
+    after insert on public.game_scores
+    for each row execute function public.game_scores_best_trigger();
+
+-- 既存データからの初期値
+insert into public.game_best (name, school, time, updated_at)
+select name, school, min(time), now()
+from public.game_scores
+where name is not null and school is not null and time is not null
+group by name, school
+on conflict (name, school) do update
+    set time = least(public.game_best.time, excluded.time),
+        updated_at = now();
+
+alter table public.game_best enable row level security;
+drop policy if exists "game_best read" on public.game_best;
+create policy "game_best read" on public.game_best for select using (true);
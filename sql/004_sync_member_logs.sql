@@ -0,0 +1,51 @@
+-- ==========================================
+--  004. JCメンバーのチェック表 差分同期 RPC
+-- ==========================================
+-- これまでは保存のたびに「期間中の全行を削除 → チェック済みを全部 Insert」していた。
+-- 画面で変わったセルだけを p_inserts / p_deletes で受け取り、1トランザクションで反映する。
+--   p_inserts: [{"target_date": "6/1(月)", "action_label": "てまえどり", "points": 40}, ...]
+--   p_deletes: [{"target_date": "6/2(火)", "action_label": "節水"}, ...]
+-- 戻り値は実際に追加・削除した行数の合計。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+create or replace function public.sync_member_logs(
+    p_user_name text,
+    p_lom_name  text,
+    p_inserts   jsonb default '[]'::jsonb,
+    p_deletes   jsonb default '[]'::jsonb
+)
+returns integer
+language plpgsql
+as $$
+declare
+    n_deleted  integer;
+    n_inserted integer;
+begin
+    delete from public.logs_member m
+    using jsonb_to_recordset(p_deletes) as d(target_date text, action_label text)
+    where m.user_name = p_user_name
+      and m.lom_name = p_lom_name
+      and m.target_date = d.target_date
+      and m.action_label = d.action_label;
+    get diagnostics n_deleted = row_count;
+
+    -- 連打などで既に入っている行は二重に入れない
+    insert into public.logs_member (user_name, lom_name, target_date, action_label, is_done, points)
+    select distinct on (i.target_date, i.action_label)
+           p_user_name, p_lom_name, i.target_date, i.action_label, true, i.points
+    from jsonb_to_recordset(p_inserts) as i(target_date text, action_label text, points integer)
+    where not exists (
+        select 1 from public.logs_member m
+        where m.user_name = p_user_name
+          and m.lom_name = p_lom_name
+          and m.target_date = i.target_date
+          and m.action_label = i.action_label
+    );
+    get diagnostics n_inserted = row_count;
+
+    return n_deleted + n_inserted;
+end;
+$$;
+
+grant execute on function public.sync_member_logs(text, text, jsonb, jsonb) to anon, authenticated;
@@ -0,0 +1,61 @@
+-- ==========================================
+--  005. 小学生の記録の監査ログ（任意）
+-- ==========================================
+-- logs_student を (user_id, target_date) ごとに1行へまとめる（006）と、保存のたびの履歴は
+-- logs_student に残らなくなる。履歴を残したいときだけ、006 より先にこれを実行する。
+-- logs_student への追加・更新・削除をトリガーで logs_student_audit に追記する（追記のみ）。
+--   action_points: その時点の行の値（差分方式の古い行は差分そのもの）
+--   diff_points:   直前の値との差
+-- 006 の集約で消える差分行は op = 'compacted' で写してから消す。
+-- 画面からは読まない（RLS でポリシーなし = anon からは見えない）。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+create table if not exists public.logs_student_audit (
+    id            bigint generated always as identity primary key,
+    logged_at     timestamptz not null default now(),
+    op            text not null,      -- insert / update / delete / compacted
+    log_id        bigint,             -- logs_student.id
+    user_id       text,
+    target_date   text,
+    actions_str   text,
+    action_points integer,
+    diff_points   integer
+);
+
+create index if not exists logs_student_audit_user_idx
+    on public.logs_student_audit (user_id, logged_at);
+
+create or replace function public.logs_student_audit_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    -- 006 の集約中は compact_student_logs 側で写す
+    if current_setting('decokatsu.compacting', true) = 'on' then
+        return null;
+    end if;
+    if tg_op = 'DELETE' then
+        insert into public.logs_student_audit (op, log_id, user_id, target_date, actions_str, action_points, diff_points)
+        values ('delete', old.id, old.user_id, old.target_date, old.actions_str, 0, -coalesce(old.action_points, 0));
+    elsif tg_op = 'UPDATE' then
+        insert into public.logs_student_audit (op, log_id, user_id, target_date, actions_str, action_points, diff_points)
+        values ('update', new.id, new.user_id, new.target_date, new.actions_str, new.action_points,
+                coalesce(new.action_points, 0) - coalesce(old.action_points, 0));
+    else
+        insert into public.logs_student_audit (op, log_id, user_id, target_date, actions_str, action_points, diff_points)
+        values ('insert', new.id, new.user_id, new.target_date, new.actions_str, new.action_points,
+                coalesce(new.action_points, 0));
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists logs_student_audit on public.logs_student;
+create trigger logs_student_audit
+    after insert or update of actions_str, action_points or delete on public.logs_student
+    for each row execute function public.logs_student_audit_trigger();
+
+alter table public.logs_student_audit enable row level security;
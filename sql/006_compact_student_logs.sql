@@ -0,0 +1,90 @@
+-- ==========================================
+--  006. 小学生の記録を (user_id, target_date) ごとに1行へ
+-- ==========================================
+-- visitor.py はこれまで、保存のたびに「前回との差分ポイント」の行を追加していた（差分方式）。
+-- 同じ日を何度も保存すると行が増え続け、ログイン時の履歴の読み込みも全体の集計も
+-- その分だけ重くなる。
+--
+-- compact_student_logs(max_groups):
+--   同じ (user_id, target_date) の行を id が最大の1行にまとめ、action_points を
+--   差分の合計（= その日の絶対ポイント）にして残りを消す。合計は変わらないので
+--   全体統計・ヒーロー数も変わらない。まとめたグループ数を返す（0 になるまで呼ぶ）。
+--   005 の監査表があれば、消す行を op = 'compacted' で写してから消す。
+--
+-- そのあと (user_id, target_date) に一意インデックスを作る。これがあると repository.py は
+-- 上書き方式（Upsert・絶対ポイント）で保存し、1人1日1行のまま増えなくなる。
+-- インデックスがない間は差分方式の Insert に自動で戻るので、アプリの更新と
+-- このファイルの実行はどちらが先でもよい。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+-- （まとめる前に差分行が増えないよう、最後のブロックは logs_student をロックする）
+
+create or replace function public.compact_student_logs(max_groups integer default 5000)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    n_groups integer;
+begin
+    perform set_config('decokatsu.compacting', 'on', true);
+
+    drop table if exists pg_temp.compact_groups;
+    create temp table compact_groups on commit drop as
+    select user_id,
+           target_date,
+           max(id) as keep_id,
+           sum(coalesce(action_points, 0)) as points,
+           (array_agg(nickname order by id desc) filter (where coalesce(nickname, '') <> ''))[1] as nickname,
+           (array_agg(pin_code order by id desc) filter (where coalesce(pin_code, '') <> ''))[1] as pin_code
+    from public.logs_student
+    where user_id is not null and target_date is not null
+    group by user_id, target_date
+    having count(*) > 1
+    limit max_groups;
+    get diagnostics n_groups = row_count;
+
+    if n_groups > 0 and to_regclass('public.logs_student_audit') is not null then
+        insert into public.logs_student_audit (logged_at, op, log_id, user_id, target_date, actions_str, action_points, diff_points)
+        select coalesce(s.created_at, now()), 'compacted', s.id, s.user_id, s.target_date, s.actions_str,
+               s.action_points, s.action_points
+        from public.logs_student s
+        join compact_groups g on s.user_id = g.user_id and s.target_date = g.target_date
+        order by s.id;
+    end if;
+
+    update public.logs_student s
+    set action_points = g.points,
+        nickname = coalesce(g.nickname, s.nickname),
+        pin_code = coalesce(g.pin_code, s.pin_code)
+    from compact_groups g
+    where s.id = g.keep_id;
+
+    delete from public.logs_student s
+    using compact_groups g
+    where s.user_id = g.user_id
+      and s.target_date = g.target_date
+      and s.id <> g.keep_id;
+
+    perform set_config('decokatsu.compacting', 'off', true);
+    return n_groups;
+end;
+$$;
+
+-- 既存データをまとめてから一意インデックスを作る
+begin;
+lock table public.logs_student in share row exclusive mode;
+do $$
+begin
+    loop
+        exit when public.compact_student_logs(5000) = 0;
+    end loop;
+end;
+$$;
+create unique index if not exists logs_student_user_date_key
+    on public.logs_student (user_id, target_date);
+commit;
+
+-- 画面（anon）からは呼ばせない
+revoke execute on function public.compact_student_logs(integer) from public, anon, authenticated;
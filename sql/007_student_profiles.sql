@@ -0,0 +1,87 @@
+-- ==========================================
+--  007. 小学生のプロフィール（ログイン用の1人1行）
+-- ==========================================
+-- ログインと Cookie の自動ログインは、あいことば・ニックネーム・合計ポイント・ヒーローかどうか
+-- だけを見る。これまでは logs_student の行を全列（memo / q1〜q3 も）読んで集計していた。
+-- logs_student への追加・更新・削除をトリガーで student_profiles に反映し、
+-- ログインは主キーで1行引くだけにする（チェック表の履歴は画面に出すときに別に読む）。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+create table if not exists public.student_profiles (
+    user_id      text primary key,
+    pin_code     text,
+    nickname     text,
+    school_name  text,
+    total_points bigint not null default 0,
+    is_hero      boolean not null default false,
+    updated_at   timestamptz not null default now()
+);
+
+create or replace function public.student_profiles_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    hero constant text := '%環境の日アンケート%';
+begin
+    if tg_op in ('UPDATE', 'DELETE') and old.user_id is not null then
+        update public.student_profiles p
+        set total_points = p.total_points - coalesce(old.action_points, 0),
+            -- 消えた行がヒーローの行だったかもしれないので数え直す（1人数行なので索引で引ける）
+            is_hero = exists (
+                select 1 from public.logs_student s
+                where s.user_id = old.user_id and s.actions_str like hero
+                  and (tg_op = 'DELETE' or s.id <> old.id)
+            ),
+            updated_at = now()
+        where p.user_id = old.user_id;
+    end if;
+
+    if tg_op in ('INSERT', 'UPDATE') and new.user_id is not null then
+        insert into public.student_profiles as p
+            (user_id, pin_code, nickname, school_name, total_points, is_hero, updated_at)
+        values (new.user_id, nullif(new.pin_code, ''), nullif(new.nickname, ''), new.school_name,
+                coalesce(new.action_points, 0), coalesce(new.actions_str like hero, false), now())
+        on conflict (user_id) do update
+            set pin_code     = coalesce(excluded.pin_code, p.pin_code),
+                nickname     = coalesce(excluded.nickname, p.nickname),
+                school_name  = coalesce(excluded.school_name, p.school_name),
+                total_points = p.total_points + excluded.total_points,
+                is_hero      = p.is_hero or excluded.is_hero,
+                updated_at   = now();
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists logs_student_profiles on public.logs_student;
+create trigger logs_student_profiles
+    after insert or update or delete on public.logs_student
+    for each row execute function public.student_profiles_trigger();
+
+-- 既存データからの初期値（後の行のあいことば・ニックネームが優先）
+insert into public.student_profiles (user_id, pin_code, nickname, school_name, total_points, is_hero, updated_at)
+select user_id,
+       (array_agg(pin_code order by id desc) filter (where coalesce(pin_code, '') <> ''))[1],
+       (array_agg(nickname order by id desc) filter (where coalesce(nickname, '') <> ''))[1],
+       (array_agg(school_name order by id desc))[1],
+       sum(coalesce(action_points, 0)),
+       bool_or(coalesce(actions_str like '%環境の日アンケート%', false)),
+       now()
+from public.logs_student
+where user_id is not null
+group by user_id
+on conflict (user_id) do update
+    set pin_code     = excluded.pin_code,
+        nickname     = excluded.nickname,
+        school_name  = excluded.school_name,
+        total_points = excluded.total_points,
+        is_hero      = excluded.is_hero,
+        updated_at   = now();
+
+alter table public.student_profiles enable row level security;
+drop policy if exists "student_profiles read" on public.student_profiles;
+create policy "student_profiles read" on public.student_profiles for select using (true);
@@ -0,0 +1,32 @@
+-- ==========================================
+--  008. 小学生の記録の更新時刻（履歴の差分同期用）
+-- ==========================================
+-- logs_student に updated_at を足し、追加・更新のたびにトリガーで今の時刻を入れる。
+-- アプリ（history_sync.py）は1人ぶんの履歴を「読んだ updated_at の最大値」と一緒に覚えておき、
+-- 次からは updated_at がそれより新しい行だけを読む。(user_id, updated_at) の索引で引く。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+alter table public.logs_student add column if not exists updated_at timestamptz;
+update public.logs_student set updated_at = coalesce(created_at, now()) where updated_at is null;
+alter table public.logs_student alter column updated_at set default now();
+alter table public.logs_student alter column updated_at set not null;
+
+create or replace function public.logs_student_touch()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- now() はトランザクション開始時刻。少しでもコミットに近い時刻にする
+    new.updated_at := clock_timestamp();
+    return new;
+end;
+$$;
+
+drop trigger if exists logs_student_touch on public.logs_student;
+create trigger logs_student_touch
+    before insert or update on public.logs_student
+    for each row execute function public.logs_student_touch();
+
+create index if not exists logs_student_user_updated_idx
+    on public.logs_student (user_id, updated_at);
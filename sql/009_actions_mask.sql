@@ -0,0 +1,47 @@
+-- ==========================================
+--  009. 小学生のアクションを整数のビットで持つ（actions_mask）
+-- ==========================================
+-- actions_str は "電気, 水, 環境の日アンケート" のような文字列で、ヒーロー判定は
+-- 全行に対する like '%環境の日アンケート%'、ポイントやアクションごとの件数も文字列の分解が要った。
+-- actions_str はそのまま残し、同じ内容を actions_mask（ビットの和）にも持つ。
+--   電気=1 食事=2 水=4 分別=8 家族=16 環境の日アンケート=32 デコ活宣言=64
+--   （domain.py の STUDENT_ACTION_BITS と同じ。値を変えないこと）
+-- actions_mask はトリガーで actions_str から作るので、アプリの書き込みは変えなくてよい。
+-- ヒーロー判定は (actions_mask & 32) <> 0 になり、部分索引で引ける。
+--
+-- SQL Editor は貼り付けた全体を1トランザクションで実行し、ロックは最後まで持ったままになる。
+-- 既存の行の埋め戻しを同じスクリプトに入れると、その間ずっと logs_student への保存が止まるので、
+-- 3つに分けて順に実行する（それぞれ SQL Editor に貼り付けて実行）。
+--   1. このファイル: 関数・列・トリガー（列の追加は一瞬だけ ACCESS EXCLUSIVE。既存の行は書き換えない）
+--   2. 009_actions_mask_backfill.sql: 1回で1万行ずつ埋める。「0 rows」になるまで何度も実行する
+--   3. 009_actions_mask_finish.sql: not null・部分索引・集計関数の置き換え（2 が終わってから）
+-- 1 の後は新しい保存にトリガーで actions_mask が入るので、2 の間もアプリは止めなくてよい。
+
+create or replace function public.student_actions_mask(p_actions text)
+returns integer
+language sql
+immutable
+as $$
+    select coalesce(bit_or(b.bit), 0)
+    from unnest(string_to_array(coalesce(p_actions, ''), ', ')) as a(action)
+    join (values ('電気', 1), ('食事', 2), ('水', 4), ('分別', 8), ('家族', 16),
+                 ('環境の日アンケート', 32), ('デコ活宣言', 64)) as b(action, bit)
+      on b.action = a.action;
+$$;
+
+alter table public.logs_student add column if not exists actions_mask integer;
+
+create or replace function public.logs_student_mask()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.actions_mask := public.student_actions_mask(new.actions_str);
+    return new;
+end;
+$$;
+
+drop trigger if exists logs_student_mask on public.logs_student;
+create trigger logs_student_mask
+    before insert or update of actions_str on public.logs_student
+    for each row execute function public.logs_student_mask();
@@ -0,0 +1,16 @@
+-- ==========================================
+--  009 (2/3). 既存の行の actions_mask を埋める
+-- ==========================================
+-- 009_actions_mask.sql の後に、SQL Editor で「0 rows」になるまで何度も実行する。
+-- 1回の実行が1トランザクションで、ロックするのはその1万行だけ（ほかの行への保存は待たない）。
+-- 中身は変わらないので、この実行の間だけ監査（005）・プロフィール（007）・更新時刻（008）の
+-- トリガーを止める（set local なのでこのトランザクションだけ。表はロックしない）。
+-- 終わったら 009_actions_mask_finish.sql を実行する。
+
+set local session_replication_role = replica;
+
+update public.logs_student
+set actions_mask = public.student_actions_mask(actions_str)
+where id in (
+    select id from public.logs_student where actions_mask is null limit 10000
+);
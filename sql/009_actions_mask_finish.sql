@@ -0,0 +1,76 @@
+-- ==========================================
+--  009 (3/3). actions_mask の not null・索引・集計関数
+-- ==========================================
+-- 009_actions_mask_backfill.sql が「0 rows」になってから実行する。
+-- 1トランザクションなので、ロックは最後まで持ったままになる。人の少ない時間に実行すること。
+--   索引を作る間: logs_student への保存が待たされる（SHARE。読むのは止まらない）
+--   set not null: 全行を確かめる間 ACCESS EXCLUSIVE（読むのも止まる）。なので最後に置く
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+-- ヒーローの行だけの部分索引（ヒーロー数は count(distinct user_id) をこの索引だけで数えられる）
+create index if not exists logs_student_hero_idx
+    on public.logs_student (user_id)
+    where (actions_mask & 32) <> 0;
+
+-- 001 の集計関数をビットで判定するように置き換え
+create or replace function public.get_dashboard_stats(top_n integer default 10)
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        -- エコヒーロー数（環境の日アンケートを送信した人）
+        'hero_count', (
+            select count(distinct user_id)
+            from public.logs_student
+            where (actions_mask & 32) <> 0
+        ),
+        -- 参加者総数（小学生 + JCメンバー）
+        'participant_count', (
+            (select count(distinct user_id) from public.logs_student)
+            + (select count(distinct user_name) from public.logs_member)
+        ),
+        -- CO2削減総量 (g)
+        'total_co2', (
+            coalesce((select sum(action_points) from public.logs_student), 0)
+            + coalesce((select sum(points) from public.logs_member), 0)
+        ),
+        -- 分別ゲーム 最速ランキング
+        'ranking', coalesce((
+            select json_agg(r order by r.time asc)
+            from (
+                select *
+                from public.game_scores
+                order by time asc
+                limit top_n
+            ) r
+        ), '[]'::json)
+    );
+$$;
+
+grant execute on function public.get_dashboard_stats(integer) to anon, authenticated;
+
+-- アクションごとの実施件数（行 = 1人1日）
+create or replace function public.get_action_counts()
+returns json
+language sql
+stable
+as $$
+    select json_build_object(
+        '電気', count(*) filter (where (actions_mask & 1) <> 0),
+        '食事', count(*) filter (where (actions_mask & 2) <> 0),
+        '水', count(*) filter (where (actions_mask & 4) <> 0),
+        '分別', count(*) filter (where (actions_mask & 8) <> 0),
+        '家族', count(*) filter (where (actions_mask & 16) <> 0),
+        '環境の日アンケート', count(*) filter (where (actions_mask & 32) <> 0),
+        'デコ活宣言', count(*) filter (where (actions_mask & 64) <> 0)
+    )
+    from public.logs_student
+    where actions_mask <> 0;
+$$;
+
+grant execute on function public.get_action_counts() to anon, authenticated;
+
+alter table public.logs_student alter column actions_mask set default 0;
+alter table public.logs_student alter column actions_mask set not null;
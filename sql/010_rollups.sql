@@ -0,0 +1,223 @@
+-- ==========================================
+--  010. アクション別・学校別・日付別の集計テーブル（rollups）
+-- ==========================================
+-- 「どのアクション・どの学校・どの日がどれだけ貢献したか」を、保存のたびに
+-- トリガーで差分だけ足し込む（002 の lom_totals と同じ方式）。画面は全件集計ではなく
+-- この小さな表を読むだけになる。
+--
+--   kind           key            row_count              points
+--   action         電気 など      その行動をした行の数   行の数 × その行動のポイント
+--   school         school_name    小学生の行の数         action_points の合計
+--   date           target_date    小学生の行の数         action_points の合計
+--   member_action  action_label   JCメンバーの行の数     points の合計
+--   member_date    target_date    JCメンバーの行の数     points の合計
+--   school_users   school_name    参加した小学生の人数   0
+--
+-- 行ごとの足し方は rollups.py と同じ（localbase もそれを使う）。値を変えるときは両方を直すこと。
+-- 同じ (kind, key) を shard（user_id のハッシュ % 8）で8行に分けて持ち、同時に来た保存が
+-- 1行の更新待ちで並ばないようにする。読む側は shard を足し合わせる。
+--
+-- rebuild_rollups(): 元の表から全部作り直す（ずれたとき用。実行中は元の表への書き込みを止める）
+--
+-- 006（1人1日1行の一意インデックス）と 009（actions_mask。finish まで）の後に実行すること。
+-- action は「その行の actions_mask にある行動」を数えるので、1人1日1行が前提。
+-- 差分方式（同じ日に差分ポイントの行が何行も入る）だと、同じ行動が行の数だけ足されて
+-- 膨らむ。006 がなければここで止める（repository.py の STUDENT_WRITE_MODE も "snapshot" のまま）。
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+do $$
+begin
+    if to_regclass('public.logs_student_user_date_key') is null then
+        raise exception '010_rollups: 先に 006_compact_student_logs.sql を実行してください（1人1日1行が前提）';
+    end if;
+end;
+$$;
+
+create table if not exists public.rollups (
+    id         bigint generated always as identity primary key,
+    kind       text not null,
+    key        text not null,
+    shard      smallint not null default 0,
+    row_count  bigint not null default 0,
+    points     bigint not null default 0,
+    updated_at timestamptz not null default now(),
+    unique (kind, key, shard)
+);
+
+create or replace function public.rollups_shard(p_user text)
+returns smallint
+language sql
+immutable
+as $$
+    select (abs(hashtext(coalesce(p_user, ''))) % 8)::smallint;
+$$;
+
+create or replace function public.rollups_apply(p_kind text, p_key text, p_shard smallint, p_rows bigint, p_points bigint)
+returns void
+language sql
+as $$
+    insert into public.rollups as r (kind, key, shard, row_count, points, updated_at)
+    values (p_kind, p_key, p_shard, p_rows, p_points, now())
+    on conflict (kind, key, shard) do update
+        set row_count  = r.row_count + excluded.row_count,
+            points     = r.points + excluded.points,
+            updated_at = now();
+$$;
+
+-- アクションのビットとポイント（domain.py の STUDENT_ACTION_BITS / STUDENT_ACTION_POINTS と同じ）
+create or replace function public.student_action_points()
+returns table (action text, bit integer, points integer)
+language sql
+immutable
+as $$
+    values ('電気', 1, 50), ('食事', 2, 100), ('水', 4, 30), ('分別', 8, 80), ('家族', 16, 50),
+           ('環境の日アンケート', 32, 100), ('デコ活宣言', 64, 0);
+$$;
+
+create or replace function public.rollups_apply_student(r public.logs_student, p_sign integer)
+returns void
+language plpgsql
+as $$
+declare
+    s smallint := public.rollups_shard(r.user_id);
+    pts bigint := p_sign * coalesce(r.action_points, 0);
+begin
+    if r.school_name is not null then
+        perform public.rollups_apply('school', r.school_name, s, p_sign, pts);
+    end if;
+    if r.target_date is not null then
+        perform public.rollups_apply('date', r.target_date, s, p_sign, pts);
+    end if;
+    perform public.rollups_apply('action', a.action, s, p_sign, p_sign * a.points)
+    from public.student_action_points() a
+    where (coalesce(r.actions_mask, 0) & a.bit) <> 0;
+end;
+$$;
+
+create or replace function public.logs_student_rollups_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('DELETE', 'UPDATE') then
+        perform public.rollups_apply_student(old, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.rollups_apply_student(new, 1);
+    end if;
+    return null;
+end;
+$$;
+
+-- actions_mask は 009 の before トリガーが actions_str から作るので actions_str も見る
+drop trigger if exists logs_student_rollups on public.logs_student;
+create trigger logs_student_rollups
+    after insert or update of school_name, target_date, action_points, actions_str, actions_mask or delete
+    on public.logs_student
+    for each row execute function public.logs_student_rollups_trigger();
+
+create or replace function public.logs_member_rollups_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('DELETE', 'UPDATE') then
+        if old.action_label is not null then
+            perform public.rollups_apply('member_action', old.action_label, public.rollups_shard(old.user_name), -1, -coalesce(old.points, 0));
+        end if;
+        if old.target_date is not null then
+            perform public.rollups_apply('member_date', old.target_date, public.rollups_shard(old.user_name), -1, -coalesce(old.points, 0));
+        end if;
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        if new.action_label is not null then
+            perform public.rollups_apply('member_action', new.action_label, public.rollups_shard(new.user_name), 1, coalesce(new.points, 0));
+        end if;
+        if new.target_date is not null then
+            perform public.rollups_apply('member_date', new.target_date, public.rollups_shard(new.user_name), 1, coalesce(new.points, 0));
+        end if;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists logs_member_rollups on public.logs_member;
+create trigger logs_member_rollups
+    after insert or update of action_label, target_date, points or delete on public.logs_member
+    for each row execute function public.logs_member_rollups_trigger();
+
+-- 学校ごとの参加人数（007 のプロフィールは1人1行）
+create or replace function public.student_profiles_rollups_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('DELETE', 'UPDATE') and old.school_name is not null then
+        perform public.rollups_apply('school_users', old.school_name, public.rollups_shard(old.user_id), -1, 0);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') and new.school_name is not null then
+        perform public.rollups_apply('school_users', new.school_name, public.rollups_shard(new.user_id), 1, 0);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists student_profiles_rollups on public.student_profiles;
+create trigger student_profiles_rollups
+    after insert or update of school_name or delete on public.student_profiles
+    for each row execute function public.student_profiles_rollups_trigger();
+
+create or replace function public.rebuild_rollups()
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    n integer;
+begin
+    -- 作り直している間に保存が入ると差分が二重・欠けになるので、元の表への書き込みを待たせる
+    lock table public.logs_student, public.logs_member, public.student_profiles in share mode;
+    lock table public.rollups in exclusive mode;
+    delete from public.rollups;
+
+    insert into public.rollups (kind, key, shard, row_count, points)
+    select 'school', school_name, rollups_shard(user_id), count(*), coalesce(sum(action_points), 0)
+    from public.logs_student where school_name is not null group by 2, 3
+    union all
+    select 'date', target_date, rollups_shard(user_id), count(*), coalesce(sum(action_points), 0)
+    from public.logs_student where target_date is not null group by 2, 3
+    union all
+    select 'action', a.action, rollups_shard(s.user_id), count(*), count(*) * a.points
+    from public.logs_student s
+    join public.student_action_points() a on (s.actions_mask & a.bit) <> 0
+    group by 2, 3, a.points
+    union all
+    select 'member_action', action_label, rollups_shard(user_name), count(*), coalesce(sum(points), 0)
+    from public.logs_member where action_label is not null group by 2, 3
+    union all
+    select 'member_date', target_date, rollups_shard(user_name), count(*), coalesce(sum(points), 0)
+    from public.logs_member where target_date is not null group by 2, 3
+    union all
+    select 'school_users', school_name, rollups_shard(user_id), count(*), 0
+    from public.student_profiles where school_name is not null group by 2, 3;
+
+    get diagnostics n = row_count;
+    return n;
+end;
+$$;
+
+revoke execute on function public.rebuild_rollups() from public, anon, authenticated;
+
+-- 既存データからの初期値（再実行しても同じ結果になる）
+select public.rebuild_rollups();
+
+alter table public.rollups enable row level security;
+drop policy if exists "rollups read" on public.rollups;
+create policy "rollups read" on public.rollups for select using (true);
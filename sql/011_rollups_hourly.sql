@@ -0,0 +1,145 @@
+-- ==========================================
+--  011. CO2削減量の1時間ごとの集計（rollups の hour / member_hour）
+-- ==========================================
+-- トップ画面と admin.py の推移グラフ用。日ごとは 010 の date / member_date をそのまま使い、
+-- ここでは created_at の1時間ごと（日本時間。key は '2026-06-01 09:00'）を足す。
+--   hour         小学生の行の数       action_points の合計
+--   member_hour  JCメンバーの行の数   points の合計
+-- 保存のたびに 010 と同じトリガーで差分を足し込むので、画面で全件の group by は走らない。
+-- 1人1日1行の上書き（006）でも created_at は最初に保存した時刻のまま（その時間帯に足される）。
+--
+-- 010 の関数を置き換え、rebuild_rollups() で hour 系も含めて作り直す。
+-- 行ごとの足し方は rollups.py と同じ（hour_bucket）。
+--
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+-- 日本時間の1時間の区切り（夏時間がないので +9時間で固定）
+create or replace function public.rollups_hour(p_at timestamptz)
+returns text
+language sql
+immutable
+as $$
+    select to_char((p_at at time zone 'UTC') + interval '9 hours', 'YYYY-MM-DD HH24:00');
+$$;
+
+create or replace function public.rollups_apply_student(r public.logs_student, p_sign integer)
+returns void
+language plpgsql
+as $$
+declare
+    s smallint := public.rollups_shard(r.user_id);
+    pts bigint := p_sign * coalesce(r.action_points, 0);
+begin
+    if r.school_name is not null then
+        perform public.rollups_apply('school', r.school_name, s, p_sign, pts);
+    end if;
+    if r.target_date is not null then
+        perform public.rollups_apply('date', r.target_date, s, p_sign, pts);
+    end if;
+    if r.created_at is not null then
+        perform public.rollups_apply('hour', public.rollups_hour(r.created_at), s, p_sign, pts);
+    end if;
+    perform public.rollups_apply('action', a.action, s, p_sign, p_sign * a.points)
+    from public.student_action_points() a
+    where (coalesce(r.actions_mask, 0) & a.bit) <> 0;
+end;
+$$;
+
+create or replace function public.rollups_apply_member(r public.logs_member, p_sign integer)
+returns void
+language plpgsql
+as $$
+declare
+    s smallint := public.rollups_shard(r.user_name);
+    pts bigint := p_sign * coalesce(r.points, 0);
+begin
+    if r.action_label is not null then
+        perform public.rollups_apply('member_action', r.action_label, s, p_sign, pts);
+    end if;
+    if r.target_date is not null then
+        perform public.rollups_apply('member_date', r.target_date, s, p_sign, pts);
+    end if;
+    if r.created_at is not null then
+        perform public.rollups_apply('member_hour', public.rollups_hour(r.created_at), s, p_sign, pts);
+    end if;
+end;
+$$;
+
+create or replace function public.logs_member_rollups_trigger()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('DELETE', 'UPDATE') then
+        perform public.rollups_apply_member(old, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.rollups_apply_member(new, 1);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists logs_student_rollups on public.logs_student;
+create trigger logs_student_rollups
+    after insert or update of school_name, target_date, created_at, action_points, actions_str, actions_mask or delete
+    on public.logs_student
+    for each row execute function public.logs_student_rollups_trigger();
+
+drop trigger if exists logs_member_rollups on public.logs_member;
+create trigger logs_member_rollups
+    after insert or update of action_label, target_date, created_at, points or delete on public.logs_member
+    for each row execute function public.logs_member_rollups_trigger();
+
+create or replace function public.rebuild_rollups()
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    n integer;
+begin
+    -- 作り直している間に保存が入ると差分が二重・欠けになるので、元の表への書き込みを待たせる
+    lock table public.logs_student, public.logs_member, public.student_profiles in share mode;
+    lock table public.rollups in exclusive mode;
+    delete from public.rollups;
+
+    insert into public.rollups (kind, key, shard, row_count, points)
+    select 'school', school_name, rollups_shard(user_id), count(*), coalesce(sum(action_points), 0)
+    from public.logs_student where school_name is not null group by 2, 3
+    union all
+    select 'date', target_date, rollups_shard(user_id), count(*), coalesce(sum(action_points), 0)
+    from public.logs_student where target_date is not null group by 2, 3
+    union all
+    select 'hour', rollups_hour(created_at), rollups_shard(user_id), count(*), coalesce(sum(action_points), 0)
+    from public.logs_student where created_at is not null group by 2, 3
+    union all
+    select 'action', a.action, rollups_shard(s.user_id), count(*), count(*) * a.points
+    from public.logs_student s
+    join public.student_action_points() a on (s.actions_mask & a.bit) <> 0
+    group by 2, 3, a.points
+    union all
+    select 'member_action', action_label, rollups_shard(user_name), count(*), coalesce(sum(points), 0)
+    from public.logs_member where action_label is not null group by 2, 3
+    union all
+    select 'member_date', target_date, rollups_shard(user_name), count(*), coalesce(sum(points), 0)
+    from public.logs_member where target_date is not null group by 2, 3
+    union all
+    select 'member_hour', rollups_hour(created_at), rollups_shard(user_name), count(*), coalesce(sum(points), 0)
+    from public.logs_member where created_at is not null group by 2, 3
+    union all
+    select 'school_users', school_name, rollups_shard(user_id), count(*), 0
+    from public.student_profiles where school_name is not null group by 2, 3;
+
+    get diagnostics n = row_count;
+    return n;
+end;
+$$;
+
+revoke execute on function public.rebuild_rollups() from public, anon, authenticated;
+
+-- hour 系の初期値（ほかの種類も同じ値で作り直される）
+select public.rebuild_rollups();
@@ -0,0 +1,132 @@
+-- ==========================================
+--  012. 集計テーブルの作り直し（rebuild.py）の反映
+-- ==========================================
+-- rebuild.py は元の表（logs_student / logs_member / game_scores）を並列に読んで集計し直し、
+-- 今の lom_totals / game_best / student_profiles / rollups との差分だけをここに渡す。
+--
+-- rebuild_watermarks(): 元の表の件数・最大 id・ポイント合計（logs_student は最大 updated_at も）。
+--   rebuild.py は読む前と読んだ後にこれを呼び、同じ値を p_expected として渡す。
+-- apply_rebuild(p_expected, p_changes):
+--   元の表への書き込みを止めてから rebuild_watermarks() を取り直し、p_expected と違えば
+--   （読んでから反映までに保存があれば）何も書かずに 40001 で失敗する。同じなら差分を
+--   1トランザクションで反映し、表ごとの書き込み件数を返す。
+--   p_changes = {"<表>": {"upsert": [行...], "delete": [キー...]}, ...}
+--   rollups は (kind, key) の shard をまとめて消し、shard 0 の1行にする。
+--
+-- どちらも service_role からだけ呼べる（anon の key では --apply できない）。
+-- 適用方法: Supabase ダッシュボードの SQL Editor に貼り付けて実行
+
+create or replace function public.rebuild_watermarks()
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select jsonb_build_object(
+        'logs_student', (
+            select jsonb_build_object('count', count(*), 'max_id', max(id),
+                                      'points', coalesce(sum(action_points), 0), 'max_updated_at', max(updated_at))
+            from public.logs_student
+        ),
+        'logs_member', (
+            select jsonb_build_object('count', count(*), 'max_id', max(id), 'points', coalesce(sum(points), 0))
+            from public.logs_member
+        ),
+        'game_scores', (
+            select jsonb_build_object('count', count(*), 'max_id', max(id))
+            from public.game_scores
+        )
+    );
+$$;
+
+create or replace function public.apply_rebuild(p_expected jsonb, p_changes jsonb)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    actual jsonb;
+    c jsonb;
+    n integer;
+    result jsonb := '{}'::jsonb;
+begin
+    -- 反映している間は元の表への書き込みを待たせる（トリガーの差分と混ざらないように）
+    lock table public.logs_student, public.logs_member, public.game_scores in share mode;
+    actual := public.rebuild_watermarks();
+    if actual is distinct from p_expected then
+        raise exception 'apply_rebuild: source tables changed since they were read'
+            using errcode = '40001', detail = actual::text;
+    end if;
+
+    c := p_changes -> 'lom_totals';
+    if c is not null then
+        delete from public.lom_totals
+        where lom_name in (select jsonb_array_elements_text(c -> 'delete'));
+        insert into public.lom_totals as t (lom_name, points, updated_at)
+        select x.lom_name, x.points, now()
+        from jsonb_to_recordset(c -> 'upsert') as x(lom_name text, points bigint)
+        on conflict (lom_name) do update
+            set points = excluded.points, updated_at = now();
+        get diagnostics n = row_count;
+        result := result || jsonb_build_object('lom_totals', n);
+    end if;
+
+    c := p_changes -> 'game_best';
+    if c is not null then
+        delete from public.game_best b
+        using jsonb_to_recordset(c -> 'delete') as d(name text, school text)
+        where b.name = d.name and b.school = d.school;
+        insert into public.game_best as b (name, school, time, updated_at)
+        select x.name, x.school, x.time, now()
+        from jsonb_to_recordset(c -> 'upsert') as x(name text, school text, time double precision)
+        on conflict (name, school) do update
+            set time = excluded.time, updated_at = now();
+        get diagnostics n = row_count;
+        result := result || jsonb_build_object('game_best', n);
+    end if;
+
+    -- 学校が変わった人は 010 のトリガーが school_users を動かす（rollups も渡されていれば下で上書き）
+    c := p_changes -> 'student_profiles';
+    if c is not null then
+        delete from public.student_profiles
+        where user_id in (select jsonb_array_elements_text(c -> 'delete'));
+        insert into public.student_profiles as p
+            (user_id, pin_code, nickname, school_name, total_points, is_hero, updated_at)
+        select x.user_id, x.pin_code, x.nickname, x.school_name, x.total_points, x.is_hero, now()
+        from jsonb_to_recordset(c -> 'upsert')
+            as x(user_id text, pin_code text, nickname text, school_name text, total_points bigint, is_hero boolean)
+        on conflict (user_id) do update
+            set pin_code     = excluded.pin_code,
+                nickname     = excluded.nickname,
+                school_name  = excluded.school_name,
+                total_points = excluded.total_points,
+                is_hero      = excluded.is_hero,
+                updated_at   = now();
+        get diagnostics n = row_count;
+        result := result || jsonb_build_object('student_profiles', n);
+    end if;
+
+    c := p_changes -> 'rollups';
+    if c is not null then
+        delete from public.rollups r
+        using (
+            select kind, key from jsonb_to_recordset(c -> 'delete') as d(kind text, key text)
+            union
+            select kind, key from jsonb_to_recordset(c -> 'upsert') as u(kind text, key text)
+        ) k
+        where r.kind = k.kind and r.key = k.key;
+        insert into public.rollups (kind, key, shard, row_count, points, updated_at)
+        select x.kind, x.key, 0, x.row_count, x.points, now()
+        from jsonb_to_recordset(c -> 'upsert') as x(kind text, key text, row_count bigint, points bigint);
+        get diagnostics n = row_count;
+        result := result || jsonb_build_object('rollups', n);
+    end if;
+
+    return result;
+end;
+$$;
+
+revoke execute on function public.rebuild_watermarks() from public, anon, authenticated;
+revoke execute on function public.apply_rebuild(jsonb, jsonb) from public, anon, authenticated;
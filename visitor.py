@@ -1,11 +1,11 @@
 import streamlit as st
-import datetime
 import time
-import os
-import base64
 import random
-import json
-from supabase import create_client, Client
+from repository import get_repository, build_student_row
+from domain import build_student_grid, is_hero_row
+from sorting_game import new_game, sorting_game, score_result, sound_urls
+from metrics import metrics_gate, track_run
+from profiling import profile_run
 
 # --- 真っ白画面回避のための安全策 ---
 try:
@@ -98,120 +98,46 @@ ECO_TRIVIA_LIST = [
 ]
 
 # ==========================================
-#  3. Supabase 接続設定 (Google Sheets廃止)
+#  3. データ操作（repository.py 経由）
 # ==========================================
+repo = get_repository()
 
-@st.cache_resource
-def init_connection():
-    try:
-        url = st.secrets["supabase"]["url"]
-        key = st.secrets["supabase"]["key"]
-        return create_client(url, key)
-    except Exception as e:
-        st.error(f"システムエラー: Supabase接続に失敗しました。Secretsを確認してください。 {e}")
-        return None
-
-supabase = init_connection()
-
-# --- DB操作関数 ---
-
-@st.cache_data(ttl=600)  # 10分キャッシュ（9万人対策）
 def fetch_global_stats():
-    """全参加者の統計を取得（キャッシュあり）"""
-    if not supabase: return 0, 0, 0
-
-    try:
-        # action_points 列だけ取得して集計（全件取得より軽い）
-        # ※本来はSupabase側でRPC（集計関数）を作るのがベストですが、
-        #   ここでは簡易的にPython側で計算します。
-        response = supabase.table("logs_student").select("action_points, actions_str, user_id").execute()
-        
-        if not response.data: return 0, 0, 0
-        
-        df = pd.DataFrame(response.data)
-        
-        total_co2 = df['action_points'].sum()
-        total_participants = df['user_id'].nunique()
-        
-        # ヒーロー認定者数（環境の日アンケートをやった人）
-        # actions_str に "環境の日アンケート" が含まれるIDをカウント
-        hero_mask = df['actions_str'].astype(str).str.contains("環境の日アンケート", na=False)
-        total_heroes = df[hero_mask]['user_id'].nunique()
-
-        return int(total_co2), int(total_heroes), int(total_participants)
-
-    except Exception as e:
-        # st.error(f"統計取得エラー: {e}") # ユーザーには見せない
-        return 0, 0, 0
+    """全参加者の統計と集計からの経過秒数（保存ごとの差分を反映済み。集計は裏で行うので待たない）"""
+    return repo.students.global_stats()
 
 def fetch_user_data(school_full_name, grade, u_class, number):
-    """特定のユーザーのデータを取得"""
-    if not supabase: return None, None, 0, {}
+    """特定のユーザーのプロフィール（ニックネーム・合計・ヒーロー）を1行だけ読む
 
+    (user_id, プロフィール) を返す。取得に失敗したらプロフィールが None。
+    """
     user_id = f"{school_full_name}_{grade}_{u_class}_{number}"
+    profile = repo.students.profile(user_id)
+    if profile is None:
+        st.error("データ取得エラー: 時間をおいて もういちど ためしてね")
+    return user_id, profile
+
+def fetch_user_history(user):
+    """チェック表の履歴（出すときに1回だけ読んでセッションに置く）。読めなければ None"""
+    if user.get('history_dict') is None:
+        history = repo.students.history(user['id'])
+        if history is None:
+            st.error("データ取得エラー: 時間をおいて もういちど ためしてね")
+            return None
+        user['history_dict'] = history
+    return user['history_dict']
 
-    try:
-        # ユーザーIDでフィルタリング
-        response = supabase.table("logs_student").select("*").eq("user_id", user_id).execute()
-        
-        data = response.data
-        if not data:
-            return user_id, "", 0, {} # 新規ユーザー
-
-        df = pd.DataFrame(data)
-        
-        # 集計
-        total_co2 = df['action_points'].sum()
-        
-        # 最新のニックネームを取得
-        nickname = ""
-        if 'nickname' in df.columns and not df['nickname'].dropna().empty:
-            nickname = df['nickname'].iloc[-1]
-        
-        # 履歴辞書の作成 {日付: [やったことリスト]}
-        history_dict = {}
-        for _, row in df.iterrows():
-            r_date = row.get('target_date')
-            r_actions = row.get('actions_str')
-            if r_date:
-                history_dict[r_date] = str(r_actions).split(", ") if r_actions else []
-
-        return user_id, nickname, int(total_co2), history_dict
-
-    except Exception as e:
-        st.error(f"データ取得エラー: {e}")
-        return None, None, 0, {}
-
-def save_daily_challenge(user_id, nickname, target_date, actions_done, total_points, memo, q1="", q2="", q3=""):
-    """アクションログを保存（Insert）"""
-    if not supabase: return False
+def save_daily_challenges(rows, diffs, is_new_participant=False, became_hero=False):
+    """複数日ぶんのアクションログを1回のリクエストでまとめて保存
 
+    rows はその日の合計ポイント、diffs は前回からの差分（1人1日1行で上書き。repository.py）。
+    保存できた行のリストを返す（失敗したら None）。
+    """
     try:
-        school_name = user_id.split("_")[0] # IDから学校名を抽出
-        actions_str = ", ".join(actions_done)
-        
-        data = {
-            "user_id": user_id,
-            "nickname": nickname,
-            "school_name": school_name,
-            "target_date": target_date,
-            "actions_str": actions_str,
-            "action_points": total_points,
-            "memo": memo,
-            "q1": q1,
-            "q2": q2,
-            "q3": q3,
-            # created_at は自動で入る
-        }
-        
-        supabase.table("logs_student").insert(data).execute()
-        
-        fetch_global_stats.clear() # キャッシュクリア
-        return True
-
+        return repo.students.save_days(rows, diffs, is_new_participant=is_new_participant, became_hero=became_hero)
     except Exception as e:
         st.error(f"保存失敗: {e}")
-        return False
+        return None
 
 # ==========================================
 #  4. 画面コンポーネント (ほぼ変更なし)
@@ -238,75 +164,44 @@ def show_footer():
 # --- 🎮 激闘！分別マスター（Supabase対応版） ---
 def show_sorting_game():
     
-    # 📁 設定 (JSONファイル廃止 -> DBへ)
-    FILES = {"correct": "correct.mp3", "wrong": "wrong.mp3", "clear": "clear.mp3"}
-
-    # --- 音声再生関数 (変更なし) ---
-    def get_audio_html(filename, loop=False, volume=1.0, element_id=None):
-        file_path = os.path.abspath(filename)
-        if not os.path.exists(file_path): return ""
-        try:
-            with open(file_path, "rb") as f:
-                data = f.read()
-            b64 = base64.b64encode(data).decode()
-            mime_type = "audio/mpeg"
-        except: return ""
-        if element_id is None: element_id = f"audio_{random.randint(0, 1000000)}"
-        return f"""<div style="width:0; height:0; overflow:hidden;"><audio id="{element_id}" {'loop' if loop else ''} autoplay><source src="data:{mime_type};base64,{b64}" type="audio/mp3"></audio></div>"""
-
-    # --- 🛠️ ゲームデータ保存・読込 (Supabase) ---
+    # --- 🛠️ ゲームデータ保存・読込 (repository.py) ---
     def save_game_log(name, school, score_time):
-        if not supabase: return
+        """保存できなければエラー内容を返す（終了画面で出す）"""
         try:
-            today_str = datetime.date.today().isoformat()
-            data = {
-                "name": name,
-                "school": school,
-                "time": score_time,
-                "date": today_str
-            }
-            supabase.table("game_scores").insert(data).execute()
+            repo.games.save_score(name, school, score_time)
         except Exception as e:
-            print(f"Game save error: {e}")
+            return str(e)
+        return None
 
     def get_game_rankings(mode="all"):
-        if not supabase: return []
-        try:
-            today_str = datetime.date.today().isoformat()
-            query = supabase.table("game_scores").select("*")
-            
-            if mode == "daily":
-                query = query.eq("date", today_str)
-            
-            response = query.order("time", desc=False).limit(20).execute() # タイムが短い順
-            return response.data # リスト形式
-        except:
-            return []
+        # DB ではなくプロセス共通のランキング（メモリ）から読む
+        return repo.games.rankings(mode, n=20)
 
     # --- 🛠️ 自己ベスト ---
     def get_personal_best():
         info = st.session_state.get('user_info', {})
         name = info.get('name')
         school = info.get('school')
-        if not name or not supabase: return None
-        
-        try:
-            # 自分の記録の中で最速を取得
-            response = supabase.table("game_scores")\
-                .select("time")\
-                .eq("name", name)\
-                .eq("school", school)\
-                .order("time", desc=False)\
-                .limit(1)\
-                .execute()
-            if response.data:
-                return response.data[0]['time']
-            return None
-        except:
-            return None
+        if not name or not repo.connected: return None
+
+        # 1回取得したらセッション内で使い回す（更新は save 時にローカルで）
+        cached = st.session_state.get('personal_best')
+        if cached and cached['key'] == (name, school):
+            return cached['time']
+
+        best = repo.games.personal_best(name, school)
+        st.session_state.personal_best = {'key': (name, school), 'time': best}
+        return best
+
+    def update_personal_best(name, school, score_time):
+        # DB 側はトリガーで更新されるので、セッション内の値だけ合わせる
+        cached = st.session_state.get('personal_best')
+        if cached and cached['key'] == (name, school) and cached['time'] is not None and cached['time'] <= score_time:
+            return
+        st.session_state.personal_best = {'key': (name, school), 'time': score_time}
 
     # --- 🎨 デザインCSS (変更なし) ---
-    st.markdown("""<style>.game-header { background-color:#FFF3E0; padding:15px; border-radius:15px; border:3px solid #FF9800; text-align:center; margin-bottom:10px; } .question-box { text-align:center; padding:20px; background-color:#FFFFFF; border-radius:15px; margin:20px 0; border:4px solid #607D8B; box-shadow: 0 4px 6px rgba(0,0,0,0.1); min-height: 120px; display: flex; align-items: center; justify-content: center; } .feedback-overlay { position: fixed; top: 50%; left: 50%; transform: translate(-50%, -50%); z-index: 9999; padding: 30px; border-radius: 20px; text-align: center; width: 80%; max-width: 350px; box-shadow: 0 10px 25px rgba(0,0,0,0.3); background-color: white; animation: popIn 0.2s ease-out; } @keyframes popIn { 0% { transform: translate(-50%, -50%) scale(0.5); opacity: 0; } 100% { transform: translate(-50%, -50%) scale(1); opacity: 1; } } .personal-best { text-align: right; font-size: 14px; color: #555; background-color: #f0f2f6; padding: 5px 10px; border-radius: 5px; margin-top: 5px; }</style>""", unsafe_allow_html=True)
+    st.markdown("""<style>.game-header { background-color:#FFF3E0; padding:15px; border-radius:15px; border:3px solid #FF9800; text-align:center; margin-bottom:10px; } .personal-best { text-align: right; font-size: 14px; color: #555; background-color: #f0f2f6; padding: 5px 10px; border-radius: 5px; margin-top: 5px; }</style>""", unsafe_allow_html=True)
 
     # --- ゲームデータ定義 (変更なし) ---
     garbage_data = [
@@ -326,10 +221,10 @@ def show_sorting_game():
     categories = {0: {"name": "🔥 燃える", "color": "primary"}, 1: {"name": "♻️ 資 源", "color": "primary"}, 2: {"name": "🧱 埋 立", "color": "secondary"}}
 
     # --- ステート管理 ---
+    # 1問ごとの rerun はせず、ゲームはブラウザ内（components/sorting_game）で進む
     if 'game_state' not in st.session_state: st.session_state.game_state = 'READY'
     if 'penalty_time' not in st.session_state: st.session_state.penalty_time = 0
-    if 'feedback_mode' not in st.session_state: st.session_state.feedback_mode = False
-    if 'feedback_result' not in st.session_state: st.session_state.feedback_result = None
+    if 'sorting_game' not in st.session_state: st.session_state.sorting_game = new_game(garbage_data, 10)
 
     # ヘッダー & 自己ベスト
     st.markdown("""<div class="game-header"><div style="font-size:22px; font-weight:bold; color:#E65100;">⏱️ 激闘！分別マスター</div><div style="font-size:14px; color:#333;">10問タイムアタック / <span style="color:red; font-weight:bold;">ミス ＋5秒</span></div></div>""", unsafe_allow_html=True)
@@ -339,16 +234,23 @@ def show_sorting_game():
 
     # --- ゲーム進行 ---
     if st.session_state.game_state == 'READY':
-        col1, col2 = st.columns([2, 1])
-        with col1: st.info("👇 **スタート** を押してゲーム開始！")
-        with col2:
-            if st.button("🏁 スタート！", use_container_width=True, type="primary"):
-                st.session_state.current_questions = random.sample(garbage_data, 10)
-                st.session_state.q_index = 0
-                st.session_state.start_time = time.time()
-                st.session_state.penalty_time = 0
-                st.session_state.feedback_mode = False
-                st.session_state.game_state = 'PLAYING'
+        game = st.session_state.sorting_game
+        result = sorting_game(game, categories, penalty_sec=5, sounds=sound_urls())
+
+        # 全問終わると結果が1回だけ届く → サーバー側で検証して保存
+        if result is not None:
+            score = score_result(result, game, categories, penalty_sec=5)
+            if score is None:
+                st.warning("記録を確認できませんでした。もういちど遊んでね！")
+                st.session_state.sorting_game = new_game(garbage_data, 10)
+                if st.button("もういちど遊ぶ", type="primary", use_container_width=True): st.rerun()
+            else:
+                st.session_state.final_time = score["time"]
+                st.session_state.penalty_time = score["penalty"]
+                name, school = st.session_state.user_info.get('name', 'ゲスト'), st.session_state.user_info.get('school', '体験入学校')
+                st.session_state.game_save_error = save_game_log(name, school, st.session_state.final_time)
+                update_personal_best(name, school, st.session_state.final_time)
+                st.session_state.game_state = 'FINISHED'
                 st.rerun()
 
         st.write("")
@@ -367,64 +269,18 @@ def show_sorting_game():
                 for i, r in enumerate(all_ranks[:10]):
                     st.markdown(f"**{i+1}位**：`{r['time']}秒` ({r['name']} / {r['school']})")
 
-    elif st.session_state.game_state == 'PLAYING':
-        q_idx = st.session_state.q_index
-        total_q = len(st.session_state.current_questions)
-        if q_idx >= total_q:
-            st.session_state.game_state = 'FINISHED'
-            st.rerun()
-
-        target_item = st.session_state.current_questions[q_idx]
-        st.progress((q_idx / total_q), text=f"第 {q_idx + 1} 問 / 全 {total_q} 問")
-        st.markdown(f"""<div class="question-box"><div style="font-size:32px; font-weight:bold; color:#333;">{target_item['name']}</div></div>""", unsafe_allow_html=True)
-        st.caption("このゴミはどれ？ 👇")
-
-        c1, c2, c3 = st.columns(3)
-        def handle_answer(choice):
-            correct = st.session_state.current_questions[q_idx]['type']
-            if choice == correct: st.session_state.feedback_result = 'correct'
-            else:
-                st.session_state.feedback_result = 'wrong'
-                st.session_state.penalty_time += 5
-            st.session_state.feedback_mode = True
-
-        disable_btn = st.session_state.feedback_mode
-        with c1: 
-            if st.button(categories[0]['name'], key=f"btn_{q_idx}_0", type=categories[0]['color'], use_container_width=True, disabled=disable_btn): handle_answer(0); st.rerun()
-        with c2: 
-            if st.button(categories[1]['name'], key=f"btn_{q_idx}_1", type=categories[1]['color'], use_container_width=True, disabled=disable_btn): handle_answer(1); st.rerun()
-        with c3: 
-            if st.button(categories[2]['name'], key=f"btn_{q_idx}_2", type=categories[2]['color'], use_container_width=True, disabled=disable_btn): handle_answer(2); st.rerun()
-
-        if st.session_state.feedback_mode:
-            if st.session_state.feedback_result == 'correct':
-                st.markdown("""<div class="feedback-overlay" style="border:5px solid #4CAF50; background-color:#E8F5E9;"><h1 style="color:#2E7D32; font-size:80px; margin:0;">⭕️</h1><h2 style="color:#2E7D32; margin:0;">せいかい！</h2></div>""", unsafe_allow_html=True)
-                st.markdown(get_audio_html(FILES["correct"]), unsafe_allow_html=True)
-            else:
-                st.markdown("""<div class="feedback-overlay" style="border:5px solid #D32F2F; background-color:#FFEBEE;"><h1 style="color:#D32F2F; font-size:80px; margin:0;">❌</h1><h2 style="color:#D32F2F; margin:0;">ちがうよ！</h2><p style="font-weight:bold; color:red; font-size:20px;">+5秒</p></div>""", unsafe_allow_html=True)
-                st.markdown(get_audio_html(FILES["wrong"]), unsafe_allow_html=True)
-
-            time.sleep(1)
-            st.session_state.start_time += 1.0 # 演出時間補正
-            st.session_state.feedback_mode = False
-            
-            if st.session_state.q_index + 1 >= len(st.session_state.current_questions):
-                st.session_state.final_time = round(time.time() - st.session_state.start_time + st.session_state.penalty_time, 2)
-                name, school = st.session_state.user_info.get('name', 'ゲスト'), st.session_state.user_info.get('school', '体験入学校')
-                save_game_log(name, school, st.session_state.final_time)
-                st.session_state.game_state = 'FINISHED'
-            else:
-                st.session_state.q_index += 1
-            st.rerun()
-
     elif st.session_state.game_state == 'FINISHED':
-        st.markdown(get_audio_html(FILES["clear"]), unsafe_allow_html=True)
         st.balloons()
         my_time = st.session_state.final_time
         name = st.session_state.user_info.get('name', 'ゲスト')
-        st.markdown(f"""<div style="text-align:center; padding:20px; background-color:white; border-radius:15px; border:2px solid #eee;"><h2 style="color:#E91E63; margin:0;">🎉 ゲームクリア！</h2><div style="font-size:50px; font-weight:bold; color:#333; margin:10px 0;">{my_time} <span style="font-size:20px;">秒</span></div><div style="color:red; font-size:14px; margin-bottom:15px;">(ペナルティ +{st.session_state.penalty_time}秒 含む)</div><div style="background-color:#E3F2FD; padding:10px; border-radius:10px; color:#0D47A1; margin-bottom:10px;"><strong>{name}</strong> さん<br>記録を保存しました！💾</div></div>""", unsafe_allow_html=True)
+        save_error = st.session_state.get('game_save_error')
+        saved_msg = "記録を保存できませんでした 😢" if save_error else "記録を保存しました！💾"
+        st.markdown(f"""<div style="text-align:center; padding:20px; background-color:white; border-radius:15px; border:2px solid #eee;"><h2 style="color:#E91E63; margin:0;">🎉 ゲームクリア！</h2><div style="font-size:50px; font-weight:bold; color:#333; margin:10px 0;">{my_time} <span style="font-size:20px;">秒</span></div><div style="color:red; font-size:14px; margin-bottom:15px;">(ペナルティ +{st.session_state.penalty_time}秒 含む)</div><div style="background-color:#E3F2FD; padding:10px; border-radius:10px; color:#0D47A1; margin-bottom:10px;"><strong>{name}</strong> さん<br>{saved_msg}</div></div>""", unsafe_allow_html=True)
+        if save_error:
+            st.error(f"記録の保存エラー: {save_error}")
         st.write("") 
         if st.button("もういちど遊ぶ", type="primary", use_container_width=True):
+            st.session_state.sorting_game = new_game(garbage_data, 10)
             st.session_state.game_state = 'READY'
             st.rerun()
 
@@ -445,7 +301,7 @@ def login_screen():
 
     # 統計情報（Supabaseから取得）
     if HAS_PANDAS:
-        g_co2, g_heroes, g_participants = fetch_global_stats()
+        (g_co2, g_heroes, g_participants), _ = fetch_global_stats()
         
         st.markdown(f"""<div class="special-hero-stats"><div class="special-hero-label">👑 現在の 認定エコヒーロー</div><p class="special-hero-num">{g_heroes:,}<span class="special-hero-unit">人</span></p></div>""", unsafe_allow_html=True)
         
@@ -479,15 +335,17 @@ def login_screen():
 
             with st.spinner("データを読み込んでいます..."):
                 full_school_name = f"{school_core}小学校"
-                user_id, saved_name, total, history_dict = fetch_user_data(full_school_name, grade, u_class, number)
-                final_name = saved_name if saved_name else nickname_input
+                user_id, profile = fetch_user_data(full_school_name, grade, u_class, number)
+                if profile is None: return
+                final_name = profile.nickname if profile.nickname else nickname_input
                 
                 st.session_state.user_info = {
                     'id': user_id,
                     'name': final_name,
-                    'total_co2': total,
+                    'total_co2': profile.total,
                     'school': full_school_name,
-                    'history_dict': history_dict
+                    'is_hero': profile.is_hero,
+                    'history_dict': profile.history  # None ならチェック表を出すときに読む
                 }
                 st.rerun()
 
@@ -498,11 +356,7 @@ def main_screen():
     user = st.session_state.user_info
     
     # ヒーロー認定判定
-    is_eco_hero = False
-    for actions in user['history_dict'].values():
-        if "環境の日アンケート" in actions:
-            is_eco_hero = True
-            break
+    is_eco_hero = user['is_hero']
     
     st.markdown("### 🍑 おかやまデコ活チャレンジ")
     st.markdown(f"**👋 こんにちは、{user['name']} さん！**")
@@ -553,14 +407,11 @@ def main_screen():
         categories = list(action_master.keys())
         
         # データフレーム作成
-        df_data = {date: [False]*len(categories) for date in target_dates}
-        history = user.get('history_dict', {})
-        
-        for date_col in target_dates:
-            if date_col in history:
-                done_actions = history[date_col]
-                for i, key in enumerate(categories):
-                    if key in done_actions: df_data[date_col][i] = True
+        history = fetch_user_history(user)
+        # 履歴が読めないまま保存すると、既存の人を新規参加者として数えてしまうので保存させない
+        history_ok = history is not None
+        history = history or {}
+        df_data = build_student_grid(history, categories, target_dates)
 
         display_labels = [action_master[k]["short"] for k in categories]
         df = pd.DataFrame(df_data, index=display_labels)
@@ -579,11 +430,12 @@ def main_screen():
         with st.expander("❓ アクションの 詳しい例を みる"):
             for k, v in action_master.items(): st.markdown(f"**{v['label']}**\n👉 {v['help']}")
 
-        if st.button("✅ チェックした 内容（ないよう）を ほぞん する", type="primary"):
+        if st.button("✅ チェックした 内容（ないよう）を ほぞん する", type="primary", disabled=not history_ok):
             with st.spinner("記録しています..."):
-                save_count = 0
                 total_new_points_session = 0
                 current_history = history.copy()
+                rows_to_save = []
+                diffs = []
 
                 for date_col in target_dates:
                     current_checks = edited_df[date_col]
@@ -602,26 +454,32 @@ def main_screen():
                         prev_points = sum([action_master[a]["point"] for a in prev_actions if a in action_master])
                         diff_points = day_points - prev_points
                         
-                        save_daily_challenge(user['id'], user['name'], date_col, actions_to_save, diff_points, "一括更新")
+                        rows_to_save.append(build_student_row(user['id'], date_col, actions_to_save, day_points, "一括更新", nickname=user['name']))
+                        diffs.append(diff_points)
                         total_new_points_session += diff_points
-                        save_count += 1
                         current_history[date_col] = actions_to_save
                 
-                if save_count > 0:
+                # 変更のあった日をまとめて1回で保存
+                # 初めての保存なら新規参加者、アンケートが初めて入ればヒーロー
+                is_new = not history
+                became_hero = not is_eco_hero and any(is_hero_row(r) for r in rows_to_save)
+
+                if not rows_to_save:
+                    st.info("変更はありませんでした。")
+                elif save_daily_challenges(rows_to_save, diffs, is_new_participant=is_new, became_hero=became_hero):
                     st.session_state.user_info['history_dict'] = current_history
+                    st.session_state.user_info['is_hero'] = is_eco_hero or became_hero
                     st.session_state.user_info['total_co2'] += total_new_points_session
                     st.success(f"{random.choice(OKAYAMA_PRAISE_LIST)}\n（ポイント変動: {total_new_points_session}g）")
                     st.balloons()
                     time.sleep(3)
                     st.rerun()
-                else:
-                    st.info("変更はありませんでした。")
 
     st.markdown("---")
     
     # 6/5, 6/6の特別ミッション（ロジックは前回と同じため省略なしで実装）
     # ... (環境の日アンケート、デコ活宣言のロジックはそのまま維持) ...
-    # ※長くなるので省略していますが、元のコードの logic をそのまま save_daily_challenge に置き換えれば動きます
+    # ※実装するときは、チェック表と同じく build_student_row の行と差分を save_daily_challenges に渡す
 
     show_event_promo()
     if st.button("ログアウト", key="logout"):
@@ -636,7 +494,9 @@ if 'user_info' not in st.session_state:
     st.session_state.user_info = None
 
 if __name__ == "__main__":
-    if st.session_state.user_info is None:
-        login_screen()
-    else:
-        main_screen()
+    metrics_gate()
+    with track_run("visitor"), profile_run("visitor"):
+        if st.session_state.user_info is None:
+            login_screen()
+        else:
+            main_screen()